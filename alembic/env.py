@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -7,9 +8,13 @@ from alembic import context
 
 from sqlmodel import SQLModel
 
+import models  # noqa: F401  registers the tables in SQLModel.metadata
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
+# Same database as the application when DATABASE_URL is set
+config.set_main_option("sqlalchemy.url", os.getenv("DATABASE_URL", config.get_main_option("sqlalchemy.url")))
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
@@ -0,0 +1,43 @@
+"""create orders table
+
+Revision ID: 3f1c2a9d8b7e
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+import sqlmodel
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9d8b7e'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'orders',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('email', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('product', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_orders_order_id'), 'orders', ['order_id'], unique=True)
+    op.create_index(op.f('ix_orders_email'), 'orders', ['email'], unique=False)
+    op.create_index(op.f('ix_orders_created_at'), 'orders', ['created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_orders_created_at'), table_name='orders')
+    op.drop_index(op.f('ix_orders_email'), table_name='orders')
+    op.drop_index(op.f('ix_orders_order_id'), table_name='orders')
+    op.drop_table('orders')
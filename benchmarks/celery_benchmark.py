@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_fake_provider
+
+use_fake_provider()
+# In-process broker and backend, so the benchmark runs without redis
+os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+os.environ.setdefault("CELERY_RESULT_BACKEND", "cache+memory://")
+
+from celery import group  # noqa: E402
+from celery.contrib.testing.worker import start_worker  # noqa: E402
+
+import llm_utils  # noqa: E402
+from tasks import app, bulk_generate, generate_personalized_data  # noqa: E402
+
+# Prompts per second of the Celery text jobs against the Bedrock stand-in: one task per prompt
+# versus bulk_generate chunks, optionally with the fake throttling above --max-rps.
+# Usage: FAKE_BEDROCK_LATENCY_MS=300 python -m benchmarks.celery_benchmark --prompts 200 --chunk-size 10 50 --max-rps 100
+
+
+def run(name: str, submit, prompts: int, timeout: float):
+    throttled = getattr(llm_utils.bedrock, "throttled", 0)
+    start = time.perf_counter()
+    answers = submit().get(timeout=timeout)
+    elapsed = time.perf_counter() - start
+    throttled = getattr(llm_utils.bedrock, "throttled", 0) - throttled
+    assert len(answers) == prompts, f"{len(answers)} answers for {prompts} prompts"
+    print(f"{name:<28} prompts={prompts:<6} seconds={elapsed:<8.2f} prompts/s={prompts / elapsed:<8.1f} throttled_calls={throttled}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput of the Celery LLM jobs, one task per prompt and chunked")
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--concurrency", type=int, default=8, help="Worker threads consuming the text queue")
+    parser.add_argument("--max-rps", type=float, default=0, help="Fake Bedrock quota, the calls above it are throttled. 0 = unlimited")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    if app.conf.broker_url.startswith("memory"):
+        # The memory transport polls its queues every second by default, redis doesn't poll
+        app.conf.broker_transport_options = {"polling_interval": 0.01}
+    if hasattr(llm_utils.bedrock, "max_rps"):
+        llm_utils.bedrock.max_rps = args.max_rps
+    print(f"Broker {app.conf.broker_url}, {args.concurrency} worker threads, max_rps={args.max_rps or 'unlimited'}")
+    with start_worker(app, pool="threads", concurrency=args.concurrency, queues=["text"], perform_ping_check=False, shutdown_timeout=30):
+        # New prompts in every run, none of them is answered from a previous one
+        prompts = [f"Write a short tip number {i} for a student. Run {uuid.uuid4()}" for i in range(args.prompts)]
+        run("one task per prompt", lambda: group(generate_personalized_data.s(prompt) for prompt in prompts).apply_async(), args.prompts, args.timeout)
+        for chunk_size in args.chunk_size:
+            prompts = [f"Write a short tip number {i} for a student. Run {uuid.uuid4()}" for i in range(args.prompts)]
+            run(f"bulk chunks of {chunk_size}", lambda: bulk_generate(prompts, chunk_size=chunk_size), args.prompts, args.timeout)
@@ -0,0 +1,96 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_fake_provider, summarize, print_report
+
+use_fake_provider()
+# Local stores, so the API starts without the docker services
+BENCH_DIR = tempfile.mkdtemp(prefix="chat_bench_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{BENCH_DIR}/bench.sqlite3")
+os.environ.setdefault("CHECKPOINT_URL", f"sqlite:///{BENCH_DIR}/checkpoints.sqlite3")
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+from benchmarks.retail_benchmark import TURNS as RETAIL_TURNS, load_retail_data  # noqa: E402
+
+# Turn latency of the FastAPI chat endpoints with many concurrent sessions. Each session sends
+# its turns one after the other, like a user waiting for every answer, against the Bedrock stand-in.
+# Usage: FAKE_BEDROCK_LATENCY_MS=300 CHROMA_PATH=/tmp/chromadb python -m benchmarks.chat_load_benchmark --sessions 10 50 200
+
+TURNS = {
+    "retail": RETAIL_TURNS,
+    "proptech": [
+        "Hola, la propiedad 123 esta disponible?",
+        "Que horarios hay para visitarla?",
+        "Quiero agendar la visita el lunes a las 10am",
+    ],
+}
+
+
+def start_api(port: int) -> uvicorn.Server:
+    """Serve main.app in a background thread, like `uvicorn main:app`."""
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_session(client: httpx.AsyncClient, agent: str, turns: int, latencies: list, errors: list):
+    session_id = None
+    for turn in range(turns):
+        start = time.perf_counter()
+        try:
+            response = await client.post(f"/chat/{agent}", json={"message": TURNS[agent][turn % len(TURNS[agent])], "session_id": session_id})
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            return
+        if response.status_code != 200:
+            errors.append(response.status_code)
+            return
+        latencies.append(time.perf_counter() - start)
+        session_id = response.json()["session_id"]
+
+
+async def run_level(url: str, agent: str, sessions: int, turns: int):
+    latencies, errors = [], []
+    # Idle connections expire before uvicorn's 5s keep-alive, a closed connection is never reused
+    limits = httpx.Limits(max_connections=sessions, max_keepalive_connections=sessions, keepalive_expiry=2)
+    async with httpx.AsyncClient(base_url=url, timeout=600, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(run_session(client, agent, turns, latencies, errors) for _ in range(sessions)))
+        elapsed = time.perf_counter() - start
+    return summarize(latencies, elapsed), errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="p50/p95/p99 turn latency of the chat endpoints with concurrent sessions")
+    parser.add_argument("--agent", default="retail", choices=sorted(TURNS))
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--turns", type=int, default=3, help="Turns per session")
+    parser.add_argument("--url", help="Running API to test, e.g. http://localhost:8080. By default the API is started in-process")
+    parser.add_argument("--port", type=int, default=8181)
+    args = parser.parse_args()
+
+    url = args.url
+    if not url:
+        load_retail_data()
+        start_api(args.port)
+        url = f"http://127.0.0.1:{args.port}"
+    print(f"Chat {args.agent} at {url}")
+    for sessions in args.sessions:
+        result, errors = asyncio.run(run_level(url, args.agent, sessions, args.turns))
+        print_report(f"{args.agent} {sessions} sessions", result)
+        if errors:
+            print(f"{'':<28} failed sessions={len(errors)} errors={sorted(set(map(str, errors)))}")
+    print(httpx.get(f"{url}/metrics/chat").json())
@@ -0,0 +1,55 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_rules.json")
+
+
+def use_fake_provider():
+    """Point llm_utils to the local Bedrock stand-in unless another provider was configured.
+    Must be called before importing llm_utils or any vertical."""
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    os.environ.setdefault("FAKE_BEDROCK_RULES", RULES_PATH)
+    # ChatBedrock validates that a region is configured even when it gets a client
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of a list of values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(latencies: List[float], elapsed: float) -> Dict[str, float]:
+    """Throughput and latency percentiles (in milliseconds) of a run."""
+    return {
+        "requests": len(latencies),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def run_load(func: Callable[[int], object], requests: int, concurrency: int) -> Dict[str, float]:
+    """Call func(i) `requests` times using `concurrency` threads and summarize the latencies."""
+    def timed(i):
+        start = time.perf_counter()
+        func(i)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, range(requests)))
+    return summarize(latencies, time.perf_counter() - start)
+
+
+def print_report(name: str, result: Dict[str, float]):
+    print(
+        f"{name:<28} requests={result['requests']:<6} rps={result['throughput_rps']:<8.1f} "
+        f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms p99={result['p99_ms']:.1f}ms"
+    )
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_fake_provider, run_load, print_report
+
+use_fake_provider()
+
+import pandas as pd  # noqa: E402
+import llm_utils  # noqa: E402
+
+# Offline throughput and latency benchmark of the LLM calls made by every vertical.
+# Usage: FAKE_BEDROCK_LATENCY_MS=300 python -m benchmarks.llm_benchmark --requests 200 --concurrency 20
+
+CREDIT_QUERIES = [
+    "Tasa de interes del credito",
+    "Monto, cupo o limite de credito",
+    "Plazo maximo de pago o cuotas maximas de pago",
+    "Seguro en caso de muerte, incapacidad o desempleo",
+]
+
+
+def fintech_call(i):
+    query = CREDIT_QUERIES[i % len(CREDIT_QUERIES)]
+    return llm_utils.call_llm(f"Act as a financial advisor. Rewrite the query to be more specific: {query}")
+
+
+COMMENTS = pd.read_csv("./foodtech/restaurantdata.csv")["comment"].to_list()
+
+
+def foodtech_call(i):
+    comment = COMMENTS[i % len(COMMENTS)]
+    return json.loads(llm_utils.call_llm(
+        f"Analyze the following user comment for a restaurant: {comment} "
+        "Extract general_satisfied, like_food, like_service, like_ambiance, like_price, like_location as JSON."
+    ))
+
+
+def edtech_call(i):
+    return llm_utils.call_llm_to_generate_image(f"Educational illustration number {i}")
+
+
+def retail_call(i):
+    from langchain_core.messages import HumanMessage
+    from retail.multiagent import graph_builder
+    return graph_builder.invoke(
+        {"messages": [HumanMessage(content="Hi, what cars do you sell?")]},
+        config={"configurable": {"thread_id": f"bench-{i}"}}
+    )
+
+
+def proptech_call(i):
+    from langchain_core.messages import HumanMessage
+    from proptech.proptech_agent import graph_builder
+    return graph_builder.invoke(
+        {"messages": [HumanMessage(content="Hola, quiero informacion de la propiedad 123")]},
+        config={"configurable": {"thread_id": f"bench-{i}"}}
+    )
+
+
+VERTICALS = {
+    "fintech": fintech_call,
+    "foodtech": foodtech_call,
+    "edtech": edtech_call,
+    "retail": retail_call,
+    "proptech": proptech_call,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the verticals against the configured LLM provider")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--verticals", nargs="+", default=list(VERTICALS), choices=list(VERTICALS))
+    args = parser.parse_args()
+
+    print(f"Provider: {llm_utils.LLM_PROVIDER}")
+    for name in args.verticals:
+        print_report(name, run_load(VERTICALS[name], args.requests, args.concurrency))
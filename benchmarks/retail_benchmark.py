@@ -0,0 +1,89 @@
+import argparse
+import json
+import os
+import sys
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_fake_provider, run_load, print_report
+
+use_fake_provider()
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+
+import llm_utils  # noqa: E402
+import prompt_cache  # noqa: E402
+from retail import multiagent  # noqa: E402
+from vector_ingest import sync_documents  # noqa: E402
+from vector_store import get_collection  # noqa: E402
+
+# Per-turn latency, LLM calls and tokens of the retail multiagent, with the tools answering
+# through a third LLM call ("llm") or through the templates ("template"), with and without prompt caching.
+# Usage: FAKE_BEDROCK_LATENCY_MS=300 CHROMA_PATH=/tmp/chromadb python -m benchmarks.retail_benchmark
+#        FAKE_BEDROCK_MS_PER_INPUT_TOKEN=0.2 python -m benchmarks.retail_benchmark --modes template --prompt-cache off on
+
+# The routing and the tool calls of these turns are set in fake_rules.json
+TURNS = [
+    "Can you recommend a car for family trips and off-road adventures?",
+    "Tell me the details of the Luxury Sedan X500",
+    "What do customers say about the Adventure SUV Pro?",
+]
+
+
+def load_retail_data():
+    """Same collections the retail chat saves, synced so reruns don't embed anything again."""
+    with open("./retail/catalog.json", "r") as file:
+        products = json.load(file)["products"]
+    sync_documents(
+        get_collection("collection_catalog"),
+        documents=[json.dumps(product) for product in products],
+        metadatas=[{"product_id": product["product_id"]} for product in products],
+        source="catalog.json"
+    )
+    with open("./retail/reviews.json", "r") as file:
+        reviews = json.load(file)["reviews"]
+    sync_documents(
+        get_collection("collection_reviews"),
+        documents=[json.dumps(review) for review in reviews],
+        metadatas=[{"product_id": review["product_id"]} for review in reviews],
+        source="reviews.json"
+    )
+
+
+def retail_turn(i):
+    return multiagent.graph_builder.invoke(
+        {"messages": [HumanMessage(content=TURNS[i % len(TURNS)])]},
+        # A new conversation per turn, reruns don't grow the history of the same threads
+        config={"configurable": {"thread_id": f"bench-{uuid.uuid4()}"}}
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the retail tool answers rendered by the LLM and by templates")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--modes", nargs="+", default=["llm", "template"], choices=["llm", "template"])
+    parser.add_argument("--prompt-cache", nargs="+", default=["off"], choices=["off", "on"])
+    args = parser.parse_args()
+
+    load_retail_data()
+    # Call and token counters are only available with the in-process fake
+    stats = llm_utils.bedrock if hasattr(llm_utils.bedrock, "reset_stats") else None
+    print(f"Provider: {llm_utils.LLM_PROVIDER}")
+    for mode in args.modes:
+        for cache in args.prompt_cache:
+            multiagent.RETAIL_RESPONSE_MODE = mode
+            # Read on every call, the cache points are added from the next request on
+            prompt_cache.PROMPT_CACHE_ENABLED = cache == "on"
+            if stats:
+                stats.reset_stats()
+            print_report(f"retail ({mode}, cache {cache})", run_load(retail_turn, args.requests, args.concurrency))
+            if stats:
+                print(
+                    f"{'':<28} llm_calls/turn={stats.total_calls() / args.requests:.2f} "
+                    f"input_tokens/turn={stats.tokens['input_tokens'] / args.requests:.0f} "
+                    f"cache_read_tokens/turn={stats.tokens['cache_read_input_tokens'] / args.requests:.0f} "
+                    f"cache_write_tokens/turn={stats.tokens['cache_creation_input_tokens'] / args.requests:.0f} "
+                    f"output_tokens/turn={stats.tokens['output_tokens'] / args.requests:.0f}"
+                )
@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import use_fake_provider
+
+use_fake_provider()
+# Silent voice-overs instead of Google Text-to-Speech
+os.environ.setdefault("TTS_PROVIDER", "fake")
+# Empty asset cache for every run of the benchmark
+os.environ.setdefault("EDTECH_ASSET_CACHE_DIR", tempfile.mkdtemp(prefix="video_bench_cache_"))
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "edtech"))
+
+from asset_cache import asset_cache, get_asset_cache_metrics  # noqa: E402
+from video_pipeline import create_video_from_scenes, generate_copy_for_video, generate_video  # noqa: E402
+
+# Wall-clock time of an educational video (5 scenes from fake_rules.json) with the scenes
+# prepared one at a time and concurrently, without the asset cache. With --cache, re-render time of the
+# same scenes and of the scenes with one script edited.
+# Usage: FAKE_BEDROCK_LATENCY_MS=2000 FAKE_TTS_LATENCY_MS=1000 python -m benchmarks.video_benchmark --cache
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Educational video generation time by number of scene workers")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 5])
+    parser.add_argument("--cache", action="store_true", help="Also measure re-renders with the asset cache")
+    args = parser.parse_args()
+
+    output_dir = tempfile.mkdtemp(prefix="video_bench_")
+    asset_cache.enabled = False
+    for workers in args.workers:
+        start = time.perf_counter()
+        generate_video("The water cycle", "6-12", os.path.join(output_dir, f"video_{workers}.mp4"), workers=workers)
+        print(f"workers={workers:<4} seconds={time.perf_counter() - start:.2f}")
+
+    if args.cache:
+        asset_cache.enabled = True
+        scenes = generate_copy_for_video("The water cycle", "6-12")["scenes"]
+        edited = [dict(scene) for scene in scenes]
+        edited[2]["script"] += " Clouds are made of tiny drops of water."
+        for name, run_scenes in (("cold", scenes), ("unchanged", scenes), ("one scene edited", edited)):
+            start = time.perf_counter()
+            create_video_from_scenes(run_scenes, os.path.join(output_dir, "video_cache.mp4"), age_group="6-12")
+            print(f"cache {name:<18} seconds={time.perf_counter() - start:.2f}")
+        print(get_asset_cache_metrics())
@@ -0,0 +1,224 @@
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from llm_cache import LRUCache
+from prompt_cache import cacheable_system_message
+
+# History manager of the chats: a sliding window of recent messages, older turns rolled into a
+# cached summary, and a token budget for what is sent to the model on every request.
+
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "true").lower() == "true"
+# Messages kept verbatim, the window grows up to HISTORY_WINDOW_MESSAGES + HISTORY_SUMMARY_EVERY
+HISTORY_WINDOW_MESSAGES = int(os.getenv("HISTORY_WINDOW_MESSAGES", "10"))
+# Older messages are summarized in steps of this many, so the summary isn't recomputed every turn
+HISTORY_SUMMARY_EVERY = int(os.getenv("HISTORY_SUMMARY_EVERY", "6"))
+# Maximum tokens of history (summary + window) per request, the current turn is always kept
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "4000"))
+# Summarize the older turns, otherwise they are dropped
+HISTORY_SUMMARIZE = os.getenv("HISTORY_SUMMARIZE", "true").lower() == "true"
+# Stats of the last requests kept for get_history_metrics
+HISTORY_RECENT_REQUESTS = int(os.getenv("HISTORY_RECENT_REQUESTS", "20"))
+
+PROMPT_SUMMARY = """
+Summarize the following conversation between a user and an assistant in a short paragraph.
+Keep every fact the assistant may need later: names, emails, ids, products, properties, dates, quantities and decisions.
+{previous_summary}
+<conversation>
+{conversation}
+</conversation>
+Return only the summary.
+"""
+
+_ROLES = {"system": "system", "human": "user", "ai": "assistant", "tool": "tool"}
+
+
+def count_tokens(text: str) -> int:
+    """Approximate number of tokens of a text (~4 characters per token for Claude)."""
+    return len(text) // 4 + 1 if text else 0
+
+
+def message_role(message: Any) -> str:
+    if isinstance(message, dict):
+        return message.get("role", "user")
+    if isinstance(message, tuple):
+        return {"human": "user", "ai": "assistant"}.get(message[0], message[0])
+    return _ROLES.get(getattr(message, "type", ""), "user")
+
+
+def message_text(message: Any) -> str:
+    if isinstance(message, dict):
+        content = message.get("content", "")
+    elif isinstance(message, tuple):
+        content = message[1]
+    else:
+        content = message.content
+    if isinstance(content, list):
+        return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return str(content)
+
+
+def _default_summarizer(previous_summary: str, conversation: str) -> str:
+    # Imported here, llm_utils uses this module
+    from llm_utils import call_llm
+    previous = f"Summary of the conversation so far: {previous_summary}" if previous_summary else ""
+    prompt = PROMPT_SUMMARY.format(previous_summary=previous, conversation=conversation)
+    return call_llm(prompt, max_tokens=512, temperature=0, use_cache=True)
+
+
+class HistoryManager:
+    """
+    Reduce a conversation to what fits the token budget.
+
+    The last `window` messages are kept as they are. Older messages are summarized in steps of
+    `summary_every` messages; each summary extends the summary of the previous step and is cached,
+    so a long conversation costs one small summarization call every few turns.
+    """
+
+    def __init__(
+        self,
+        window: int = HISTORY_WINDOW_MESSAGES,
+        summary_every: int = HISTORY_SUMMARY_EVERY,
+        token_budget: int = HISTORY_TOKEN_BUDGET,
+        summarize: bool = HISTORY_SUMMARIZE,
+        summarizer: Optional[Callable[[str, str], str]] = None,
+    ):
+        self.window = window
+        self.summary_every = max(1, summary_every)
+        self.token_budget = token_budget
+        self.summarize = summarize
+        self.summarizer = summarizer or _default_summarizer
+        # Summary of a message prefix, keyed by the chained hash of the prefix
+        self.summaries = LRUCache(max_size=10000, ttl=24 * 3600)
+        self._metrics = {"requests": 0, "trimmed_requests": 0, "tokens_before": 0, "tokens_after": 0, "summaries_computed": 0, "summary_cache_hits": 0, "dropped_messages": 0}
+        self._recent: deque = deque(maxlen=HISTORY_RECENT_REQUESTS)
+        self._lock = threading.Lock()
+
+    def _prefix_hashes(self, messages: List[Any]) -> List[str]:
+        # hashes[i] identifies messages[:i + 1], so any already summarized prefix is found in O(n)
+        hashes, digest = [], ""
+        for message in messages:
+            digest = hashlib.sha256(f"{digest}|{message_role(message)}|{message_text(message)}".encode("utf-8")).hexdigest()
+            hashes.append(digest)
+        return hashes
+
+    def _summary(self, older: List[Any]) -> str:
+        if not older:
+            return ""
+        hashes = self._prefix_hashes(older)
+        cached = self.summaries.get(hashes[-1])
+        if cached is not None:
+            self._record(summary_cache_hits=1)
+            return cached
+        # Extend the summary of the longest prefix summarized before
+        start, previous_summary = 0, ""
+        for index in range(len(hashes) - 2, -1, -1):
+            previous = self.summaries.get(hashes[index])
+            if previous is not None:
+                start, previous_summary = index + 1, previous
+                break
+        conversation = "\n".join(f"{message_role(message)}: {message_text(message)}" for message in older[start:])
+        try:
+            summary = self.summarizer(previous_summary, conversation)
+        except Exception as e:
+            # Without a summary the older turns are dropped, the chat keeps working
+            print(f"Error summarizing the history: {e}")
+            return ""
+        self.summaries.set(hashes[-1], summary)
+        self._record(summaries_computed=1)
+        return summary
+
+    def _record(self, **counts: int):
+        with self._lock:
+            for key, value in counts.items():
+                self._metrics[key] += value
+
+    def trim(self, messages: List[Any]) -> Tuple[List[Any], str, Dict[str, int]]:
+        """
+        Reduce the history of a request.
+
+        :param messages: The conversation, oldest first. Leading system messages are kept as they are.
+        :return: The messages to send, the summary of the older turns ("" if none) and the stats of the
+            request: tokens_before, tokens_after, tokens_saved and messages_removed (summarized or dropped).
+            The stats of the last requests are also in metrics()["recent_requests"].
+        """
+        system = []
+        while len(system) < len(messages) and message_role(messages[len(system)]) == "system":
+            system.append(messages[len(system)])
+        history = list(messages[len(system):])
+        tokens = [count_tokens(message_text(message)) for message in history]
+        tokens_before = sum(tokens)
+
+        # The window can only start at a user message, never between a tool call and its result
+        starts = [index for index, message in enumerate(history) if message_role(message) == "user"]
+        cut = 0
+        if len(history) > self.window:
+            # Move the cut in steps of summary_every messages, the same prefix is summarized for several turns
+            target = (len(history) - self.window) // self.summary_every * self.summary_every
+            cut = next((index for index in starts if index >= target), 0)
+            if cut >= len(history) - 1:
+                cut = max([index for index in starts if index < len(history) - 1] or [0])
+
+        summary = self._summary(history[:cut]) if (self.summarize and cut) else ""
+        dropped = cut if not summary else 0
+        recent, recent_tokens = history[cut:], tokens[cut:]
+
+        # Enforce the budget dropping whole turns from the start of the window, the last turn stays
+        summary_tokens = count_tokens(summary)
+        while summary_tokens + sum(recent_tokens) > self.token_budget:
+            next_start = next((index for index in range(1, len(recent)) if message_role(recent[index]) == "user"), None)
+            if next_start is None:
+                break
+            dropped += next_start
+            recent, recent_tokens = recent[next_start:], recent_tokens[next_start:]
+
+        tokens_after = summary_tokens + sum(recent_tokens)
+        stats = {
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved": tokens_before - tokens_after,
+            "messages_removed": len(history) - len(recent),
+        }
+        self._record(
+            requests=1,
+            trimmed_requests=int(tokens_after < tokens_before),
+            tokens_before=tokens_before,
+            tokens_after=tokens_after,
+            dropped_messages=dropped,
+        )
+        with self._lock:
+            self._recent.append({"time": time.time(), **stats})
+        return system + recent, summary, stats
+
+    def with_system(self, system_prompt: str, messages: List[Any]) -> List[Any]:
+        """
+        LangChain messages for a chat model: the system prompt with the summary, then the window.
+        The summary goes after the cache point of the prompt, so the static prefix stays cached.
+        """
+        recent, summary, _ = self.trim(messages)
+        summary_text = f"Summary of the earlier conversation:\n{summary}" if summary else ""
+        return [cacheable_system_message(system_prompt, summary_text)] + recent
+
+    def state_modifier(self, system_prompt: str) -> Callable[[Dict[str, Any]], List[Any]]:
+        """state_modifier for create_react_agent, in place of the system prompt string."""
+        def modifier(state: Dict[str, Any]) -> List[Any]:
+            return self.with_system(system_prompt, state["messages"])
+        return modifier
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics: Dict[str, Any] = dict(self._metrics)
+            metrics["recent_requests"] = list(self._recent)
+        metrics["tokens_saved"] = metrics["tokens_before"] - metrics["tokens_after"]
+        metrics["avg_tokens_saved"] = metrics["tokens_saved"] / metrics["requests"] if metrics["requests"] else 0.0
+        return metrics
+
+
+history_manager = HistoryManager() if HISTORY_ENABLED else HistoryManager(window=10 ** 9, token_budget=10 ** 9, summarize=False)
+
+
+def get_history_metrics() -> Dict[str, Any]:
+    return history_manager.metrics()
@@ -0,0 +1,168 @@
+import asyncio
+import importlib
+import os
+import time
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from chat_utils import StreamEvent, astream_graph_response, final_response
+
+# Serving of the chat graphs over FastAPI. Every turn runs with graph.ainvoke/astream on the
+# API event loop, the conversation of each session is kept by the graph checkpointer, and a
+# semaphore bounds the turns in flight so a traffic peak queues instead of exhausting Bedrock.
+
+# Turns running at the same time per process, the rest wait for a slot
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "50"))
+# Seconds a turn waits for a slot before answering 503
+CHAT_QUEUE_TIMEOUT = float(os.getenv("CHAT_QUEUE_TIMEOUT", "30"))
+# Seconds a turn can take before answering 504
+CHAT_TURN_TIMEOUT = float(os.getenv("CHAT_TURN_TIMEOUT", "120"))
+
+# Module of each chat graph, imported on first use, and the nodes left out of the streamed answer
+CHAT_GRAPHS = {
+    "retail": ("retail.multiagent", ["supervisor"]),
+    "proptech": ("proptech.proptech_agent", []),
+}
+
+
+class ChatBusyError(Exception):
+    """No turn slot was released within CHAT_QUEUE_TIMEOUT."""
+
+
+def get_chat_graph(agent: str):
+    """The compiled graph of `agent`. Raises KeyError for unknown agents."""
+    module, _ = CHAT_GRAPHS[agent]
+    return importlib.import_module(module).graph_builder
+
+
+def configure_executor(loop: Optional[asyncio.AbstractEventLoop] = None):
+    """
+    Size the default executor of the event loop for the chat turns. The graph nodes and the
+    checkpointer are blocking, ainvoke runs them there, one thread per turn in flight plus
+    one per checkpoint write.
+    """
+    loop = loop or asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=CHAT_MAX_CONCURRENCY * 2, thread_name_prefix="chat"))
+
+
+_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+# One lock per session, two turns of the same conversation never run at the same time
+_session_locks: "weakref.WeakValueDictionary[Tuple[str, str], asyncio.Lock]" = weakref.WeakValueDictionary()
+_metrics = {"turns": 0, "errors": 0, "rejected": 0, "timeouts": 0, "active": 0, "waiting": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(CHAT_MAX_CONCURRENCY)
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+def _session_lock(agent: str, session_id: str) -> asyncio.Lock:
+    key = (agent, session_id)
+    lock = _session_locks.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _session_locks[key] = lock
+    return lock
+
+
+def _turn_inputs(agent: str, session_id: str, message: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # The checkpointer keeps the history, each turn only sends the new message
+    inputs = {"messages": [HumanMessage(content=message)]}
+    config = {"configurable": {"thread_id": f"{agent}:{session_id}"}}
+    return inputs, config
+
+
+class _TurnSlot:
+    """Session lock + concurrency slot of a turn, with its metrics."""
+
+    def __init__(self, agent: str, session_id: str):
+        self.lock = _session_lock(agent, session_id)
+        self.semaphore = _get_semaphore()
+        self.start = 0.0
+
+    async def __aenter__(self):
+        _metrics["waiting"] += 1
+        try:
+            await self.lock.acquire()
+            try:
+                await asyncio.wait_for(self.semaphore.acquire(), CHAT_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.lock.release()
+                _metrics["rejected"] += 1
+                raise ChatBusyError(f"No chat slot released in {CHAT_QUEUE_TIMEOUT}s")
+        finally:
+            _metrics["waiting"] -= 1
+        _metrics["active"] += 1
+        self.start = time.perf_counter()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _metrics["active"] -= 1
+        self.semaphore.release()
+        self.lock.release()
+        if exc_type is asyncio.TimeoutError:
+            _metrics["timeouts"] += 1
+        elif exc_type is not None:
+            _metrics["errors"] += 1
+        else:
+            _metrics["turns"] += 1
+            _metrics["total_seconds"] += elapsed
+            _metrics["max_seconds"] = max(_metrics["max_seconds"], elapsed)
+        return False
+
+
+async def run_turn(agent: str, message: str, session_id: Optional[str] = None) -> Dict[str, str]:
+    """
+    Run one turn of a chat graph with ainvoke.
+
+    :param agent: "retail" or "proptech".
+    :param message: The user message.
+    :param session_id: The conversation to continue, a new one is started when None.
+    :return: The session_id and the response.
+    """
+    graph = get_chat_graph(agent)
+    session_id = session_id or str(uuid.uuid4())
+    inputs, config = _turn_inputs(agent, session_id, message)
+    async with _TurnSlot(agent, session_id):
+        state = await asyncio.wait_for(graph.ainvoke(inputs, config=config), CHAT_TURN_TIMEOUT)
+    return {"session_id": session_id, "response": final_response(state)}
+
+
+async def stream_turn(agent: str, message: str, session_id: str) -> AsyncIterator[StreamEvent]:
+    """
+    Run one turn of a chat graph with astream and yield the ("text", delta) and ("reset", text)
+    events of the answer as it is generated.
+    The slot is held until the stream is consumed or closed.
+    """
+    graph = get_chat_graph(agent)
+    _, skip_nodes = CHAT_GRAPHS[agent]
+    inputs, config = _turn_inputs(agent, session_id, message)
+    async with _TurnSlot(agent, session_id) as slot:
+        deadline = slot.start + CHAT_TURN_TIMEOUT
+        stream = astream_graph_response(graph, inputs, config=config, skip_nodes=skip_nodes)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(stream.__anext__(), max(0.0, deadline - time.perf_counter()))
+                except StopAsyncIteration:
+                    break
+                yield event
+        finally:
+            # The client disconnected or the turn timed out, stop the graph run
+            await stream.aclose()
+
+
+def get_chat_metrics() -> Dict[str, Any]:
+    metrics: Dict[str, Any] = dict(_metrics)
+    metrics["avg_seconds"] = metrics["total_seconds"] / metrics["turns"] if metrics["turns"] else 0.0
+    metrics["max_concurrency"] = CHAT_MAX_CONCURRENCY
+    return metrics
@@ -0,0 +1,108 @@
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import AIMessageChunk
+
+# Events of a streamed answer: ("text", delta) appends the delta to the answer, ("reset", text)
+# replaces the whole answer shown so far with text
+StreamEvent = Tuple[str, str]
+
+
+def _chunk_text(content: Any) -> str:
+    # Anthropic chunks can carry a string or a list of content blocks
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict) and block.get("type") == "text")
+
+
+class _AnswerStream:
+    """
+    Turns the ("messages", "values") events of a graph run into the events of the answer.
+
+    Text is sent as soon as the model generates it. A message can start with text and then call
+    a tool ("Let me check the catalog..."): when its first tool call chunk arrives, the text of
+    that message is retracted with a "reset" event, so the answer shown ends up equal to
+    final_response.
+    """
+
+    def __init__(self, skip_nodes: Iterable[str] = ()):
+        self.skip_nodes = set(skip_nodes)
+        # Text sent of every message without tool calls, in order, by message id
+        self.texts: Dict[str, List[str]] = {}
+        self.tool_messages = set()
+        self.final_state: Optional[Dict[str, Any]] = None
+
+    def text(self) -> str:
+        return "".join(text for chunks in self.texts.values() for text in chunks)
+
+    def feed(self, mode: str, payload: Any) -> List[StreamEvent]:
+        if mode == "values":
+            self.final_state = payload
+            return []
+        message, metadata = payload
+        if metadata.get("langgraph_node") in self.skip_nodes or not isinstance(message, AIMessageChunk):
+            return []
+        message_id = message.id or metadata.get("langgraph_node", "")
+        if message_id in self.tool_messages:
+            return []
+        if message.tool_call_chunks:
+            self.tool_messages.add(message_id)
+            return [("reset", self.text())] if self.texts.pop(message_id, None) else []
+        text = _chunk_text(message.content)
+        if not text:
+            return []
+        self.texts.setdefault(message_id, []).append(text)
+        return [("text", text)]
+
+    def finish(self) -> List[StreamEvent]:
+        # Nothing was streamed (e.g. a tool answered without an LLM), return the final message at once
+        if not self.text() and self.final_state and self.final_state.get("messages"):
+            return [("text", _chunk_text(self.final_state["messages"][-1].content))]
+        return []
+
+
+def stream_graph_response(graph, inputs: Dict[str, Any], config: Dict[str, Any], skip_nodes: Iterable[str] = ()) -> Iterator[StreamEvent]:
+    """
+    Run a LangGraph graph and yield the answer as the LLMs generate it.
+
+    :param graph: The compiled graph.
+    :param inputs: The graph input, e.g. {"messages": [...]}.
+    :param config: The run config with the thread_id.
+    :param skip_nodes: Nodes whose tokens are not part of the answer, e.g. the supervisor router.
+    :return: An iterator of ("text", delta) and ("reset", text) events, see write_graph_stream.
+    """
+    answer = _AnswerStream(skip_nodes)
+    for mode, payload in graph.stream(inputs, config=config, stream_mode=["messages", "values"]):
+        yield from answer.feed(mode, payload)
+    yield from answer.finish()
+
+
+async def astream_graph_response(graph, inputs: Dict[str, Any], config: Dict[str, Any], skip_nodes: Iterable[str] = ()) -> AsyncIterator[StreamEvent]:
+    """
+    Async version of stream_graph_response, for the FastAPI chat endpoints.
+    """
+    answer = _AnswerStream(skip_nodes)
+    async for mode, payload in graph.astream(inputs, config=config, stream_mode=["messages", "values"]):
+        for event in answer.feed(mode, payload):
+            yield event
+    for event in answer.finish():
+        yield event
+
+
+def write_graph_stream(container, events: Iterable[StreamEvent]) -> str:
+    """
+    Show the events of stream_graph_response in a Streamlit container, e.g. st.chat_message("assistant").
+
+    :return: The final answer.
+    """
+    placeholder = container.empty()
+    text = ""
+    for event, data in events:
+        text = text + data if event == "text" else data
+        placeholder.markdown(text)
+    return text
+
+
+def final_response(state: Dict[str, Any]) -> str:
+    """Text of the last message of a graph state."""
+    messages = state.get("messages") or []
+    return _chunk_text(messages[-1].content) if messages else ""
@@ -1,5 +1,7 @@
-from sqlmodel import Session
-from models import Person
+from typing import List, Optional
+from sqlalchemy import update
+from sqlmodel import Session, select
+from models import Person, Order, Property, PropertySlot
 from fastapi import HTTPException
 from datetime import datetime
 
@@ -29,3 +31,65 @@ def update_person_email(session: Session, person_id: int, email: str):
         session.commit()
         session.refresh(person)
     return person
+
+def create_orders(session: Session, orders: List[Order]):
+    # One transaction for the whole batch
+    session.add_all(orders)
+    session.commit()
+    return orders
+
+def read_order(session: Session, order_id: str):
+    order = session.exec(select(Order).where(Order.order_id == order_id)).first()
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return order
+
+def list_orders(session: Session, email: Optional[str] = None, limit: int = 100, offset: int = 0):
+    statement = select(Order)
+    if email:
+        statement = statement.where(Order.email == email)
+    statement = statement.order_by(Order.created_at.desc()).offset(offset).limit(limit)
+    return session.exec(statement).all()
+
+def existing_order_ids(session: Session, order_ids: List[str]):
+    if not order_ids:
+        return set()
+    return set(session.exec(select(Order.order_id).where(Order.order_id.in_(order_ids))).all())
+
+def create_properties(session: Session, properties: List[Property], slots: List[PropertySlot]):
+    session.add_all(properties)
+    # The slots reference the properties, they are inserted after them
+    session.flush()
+    session.add_all(slots)
+    session.commit()
+    return properties
+
+def read_property(session: Session, property_id: str):
+    return session.exec(select(Property).where(Property.property_id == property_id)).first()
+
+def search_properties(session: Session, city_key: Optional[str] = None, min_price: Optional[float] = None, max_price: Optional[float] = None, status: Optional[str] = "available", limit: int = 20, offset: int = 0):
+    statement = select(Property)
+    if city_key:
+        statement = statement.where(Property.city_key == city_key)
+    if status:
+        statement = statement.where(Property.status == status)
+    if min_price is not None:
+        statement = statement.where(Property.price >= min_price)
+    if max_price is not None:
+        statement = statement.where(Property.price <= max_price)
+    statement = statement.order_by(Property.price, Property.property_id).offset(offset).limit(limit)
+    return session.exec(statement).all()
+
+def list_free_slots(session: Session, property_id: str):
+    statement = select(PropertySlot.slot_time).where(PropertySlot.property_id == property_id, PropertySlot.reserved == False)  # noqa: E712
+    return session.exec(statement.order_by(PropertySlot.slot_time)).all()
+
+def reserve_slot(session: Session, property_id: str, slot_time: datetime) -> bool:
+    # Conditional update: of two concurrent reservations of the same slot only one matches reserved = false
+    result = session.execute(
+        update(PropertySlot)
+        .where(PropertySlot.property_id == property_id, PropertySlot.slot_time == slot_time, PropertySlot.reserved == False)  # noqa: E712
+        .values(reserved=True, reserved_at=datetime.utcnow())
+    )
+    session.commit()
+    return result.rowcount == 1
@@ -1,7 +1,8 @@
+import os
 from sqlmodel import SQLModel, create_engine, Session
 from sqlalchemy.exc import SQLAlchemyError
 
-DATABASE_URL = "postgresql://admin:123asd456@db/testdb"
+DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://admin:123asd456@db/testdb")
 
 engine = create_engine(DATABASE_URL, echo=True)
 
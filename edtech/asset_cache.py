@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from utils import download_file_from_s3, upload_file_to_s3
+
+# Content-addressed cache of the generated assets of the educational videos: scene images,
+# voice-overs and encoded scene segments. The key of an asset is the hash of everything that
+# determines it (prompt, age group, seed, script, language...), so a video re-rendered with one
+# edited scene only generates that scene again. Local files are capped in size with LRU eviction,
+# and can be backed by a bucket shared between machines.
+
+_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+EDTECH_ASSET_CACHE_ENABLED = os.getenv("EDTECH_ASSET_CACHE_ENABLED", "true").lower() == "true"
+EDTECH_ASSET_CACHE_DIR = os.getenv("EDTECH_ASSET_CACHE_DIR", os.path.join(_DIRECTORY, ".asset_cache"))
+# Size of the local cache, the least recently used assets are removed above it
+EDTECH_ASSET_CACHE_MAX_MB = float(os.getenv("EDTECH_ASSET_CACHE_MAX_MB", "500"))
+# Second tier, empty to disable: s3://<bucket>/<prefix>/<kind>/<key><suffix>, uploaded with utils.upload_file_to_s3
+EDTECH_ASSET_CACHE_BUCKET = os.getenv("EDTECH_ASSET_CACHE_BUCKET", "")
+EDTECH_ASSET_CACHE_PREFIX = os.getenv("EDTECH_ASSET_CACHE_PREFIX", "edtech-assets")
+# Local directory standing in for S3 (<dir>/<bucket>/<object_name>), for development and tests
+EDTECH_ASSET_CACHE_S3_LOCAL_DIR = os.getenv("EDTECH_ASSET_CACHE_S3_LOCAL_DIR", "")
+
+
+def asset_key(kind: str, **parts: Any) -> str:
+    """sha256 of the kind and the parts that determine the asset."""
+    payload = json.dumps({"kind": kind, **parts}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _link_or_copy(src: str, dest: str):
+    # A hard link costs nothing and survives the eviction of the cache file
+    if os.path.exists(dest):
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copyfile(src, dest)
+
+
+class S3AssetTier:
+    """Assets in an S3 bucket, same bucket/object_name layout as utils.upload_file_to_s3."""
+
+    def __init__(self, bucket: str, prefix: str = EDTECH_ASSET_CACHE_PREFIX):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+
+    def object_name(self, kind: str, key: str, suffix: str) -> str:
+        return f"{self.prefix}/{kind}/{key}{suffix}"
+
+    def download(self, kind: str, key: str, suffix: str, path: str) -> bool:
+        return download_file_from_s3(self.bucket, self.object_name(kind, key, suffix), path)
+
+    def upload(self, kind: str, key: str, suffix: str, path: str) -> bool:
+        return upload_file_to_s3(path, self.bucket, self.object_name(kind, key, suffix)) is not None
+
+
+class LocalBucketAssetTier(S3AssetTier):
+    """S3AssetTier stand-in on the local disk: <root>/<bucket>/<object_name>."""
+
+    def __init__(self, root: str, bucket: str, prefix: str = EDTECH_ASSET_CACHE_PREFIX):
+        super().__init__(bucket, prefix)
+        self.root = root
+
+    def _path(self, kind: str, key: str, suffix: str) -> str:
+        return os.path.join(self.root, self.bucket, *self.object_name(kind, key, suffix).split("/"))
+
+    def download(self, kind: str, key: str, suffix: str, path: str) -> bool:
+        source = self._path(kind, key, suffix)
+        if not os.path.exists(source):
+            return False
+        shutil.copyfile(source, path)
+        return True
+
+    def upload(self, kind: str, key: str, suffix: str, path: str) -> bool:
+        target = self._path(kind, key, suffix)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target + ".part")
+        os.replace(target + ".part", target)
+        return True
+
+
+class AssetCache:
+    """Thread-safe on-disk asset cache: <directory>/<kind>/<key[:2]>/<key><suffix>."""
+
+    def __init__(self, directory: str = EDTECH_ASSET_CACHE_DIR, max_bytes: int = int(EDTECH_ASSET_CACHE_MAX_MB * 1024 * 1024),
+                 remote: Optional[S3AssetTier] = None, enabled: bool = EDTECH_ASSET_CACHE_ENABLED):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.remote = remote
+        self.enabled = enabled
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+        self._metrics = {"hits": 0, "remote_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def _path(self, kind: str, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, kind, key[:2], f"{key}{suffix}")
+
+    def _record(self, key: str, count: int = 1):
+        with self._lock:
+            self._metrics[key] += count
+
+    def fetch(self, kind: str, key: str, suffix: str, dest: str) -> bool:
+        """
+        Put the cached asset at `dest`.
+
+        :return: False when it is neither in the local cache nor in the remote tier.
+        """
+        if not self.enabled:
+            return False
+        path = self._path(kind, key, suffix)
+        try:
+            _link_or_copy(path, dest)
+            # The modification time orders the eviction, a hit makes the asset the most recent
+            os.utime(path)
+            self._record("hits")
+            return True
+        except FileNotFoundError:
+            pass
+        if self.remote is not None and self.remote.download(kind, key, suffix, dest):
+            self._record("remote_hits")
+            self._add_local(kind, key, suffix, dest)
+            return True
+        self._record("misses")
+        return False
+
+    def store(self, kind: str, key: str, suffix: str, src: str):
+        """Add the file `src` to the cache, and to the remote tier if there is one."""
+        if not self.enabled:
+            return
+        self._add_local(kind, key, suffix, src)
+        if self.remote is not None:
+            self.remote.upload(kind, key, suffix, src)
+        self._record("stores")
+
+    def get_or_create(self, kind: str, key: str, suffix: str, dest: str, create: Callable[[str], None]) -> bool:
+        """
+        Put the asset at `dest`, calling `create(dest)` to generate it on a miss.
+
+        :return: True on a cache hit.
+        """
+        if self.fetch(kind, key, suffix, dest):
+            return True
+        create(dest)
+        self.store(kind, key, suffix, dest)
+        return False
+
+    def _add_local(self, kind: str, key: str, suffix: str, src: str):
+        path = self._path(kind, key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written aside and renamed, a reader never sees a partial file
+        fd, temp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        os.close(fd)
+        shutil.copyfile(src, temp)
+        os.replace(temp, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            over = self._size is None or self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".part"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def evict(self):
+        """Remove the least recently used assets until the cache fits in max_bytes."""
+        with self._lock:
+            files = sorted(self._files())
+            size = sum(file_size for _, file_size, _ in files)
+            evicted = 0
+            for _, file_size, path in files:
+                if size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                size -= file_size
+                evicted += 1
+            # Other processes may share the directory, the size is measured again on every eviction
+            self._size = size
+            self._metrics["evictions"] += evicted
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics: Dict[str, Any] = dict(self._metrics)
+            metrics["bytes"] = self._size
+        metrics["enabled"] = self.enabled
+        metrics["max_bytes"] = self.max_bytes
+        metrics["directory"] = self.directory
+        metrics["remote"] = f"s3://{self.remote.bucket}/{self.remote.prefix}" if self.remote is not None else None
+        return metrics
+
+
+def _remote_tier() -> Optional[S3AssetTier]:
+    if not EDTECH_ASSET_CACHE_BUCKET:
+        return None
+    if EDTECH_ASSET_CACHE_S3_LOCAL_DIR:
+        return LocalBucketAssetTier(EDTECH_ASSET_CACHE_S3_LOCAL_DIR, EDTECH_ASSET_CACHE_BUCKET)
+    return S3AssetTier(EDTECH_ASSET_CACHE_BUCKET)
+
+
+asset_cache = AssetCache(remote=_remote_tier())
+
+
+def get_asset_cache_metrics() -> Dict[str, Any]:
+    return asset_cache.metrics()
@@ -0,0 +1,294 @@
+import base64
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from gtts import gTTS
+
+from asset_cache import asset_cache, asset_key
+from llm_utils import LLM_PROVIDER, call_llm, call_llm_to_generate_image
+from video_render import SEGMENT_PARAMS, TEXT_BOTTOM_MARGIN, concat_segments, render_scene_segment
+
+# Educational video pipeline: script -> per scene image + voice-over -> scene segment -> final video.
+# The scenes are prepared concurrently, and inside a scene the image and the voice-over are generated
+# at the same time, so a video takes about as long as its slowest scene instead of the sum of all of them.
+# Each scene is encoded in a worker process as soon as it is ready (video_render.py), and the
+# segments are joined without re-encoding, so no process holds the frames of the whole video.
+# Images, voice-overs and segments are kept in the asset cache (asset_cache.py): an unchanged scene
+# is not generated nor encoded again.
+
+# Scenes prepared at the same time, each one runs its image and voice-over requests in parallel
+EDTECH_VIDEO_WORKERS = int(os.getenv("EDTECH_VIDEO_WORKERS", "5"))
+# "gtts" (Google Text-to-Speech) or "fake" (silent audio, for offline benchmarks)
+TTS_PROVIDER = os.getenv("TTS_PROVIDER", "gtts")
+FAKE_TTS_LATENCY_MS = float(os.getenv("FAKE_TTS_LATENCY_MS", "0"))
+# Worker processes encoding scene segments, one per core by default
+EDTECH_RENDER_PROCESSES = int(os.getenv("EDTECH_RENDER_PROCESSES", str(os.cpu_count() or 1)))
+
+# Fixed, so the image of a prompt is always the same and can be cached
+IMAGE_SEED = 42
+TTS_LANG = "en"
+
+# progress(stage, done, total), stage: "script", "scenes" (images + voice-overs), "segments" or "concat"
+ProgressCallback = Callable[[str, int, int], None]
+
+
+def _no_progress(stage: str, done: int, total: int):
+    pass
+
+
+def generate_copy_for_video(prompt: str, age_group: str) -> Dict[str, Any]:
+    prompt = f"""
+    You are a helpful, respectful and honest educational assistant.
+    You will generate a script for an educational video.
+    The script will be about the following topic:
+    {prompt}
+    Steps:
+    1. Generate a script of 100 words or less having a good flow and language according to the age group {age_group} years old.
+    2. Rewrite the script divided into 5 scenes. If a scene need more words to have a good flow, add it a maximun of 10 extra words.
+    3. Return the script in a JSON format like this:
+    {{
+        "scenes": [
+            {{
+                "scene_number": 1,
+                "scene_description": "Scene 1 description",
+                "script": "Scene 1 script"
+            }}
+        ]
+    }}
+    """
+    response = call_llm(prompt)
+    return json.loads(response)
+
+
+def image_prompt(scene: Dict[str, Any], age_group: str) -> str:
+    return f"""
+        You are an expert educational illustrator.
+        Create a detailed and engaging image for an educational video aimed at children aged {age_group} years old.
+
+        Topic for the image:
+        {scene["script"][:200]}
+
+        Guidelines:
+        - Use a unique, vibrant background color (avoid white).
+        - The image should be clear, age-appropriate, and visually appealing for the specified age group.
+        - Include no more than 5 distinct, relevant elements that directly illustrate the topic.
+        - Exclude any logos, watermarks, backgrounds, borders, frames, or abstract elements not directly related to the scene.
+        - Avoid text in the image.
+        - Focus on clarity, simplicity, and educational value.
+
+        Return only the image, with no additional text or explanation.
+        """
+
+
+def generate_scene_image(scene: Dict[str, Any], age_group: str) -> bytes:
+    """PNG bytes of the image of a scene."""
+    return base64.b64decode(call_llm_to_generate_image(image_prompt(scene, age_group), seed=IMAGE_SEED))
+
+
+def generate_images_for_video(scenes: List[Dict[str, Any]], age_group: str, workers: int = EDTECH_VIDEO_WORKERS) -> List[Dict[str, Any]]:
+    """Images of every scene, generated concurrently, in the order of the scenes."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        images = list(executor.map(lambda scene: generate_scene_image(scene, age_group), scenes))
+    return [{"scene_number": scene["scene_number"], "image_bytes": image} for scene, image in zip(scenes, images)]
+
+
+def _write_fake_voice_over(text: str, path: str):
+    # Silent audio lasting what the text takes to read (~2.5 words per second)
+    time.sleep(FAKE_TTS_LATENCY_MS / 1000)
+    sample_rate = 22050
+    duration = max(1.0, len(text.split()) / 2.5)
+    with wave.open(path, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(sample_rate)
+        file.writeframes(b"\x00\x00" * int(sample_rate * duration))
+
+
+def voice_over_suffix() -> str:
+    return ".wav" if TTS_PROVIDER == "fake" else ".mp3"
+
+
+def synthesize_voice_over(text: str, path: str):
+    """Write the voice-over of `text` to `path`."""
+    if TTS_PROVIDER == "fake":
+        _write_fake_voice_over(text, path)
+    else:
+        gTTS(text=text, lang=TTS_LANG).save(path)
+
+
+def _temp_path(suffix: str) -> str:
+    temp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    temp.close()
+    return temp.name
+
+
+def _write_image(image_bytes: bytes, path: str):
+    with open(path, "wb") as file:
+        file.write(image_bytes)
+
+
+def scene_asset_keys(scene: Dict[str, Any], age_group: str, font_size: int = 40, font_color: str = 'white') -> Dict[str, str]:
+    """Asset cache keys of the image, the voice-over and the segment of a scene."""
+    if scene.get("image_bytes") is not None:
+        image = asset_key("image", sha256=hashlib.sha256(scene["image_bytes"]).hexdigest())
+    else:
+        image = asset_key("image", prompt=image_prompt(scene, age_group), age_group=age_group, seed=IMAGE_SEED, provider=LLM_PROVIDER)
+    audio = asset_key("audio", script=scene["script"], lang=TTS_LANG, provider=TTS_PROVIDER)
+    segment = asset_key("segment", image=image, audio=audio, scene_description=scene["scene_description"],
+                        font_size=font_size, font_color=font_color, text_margin=TEXT_BOTTOM_MARGIN, params=SEGMENT_PARAMS)
+    return {"image": image, "audio": audio, "segment": segment}
+
+
+def prepare_scene(scene: Dict[str, Any], age_group: str, io_executor: ThreadPoolExecutor, segment_path: str, font_size: int = 40, font_color: str = 'white') -> Optional[Tuple[str, str, str]]:
+    """
+    Cached segment of a scene, or else its image and voice-over at the same time.
+
+    :param scene: scene_number, scene_description and script. A scene with image_bytes reuses its image.
+    :param segment_path: Where the cached segment is put.
+    :return: None when the segment was cached, else the temp paths of the image and the voice-over
+        and the cache key of the segment to encode.
+    """
+    keys = scene_asset_keys(scene, age_group, font_size, font_color)
+    if asset_cache.fetch("segment", keys["segment"], ".mp4", segment_path):
+        return None
+    image_path, audio_path = _temp_path('.png'), _temp_path(voice_over_suffix())
+    try:
+        if scene.get("image_bytes") is not None:
+            image = io_executor.submit(_write_image, scene["image_bytes"], image_path)
+        else:
+            image = io_executor.submit(asset_cache.get_or_create, "image", keys["image"], ".png", image_path,
+                                       lambda path: _write_image(generate_scene_image(scene, age_group), path))
+        audio = io_executor.submit(asset_cache.get_or_create, "audio", keys["audio"], voice_over_suffix(), audio_path,
+                                   lambda path: synthesize_voice_over(scene["script"], path))
+        image.result()
+        audio.result()
+        return image_path, audio_path, keys["segment"]
+    except Exception:
+        _remove_files([image_path, audio_path])
+        raise
+
+
+def _remove_files(paths: List[str]):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+_render_pool: Optional[Executor] = None
+_render_pool_lock = threading.Lock()
+
+
+def _get_render_pool() -> Executor:
+    # Shared by the videos of the process, the workers are started once.
+    # spawn: forking a process with running threads can deadlock the child
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            if multiprocessing.current_process().daemon:
+                # e.g. a Celery prefork worker, it can't start processes. The encoding runs in
+                # ffmpeg subprocesses, threads still overlap it
+                print("Daemonic process, the video segments are rendered in threads")
+                _render_pool = ThreadPoolExecutor(max_workers=EDTECH_RENDER_PROCESSES, thread_name_prefix="render")
+            else:
+                _render_pool = ProcessPoolExecutor(max_workers=EDTECH_RENDER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+        return _render_pool
+
+
+def _reset_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is not None:
+            _render_pool.shutdown(wait=False, cancel_futures=True)
+        _render_pool = None
+
+
+def create_video_from_scenes(scenes, output_path="output_video.mp4", duration=10, font_size=40, font_color='white', age_group: Optional[str] = None, workers: int = EDTECH_VIDEO_WORKERS, progress: Optional[ProgressCallback] = None):
+    """
+    Render the video of the scenes. The scenes are prepared concurrently with bounded workers,
+    each one is encoded to its own segment in a worker process as soon as its image and voice-over
+    are ready, then the segments are joined without re-encoding. Cached assets are reused.
+
+    :param scenes: scene_number, scene_description, script and optionally image_bytes. The images
+        missing are generated for age_group.
+    :param progress: Called when a scene is prepared, a segment is encoded and before the concatenation.
+    """
+    progress = progress or _no_progress
+    segment_dir = tempfile.mkdtemp(prefix="video_segments_")
+    render_pool = _get_render_pool()
+    segment_paths = [os.path.join(segment_dir, f"scene_{index:03d}.mp4") for index in range(len(scenes))]
+    renders: List[Optional[Future]] = [None] * len(scenes)
+    # Cache keys of the segments encoded by this video
+    segment_keys: Dict[int, str] = {}
+    # Temp files of the scenes whose segment may not exist, the render workers remove the others
+    temp_files: List[str] = []
+    # Two pools: a scene worker waits on its image and voice-over requests, they can't share its pool
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scene") as scene_executor, \
+            ThreadPoolExecutor(max_workers=workers * 2, thread_name_prefix="scene-io") as io_executor:
+        assets = {
+            scene_executor.submit(prepare_scene, scene, age_group, io_executor, segment_paths[index], font_size, font_color): index
+            for index, scene in enumerate(scenes)
+        }
+        try:
+            progress("scenes", 0, len(scenes))
+            for prepared_count, future in enumerate(as_completed(assets), 1):
+                index = assets[future]
+                prepared = future.result()
+                progress("scenes", prepared_count, len(scenes))
+                if prepared is None:
+                    # Cached segment
+                    renders[index] = Future()
+                    renders[index].set_result(segment_paths[index])
+                    continue
+                image_path, audio_path, segment_keys[index] = prepared
+                temp_files.extend([image_path, audio_path])
+                # Only the text of the scene goes to the worker, not its image bytes
+                renders[index] = render_pool.submit(render_scene_segment, {"scene_description": scenes[index]["scene_description"]}, image_path, audio_path, segment_paths[index], font_size, font_color)
+
+            for encoded, render in enumerate(as_completed(renders), 1):
+                render.result()
+                progress("segments", encoded, len(scenes))
+            progress("concat", 0, 1)
+            for index, key in segment_keys.items():
+                asset_cache.store("segment", key, ".mp4", segment_paths[index])
+            concat_segments(segment_paths, output_path)
+        except BrokenProcessPool:
+            # A render worker died (e.g. out of memory), the next video starts a new pool
+            _reset_render_pool()
+            raise
+        finally:
+            # When a scene fails the others still finish, their files are released too
+            for future, index in assets.items():
+                if renders[index] is None and not future.cancel() and future.exception() is None and future.result() is not None:
+                    temp_files.extend(future.result()[:2])
+            for render in renders:
+                if render is not None and not render.cancel():
+                    wait([render])
+            _remove_files(temp_files)
+            shutil.rmtree(segment_dir, ignore_errors=True)
+
+    print(f"Video saved to {output_path}")
+    return output_path
+
+
+def generate_video(prompt: str, age_group: str, output_path: str = "output_video.mp4", workers: int = EDTECH_VIDEO_WORKERS, progress: Optional[ProgressCallback] = None) -> str:
+    """
+    Full pipeline: script, then images and voice-overs of every scene concurrently, then the video.
+
+    :param progress: Called at every stage, see ProgressCallback.
+    :return: The output path.
+    """
+    progress = progress or _no_progress
+    progress("script", 0, 1)
+    scenes = generate_copy_for_video(prompt, age_group)["scenes"]
+    progress("script", 1, 1)
+    return create_video_from_scenes(scenes, output_path=output_path, age_group=age_group, workers=workers, progress=progress)
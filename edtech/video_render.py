@@ -0,0 +1,80 @@
+import os
+import subprocess
+import tempfile
+from typing import Any, Dict, List
+
+from moviepy import AudioFileClip, CompositeVideoClip, ImageClip, TextClip
+from moviepy.config import FFMPEG_BINARY
+
+# Rendering of the educational videos, run in worker processes: only moviepy and ffmpeg here,
+# so a worker starts without the LLM clients. Every scene is encoded to its own segment with the
+# same codec parameters, then the segments are joined by ffmpeg without re-encoding.
+
+# Next to this file, whatever the working directory of the process
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DejaVuSans.ttf")
+
+# Pixels between the scene description and the bottom of the image
+TEXT_BOTTOM_MARGIN = 150
+
+# Same codecs, frame rate, pixel format and audio rate in every segment, the concat demuxer
+# can only copy streams that match
+SEGMENT_FPS = 24
+SEGMENT_PARAMS = {
+    "fps": SEGMENT_FPS,
+    "codec": "libx264",
+    "audio_codec": "aac",
+    "audio_fps": 44100,
+    "audio_bitrate": "128k",
+    "ffmpeg_params": ["-pix_fmt", "yuv420p", "-ac", "2"],
+}
+
+
+def build_scene_clip(scene: Dict[str, Any], image_path: str, audio_path: str, font_size: int = 40, font_color: str = 'white'):
+    """Image with the scene description on top and the voice-over, as long as the voice-over."""
+    audio_clip = AudioFileClip(audio_path)
+    img_clip = ImageClip(image_path).with_duration(audio_clip.duration)
+    width, height = img_clip.size
+    # As wide as the image and as tall as the wrapped text (the margin keeps the descenders of the last
+    # line), TEXT_BOTTOM_MARGIN pixels above the bottom
+    txt_clip = TextClip(text=scene["scene_description"], color=font_color, font=FONT_PATH, font_size=font_size, method='caption', size=(width, None), margin=(None, font_size // 4)).with_duration(audio_clip.duration)
+    txt_clip = txt_clip.with_position(('center', max(0, height - txt_clip.h - TEXT_BOTTOM_MARGIN)))
+    # Overlay text on image and add the audio
+    return CompositeVideoClip([img_clip, txt_clip]).with_audio(audio_clip)
+
+
+def render_scene_segment(scene: Dict[str, Any], image_path: str, audio_path: str, segment_path: str, font_size: int = 40, font_color: str = 'white') -> str:
+    """
+    Encode one scene to `segment_path` and remove its image and voice-over, they are not needed anymore.
+
+    :return: The segment path.
+    """
+    clip = build_scene_clip(scene, image_path, audio_path, font_size=font_size, font_color=font_color)
+    try:
+        # The temp audio of moviepy goes next to the segment, not to the working directory
+        clip.write_videofile(segment_path, temp_audiofile_path=os.path.dirname(segment_path), logger=None, **SEGMENT_PARAMS)
+    finally:
+        clip.close()
+    for path in (image_path, audio_path):
+        if os.path.exists(path):
+            os.remove(path)
+    return segment_path
+
+
+def concat_segments(segment_paths: List[str], output_path: str) -> str:
+    """Join the segments in order with the ffmpeg concat demuxer, copying the streams."""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            file.write(f"file '{escaped}'\n")
+        list_path = file.name
+    try:
+        subprocess.run(
+            [FFMPEG_BINARY, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+             "-c", "copy", "-movflags", "+faststart", output_path],
+            check=True, capture_output=True,
+        )
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg concat failed: {e.stderr.decode(errors='replace').strip()}") from e
+    finally:
+        os.remove(list_path)
+    return output_path
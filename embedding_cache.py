@@ -0,0 +1,144 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils import embedding_functions
+
+from llm_cache import LRUCache
+
+# Persistent cache of embeddings keyed by the hash of the model and the text. It sits in front of
+# the embedding function of every Chroma collection, so repeated documents and queries are free.
+# Next to the Chroma store by default (same CHROMA_PATH as vector_store, read here to avoid an import cycle)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(os.getenv("CHROMA_PATH", "/chromadb"), "embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MEMORY_SIZE = int(os.getenv("EMBEDDING_CACHE_MEMORY_SIZE", "10000"))
+# Embeddings don't expire, the in-memory tier only evicts by size
+EMBEDDING_CACHE_MEMORY_TTL = 10 * 365 * 24 * 3600
+
+
+class SQLiteEmbeddingStore:
+    """Embeddings stored as float32 blobs in a SQLite table, shared by every process on the host."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        # SQLite limits the number of parameters per statement
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._connection.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch).fetchall()
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        rows = [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+        with self._lock:
+            self._connection.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._connection.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """
+    Embedding function that only computes the embeddings of texts it has never seen.
+    Lookups go to an in-memory LRU, then to the SQLite store, then to the wrapped model.
+    """
+
+    def __init__(self, embedding_function=None, store: Optional[SQLiteEmbeddingStore] = None, memory_size: int = EMBEDDING_CACHE_MEMORY_SIZE):
+        self.embedding_function = embedding_function or embedding_functions.DefaultEmbeddingFunction()
+        self.model_name = type(self.embedding_function).__name__
+        self.store = store or SQLiteEmbeddingStore()
+        self.memory = LRUCache(max_size=memory_size, ttl=EMBEDDING_CACHE_MEMORY_TTL)
+        self._metrics = {"memory_hits": 0, "store_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}:{text}".encode("utf-8")).hexdigest()
+
+    def __call__(self, input: Documents) -> Embeddings:
+        keys = [self._key(text) for text in input]
+        embeddings: Dict[str, Any] = {}
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                embeddings[key] = vector
+        memory_hits = len(embeddings)
+
+        missing = [key for key in dict.fromkeys(keys) if key not in embeddings]
+        stored = self.store.get_many(missing) if missing else {}
+        for key, vector in stored.items():
+            self.memory.set(key, vector)
+        embeddings.update(stored)
+
+        # Embed each distinct missing text once
+        to_embed = {}
+        for key, text in zip(keys, input):
+            if key not in embeddings:
+                to_embed.setdefault(key, text)
+        if to_embed:
+            computed = self.embedding_function(list(to_embed.values()))
+            new_embeddings = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(to_embed, computed)}
+            self.store.put_many(new_embeddings)
+            for key, vector in new_embeddings.items():
+                self.memory.set(key, vector)
+            embeddings.update(new_embeddings)
+
+        with self._lock:
+            self._metrics["memory_hits"] += memory_hits
+            self._metrics["store_hits"] += len(stored)
+            self._metrics["misses"] += len(to_embed)
+        return [embeddings[key] for key in keys]
+
+    @staticmethod
+    def name() -> str:
+        # Same name as Chroma's default function: the vectors are identical, so collections
+        # created with the default embedding function keep working with the cache in front
+        return "default"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "CachedEmbeddingFunction":
+        return get_embedding_function()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        lookups = metrics["memory_hits"] + metrics["store_hits"] + metrics["misses"]
+        metrics["hit_rate"] = (metrics["memory_hits"] + metrics["store_hits"]) / lookups if lookups else 0.0
+        return metrics
+
+
+_embedding_function: Optional[CachedEmbeddingFunction] = None
+_embedding_function_lock = threading.Lock()
+
+
+def get_embedding_function() -> CachedEmbeddingFunction:
+    """The process-wide cached embedding function, pass it to every get_collection/create_collection."""
+    global _embedding_function
+    with _embedding_function_lock:
+        if _embedding_function is None:
+            _embedding_function = CachedEmbeddingFunction()
+        return _embedding_function
+
+
+def get_embedding_cache_metrics() -> Dict[str, Any]:
+    return get_embedding_function().metrics()
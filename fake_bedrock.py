@@ -0,0 +1,457 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+# Local stand-in for the Bedrock runtime. It answers the same request bodies that
+# llm_utils and ChatBedrock send, with deterministic responses and a configurable
+# latency, so the pipelines can be benchmarked offline without burning tokens.
+#
+# In-process:  LLM_PROVIDER=fake
+# HTTP server: python fake_bedrock.py  +  LLM_PROVIDER=fake_http FAKE_BEDROCK_URL=http://localhost:8090
+
+FAKE_BEDROCK_LATENCY_MS = float(os.getenv("FAKE_BEDROCK_LATENCY_MS", "0"))
+FAKE_BEDROCK_JITTER_MS = float(os.getenv("FAKE_BEDROCK_JITTER_MS", "0"))
+FAKE_BEDROCK_MS_PER_TOKEN = float(os.getenv("FAKE_BEDROCK_MS_PER_TOKEN", "0"))
+FAKE_BEDROCK_RULES = os.getenv("FAKE_BEDROCK_RULES")
+# Time to process each uncached input token before the first output token
+FAKE_BEDROCK_MS_PER_INPUT_TOKEN = float(os.getenv("FAKE_BEDROCK_MS_PER_INPUT_TOKEN", "0"))
+# Prompt caching: prefixes shorter than this aren't cached (Bedrock needs 1024 or 2048 depending on the model)
+FAKE_BEDROCK_CACHE_MIN_TOKENS = int(os.getenv("FAKE_BEDROCK_CACHE_MIN_TOKENS", "0"))
+FAKE_BEDROCK_CACHE_TTL = float(os.getenv("FAKE_BEDROCK_CACHE_TTL", "300"))
+# Invocations per second accepted, the rest raise ThrottlingException like a Bedrock quota. 0 = unlimited
+FAKE_BEDROCK_MAX_RPS = float(os.getenv("FAKE_BEDROCK_MAX_RPS", "0"))
+
+
+def approx_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for fake usage numbers."""
+    return max(1, len(text) // 4)
+
+
+def _digest(data: str) -> str:
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _content_to_text(content: Any) -> str:
+    # Anthropic content can be a plain string or a list of typed blocks
+    if isinstance(content, str):
+        return content
+    parts = []
+    for block in content or []:
+        if isinstance(block, dict):
+            if block.get("type") == "text":
+                parts.append(block.get("text", ""))
+            elif block.get("type") == "tool_result":
+                parts.append(_content_to_text(block.get("content")))
+        else:
+            parts.append(str(block))
+    return " ".join(parts)
+
+
+def _cache_prefixes(request: Dict[str, Any]) -> List[str]:
+    # Prompt text up to each cache point, in the order Anthropic builds the prefix: tools, system, messages
+    prefixes, text = [], ""
+
+    def add(part: str, block: Any):
+        nonlocal text
+        text += part
+        if isinstance(block, dict) and block.get("cache_control"):
+            prefixes.append(text)
+
+    for tool in request.get("tools") or []:
+        add(json.dumps({key: value for key, value in tool.items() if key != "cache_control"}, sort_keys=True), tool)
+    system = request.get("system")
+    for block in ([system] if isinstance(system, str) else system or []):
+        add(_content_to_text([block] if isinstance(block, dict) else block), block)
+    for message in request.get("messages", []):
+        content = message.get("content")
+        for block in ([content] if isinstance(content, str) else content or []):
+            add(_content_to_text([block] if isinstance(block, dict) else block), block)
+    return prefixes
+
+
+def usage_headers(usage: Dict[str, int]) -> Dict[str, str]:
+    """Token counts of a call in the headers Bedrock InvokeModel returns them."""
+    return {
+        "x-amzn-bedrock-input-token-count": str(usage.get("input_tokens", 0)),
+        "x-amzn-bedrock-output-token-count": str(usage.get("output_tokens", 0)),
+        "x-amzn-bedrock-cache-read-input-token-count": str(usage.get("cache_read_input_tokens", 0)),
+        "x-amzn-bedrock-cache-write-input-token-count": str(usage.get("cache_creation_input_tokens", 0)),
+    }
+
+
+def _fake_tool_input(schema: Dict[str, Any]) -> Any:
+    # Build a value that satisfies the JSON schema of a forced tool call
+    if "enum" in schema:
+        return schema["enum"][0]
+    if "anyOf" in schema:
+        return _fake_tool_input(schema["anyOf"][0])
+    schema_type = schema.get("type")
+    if schema_type == "object":
+        return {key: _fake_tool_input(value) for key, value in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return [_fake_tool_input(schema.get("items", {}))]
+    if schema_type in ("integer", "number"):
+        return 1
+    if schema_type == "boolean":
+        return True
+    return "fake"
+
+
+@lru_cache(maxsize=32)
+def solid_png(width: int, height: int, color: Tuple[int, int, int]) -> bytes:
+    """Encode a solid color PNG using only the standard library."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    row = b"\x00" + bytes(color) * width
+    raw = row * height
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+def encode_event_stream_message(payload: bytes, event_type: str = "chunk") -> bytes:
+    """Frame a payload with the AWS event stream binary format used by invoke-with-response-stream."""
+    headers = b""
+    for name, value in ((":event-type", event_type), (":content-type", "application/json"), (":message-type", "event")):
+        name_bytes, value_bytes = name.encode("utf-8"), value.encode("utf-8")
+        # Header: name length, name, value type (7 = string), value length, value
+        headers += struct.pack(">B", len(name_bytes)) + name_bytes + struct.pack(">BH", 7, len(value_bytes)) + value_bytes
+    total_length = 12 + len(headers) + len(payload) + 4
+    prelude = struct.pack(">II", total_length, len(headers))
+    prelude += struct.pack(">I", zlib.crc32(prelude) & 0xFFFFFFFF)
+    message = prelude + headers + payload
+    return message + struct.pack(">I", zlib.crc32(message) & 0xFFFFFFFF)
+
+
+def load_rules(path: Optional[str]) -> List[Dict[str, str]]:
+    """
+    Load canned responses from a JSON file with the format:
+    [{"contains": "general_satisfied", "response": "{...}"}]
+
+    A rule with "tool" and "input" instead of "response" answers with a tool_use block
+    when the request offers that tool, e.g. to drive a router or a react agent:
+    [{"contains": "details of", "tool": "check_product_details", "input": {"product_name": "..."}}]
+    """
+    if not path:
+        return []
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+_EMPTY_TOKENS = {"input_tokens": 0, "output_tokens": 0, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+
+
+class FakeBedrockClient:
+    """
+    In-process replacement for boto3.client('bedrock-runtime').
+
+    Responses depend only on the request body, so two runs with the same inputs
+    produce the same outputs and the same simulated latency.
+    """
+
+    def __init__(
+        self,
+        latency_ms: Optional[float] = None,
+        jitter_ms: Optional[float] = None,
+        ms_per_token: Optional[float] = None,
+        rules: Optional[List[Dict[str, str]]] = None,
+        ms_per_input_token: Optional[float] = None,
+        cache_min_tokens: Optional[int] = None,
+        max_rps: Optional[float] = None,
+    ):
+        self.latency_ms = FAKE_BEDROCK_LATENCY_MS if latency_ms is None else latency_ms
+        self.jitter_ms = FAKE_BEDROCK_JITTER_MS if jitter_ms is None else jitter_ms
+        self.ms_per_token = FAKE_BEDROCK_MS_PER_TOKEN if ms_per_token is None else ms_per_token
+        self.rules = load_rules(FAKE_BEDROCK_RULES) if rules is None else list(rules)
+        self.ms_per_input_token = FAKE_BEDROCK_MS_PER_INPUT_TOKEN if ms_per_input_token is None else ms_per_input_token
+        self.cache_min_tokens = FAKE_BEDROCK_CACHE_MIN_TOKENS if cache_min_tokens is None else cache_min_tokens
+        self.max_rps = FAKE_BEDROCK_MAX_RPS if max_rps is None else max_rps
+        self.throttled = 0
+        # Start times of the invocations of the last second, for max_rps
+        self._recent_invocations: deque = deque()
+        self.calls: Dict[str, int] = {}
+        self.tokens = dict(_EMPTY_TOKENS)
+        # Called with (model_id, usage) after each invoke, like a botocore after-call hook
+        self.usage_callback = None
+        # Digest of a cached prompt prefix -> expiration time
+        self._prompt_cache: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add_rule(self, contains: str, response: str):
+        """Answer every prompt containing `contains` with `response`."""
+        self.rules.append({"contains": contains, "response": response})
+
+    def add_tool_rule(self, contains: str, tool: str, tool_input: Dict[str, Any]):
+        """Answer every prompt containing `contains` that offers `tool` with a call to it."""
+        self.rules.append({"contains": contains, "tool": tool, "input": tool_input})
+
+    def reset_stats(self):
+        with self._lock:
+            self.calls = {}
+            self.tokens = dict(_EMPTY_TOKENS)
+            self._prompt_cache = {}
+            self.throttled = 0
+            self._recent_invocations.clear()
+
+    def total_calls(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def _record(self, model_id: str, usage: Optional[Dict[str, int]] = None):
+        with self._lock:
+            self.calls[model_id] = self.calls.get(model_id, 0) + 1
+            for key in self.tokens:
+                self.tokens[key] += (usage or {}).get(key, 0)
+
+    def _check_rate(self, model_id: str):
+        if not self.max_rps:
+            return
+        now = time.monotonic()
+        with self._lock:
+            while self._recent_invocations and self._recent_invocations[0] <= now - 1:
+                self._recent_invocations.popleft()
+            if len(self._recent_invocations) >= self.max_rps:
+                self.throttled += 1
+                throttled = True
+            else:
+                self._recent_invocations.append(now)
+                throttled = False
+        if throttled:
+            # Same error boto3 raises for a Bedrock quota, the callers handle both alike
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many requests, please wait before trying again."},
+                               "ResponseMetadata": {"HTTPStatusCode": 429}}, "InvokeModel")
+
+    def _text_for(self, model_id: str, prompt_text: str) -> str:
+        for rule in self.rules:
+            if "response" in rule and rule["contains"] in prompt_text:
+                return rule["response"]
+        return f"Fake response {_digest(model_id + prompt_text)[:16]} from {model_id}."
+
+    def _tool_rule_for(self, prompt_text: str, tool_names: List[str]) -> Optional[Dict[str, Any]]:
+        for rule in self.rules:
+            if rule.get("tool") in tool_names and rule["contains"] in prompt_text:
+                return rule
+        return None
+
+    def _delay(self, key: str, output_tokens: int, input_tokens: int = 0) -> float:
+        # Deterministic jitter derived from the request itself
+        jitter = 0.0
+        if self.jitter_ms:
+            jitter = (int(_digest(key)[:8], 16) / 0xFFFFFFFF) * self.jitter_ms
+        return (self.latency_ms + jitter + input_tokens * self.ms_per_input_token + output_tokens * self.ms_per_token) / 1000
+
+    def _prompt_cache_usage(self, model_id: str, request: Dict[str, Any]) -> Tuple[int, int]:
+        """Input tokens (read from the cache, written to the cache) of a request with cache points."""
+        prefixes = [prefix for prefix in _cache_prefixes(request) if approx_tokens(prefix) >= self.cache_min_tokens]
+        if not prefixes:
+            return 0, 0
+        now = time.monotonic()
+        keys = [_digest(model_id + prefix) for prefix in prefixes]
+        with self._lock:
+            if len(self._prompt_cache) > 10000:
+                self._prompt_cache = {key: expires for key, expires in self._prompt_cache.items() if expires > now}
+            # The longest cached prefix is read, the rest up to the last cache point is written
+            read = next((approx_tokens(prefix) for prefix, key in zip(reversed(prefixes), reversed(keys)) if self._prompt_cache.get(key, 0) > now), 0)
+            for key in keys:
+                self._prompt_cache[key] = now + FAKE_BEDROCK_CACHE_TTL
+        return read, approx_tokens(prefixes[-1]) - read
+
+    def build_response(self, model_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the response body Bedrock would return for `request`."""
+        if model_id.startswith("amazon.nova-canvas"):
+            config = request.get("imageGenerationConfig", {})
+            seed_digest = _digest(json.dumps(request, sort_keys=True))
+            color = (int(seed_digest[0:2], 16), int(seed_digest[2:4], 16), int(seed_digest[4:6], 16))
+            image = solid_png(config.get("width", 1280), config.get("height", 720), color)
+            images = [base64.b64encode(image).decode("utf-8")] * config.get("numberOfImages", 1)
+            return {"images": images}
+
+        if "messages" in request:
+            system = _content_to_text(request.get("system", ""))
+            prompt_text = system + " " + " ".join(_content_to_text(m.get("content")) for m in request["messages"])
+            input_tokens = approx_tokens(prompt_text)
+            if request.get("tools"):
+                # Tool schemas are part of the input too
+                input_tokens += approx_tokens(json.dumps(request["tools"]))
+            cache_read, cache_creation = self._prompt_cache_usage(model_id, request)
+            tool_choice = request.get("tool_choice") or {}
+            tools = request.get("tools") or []
+            if tool_choice.get("type") == "tool":
+                tools = [t for t in tools if t["name"] == tool_choice["name"]]
+            # After a tool result the model answers with text, like a react agent's last step
+            last_message = request["messages"][-1] if request["messages"] else {}
+            answered_tool = isinstance(last_message.get("content"), list) and any(
+                isinstance(block, dict) and block.get("type") == "tool_result" for block in last_message["content"]
+            )
+            tool_rule = None if answered_tool else self._tool_rule_for(prompt_text, [t["name"] for t in tools])
+            if tool_rule or (tools and tool_choice.get("type") == "tool"):
+                tool = next(t for t in tools if t["name"] == tool_rule["tool"]) if tool_rule else tools[0]
+                content = [{
+                    "type": "tool_use",
+                    "id": "toolu_" + _digest(prompt_text)[:24],
+                    "name": tool["name"],
+                    "input": tool_rule["input"] if tool_rule else _fake_tool_input(tool.get("input_schema", {})),
+                }]
+                stop_reason = "tool_use"
+                output_tokens = approx_tokens(json.dumps(content))
+            else:
+                text = self._text_for(model_id, prompt_text)
+                content = [{"type": "text", "text": text}]
+                stop_reason = "end_turn"
+                output_tokens = approx_tokens(text)
+            return {
+                "id": "msg_" + _digest(prompt_text)[:24],
+                "type": "message",
+                "role": "assistant",
+                "model": model_id,
+                "content": content,
+                "stop_reason": stop_reason,
+                "usage": {
+                    "input_tokens": max(0, input_tokens - cache_read - cache_creation),
+                    "cache_read_input_tokens": cache_read,
+                    "cache_creation_input_tokens": cache_creation,
+                    "output_tokens": output_tokens,
+                },
+            }
+
+        prompt_text = request.get("prompt", "")
+        text = self._text_for(model_id, prompt_text)
+        if "meta." in model_id:
+            return {
+                "generation": text,
+                "prompt_token_count": approx_tokens(prompt_text),
+                "generation_token_count": approx_tokens(text),
+                "stop_reason": "stop",
+            }
+        return {"generations": [{"text": text, "finish_reason": "COMPLETE"}]}
+
+    def invoke(self, model_id: str, body: Any) -> Dict[str, Any]:
+        """Build the response for a raw body and sleep for the simulated latency."""
+        if isinstance(body, (bytes, bytearray)):
+            body = body.decode("utf-8")
+        request = json.loads(body)
+        self._check_rate(model_id)
+        response = self.build_response(model_id, request)
+        usage = response.get("usage", {})
+        time.sleep(self._delay(model_id + body, usage.get("output_tokens", 0), usage.get("input_tokens", 0)))
+        self._record(model_id, usage)
+        if self.usage_callback and usage:
+            self.usage_callback(model_id, usage)
+        return response
+
+    def stream(self, model_id: str, body: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the Anthropic streaming events of a messages request. The first event arrives
+        after the configured latency and every token after FAKE_BEDROCK_MS_PER_TOKEN.
+        """
+        if isinstance(body, (bytes, bytearray)):
+            body = body.decode("utf-8")
+        request = json.loads(body)
+        if "messages" not in request:
+            raise ValueError(f"Streaming is only supported for messages requests, got model {model_id}")
+        self._check_rate(model_id)
+        response = self.build_response(model_id, request)
+        usage = response["usage"]
+        time.sleep(self._delay(model_id + body, 0, usage["input_tokens"]))
+        self._record(model_id, usage)
+        if self.usage_callback:
+            self.usage_callback(model_id, usage)
+
+        yield {"type": "message_start", "message": {**response, "content": [], "stop_reason": None, "usage": {**usage, "output_tokens": 0}}}
+        for index, block in enumerate(response["content"]):
+            if block["type"] == "text":
+                yield {"type": "content_block_start", "index": index, "content_block": {"type": "text", "text": ""}}
+                for token in re.findall(r"\s*\S+|\s+$", block["text"]):
+                    time.sleep(self.ms_per_token / 1000)
+                    yield {"type": "content_block_delta", "index": index, "delta": {"type": "text_delta", "text": token}}
+            else:
+                yield {"type": "content_block_start", "index": index, "content_block": {**block, "input": {}}}
+                yield {"type": "content_block_delta", "index": index, "delta": {"type": "input_json_delta", "partial_json": json.dumps(block["input"])}}
+            yield {"type": "content_block_stop", "index": index}
+        yield {"type": "message_delta", "delta": {"stop_reason": response["stop_reason"], "stop_sequence": None}, "usage": {"output_tokens": usage["output_tokens"]}}
+        yield {
+            "type": "message_stop",
+            "amazon-bedrock-invocationMetrics": {
+                "inputTokenCount": usage["input_tokens"],
+                "outputTokenCount": usage["output_tokens"],
+                "cacheReadInputTokenCount": usage["cache_read_input_tokens"],
+                "cacheWriteInputTokenCount": usage["cache_creation_input_tokens"],
+            },
+        }
+
+    def invoke_model(self, modelId: str, body: Any, contentType: str = "application/json", accept: str = "application/json", **kwargs) -> Dict[str, Any]:
+        response = self.invoke(modelId, body)
+        return {
+            "body": io.BytesIO(json.dumps(response).encode("utf-8")),
+            "contentType": "application/json",
+            "ResponseMetadata": {"HTTPHeaders": usage_headers(response.get("usage", {}))},
+        }
+
+    def invoke_model_with_response_stream(self, modelId: str, body: Any, contentType: str = "application/json", accept: str = "application/json", **kwargs) -> Dict[str, Any]:
+        events = self.stream(modelId, body)
+        return {
+            "body": ({"chunk": {"bytes": json.dumps(event).encode("utf-8")}} for event in events),
+            "contentType": "application/json",
+        }
+
+
+def create_app(client: Optional[FakeBedrockClient] = None):
+    """
+    FastAPI app exposing the Bedrock runtime REST paths, so a regular boto3 client
+    created with endpoint_url pointing here talks to the fake.
+    """
+    from fastapi import FastAPI, Request, Response
+    from fastapi.responses import StreamingResponse
+    from starlette.concurrency import run_in_threadpool
+
+    client = client or FakeBedrockClient()
+    app = FastAPI()
+
+    @app.post("/model/{model_id}/invoke")
+    async def invoke_model(model_id: str, request: Request):
+        body = await request.body()
+        # Run the blocking simulated latency outside the event loop
+        try:
+            response = await run_in_threadpool(client.invoke, model_id, body)
+        except ClientError as e:
+            # boto3 reads the error code from this header
+            return Response(content=json.dumps({"message": e.response["Error"]["Message"]}), status_code=429,
+                            media_type="application/json", headers={"x-amzn-ErrorType": e.response["Error"]["Code"]})
+        headers = usage_headers(response["usage"]) if "usage" in response else None
+        return Response(content=json.dumps(response), media_type="application/json", headers=headers)
+
+    @app.post("/model/{model_id}/invoke-with-response-stream")
+    async def invoke_model_with_response_stream(model_id: str, request: Request):
+        body = await request.body()
+
+        def frames():
+            # Sync generator, Starlette iterates it in a thread pool
+            for event in client.stream(model_id, body):
+                payload = json.dumps({"bytes": base64.b64encode(json.dumps(event).encode("utf-8")).decode("utf-8")})
+                yield encode_event_stream_message(payload.encode("utf-8"))
+
+        return StreamingResponse(frames(), media_type="application/vnd.amazon.eventstream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"calls": client.calls, "tokens": client.tokens, "throttled": client.throttled}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(create_app(), host="0.0.0.0", port=int(os.getenv("FAKE_BEDROCK_PORT", "8090")))
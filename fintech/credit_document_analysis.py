@@ -1,10 +1,11 @@
-import uuid
-import PyPDF2
-import chromadb
 import streamlit as st
 from llm_utils import call_llm
+from pdf_utils import iter_pdf_chunks
+from vector_ingest import sync_documents
+from vector_store import get_collection, delete_collection, query_collection, warm_collections
 
-client = chromadb.PersistentClient(path="/chromadb")
+# Open the collection once per process
+warm_collections(["collection_credit_document"])
 
 
 
@@ -12,54 +13,22 @@ st.header("Credit Document Analysis")
 
 # Button to delete collection
 if st.button('Delete Credit Document Data'):
-    client.delete_collection(name="collection_credit_document")
+    delete_collection("collection_credit_document")
 
 # Button to load data
 if st.button('Load Credit Document Data'):
-    try:
-        collection = client.get_collection(name="collection_credit_document")
-    except Exception as e:  # ChromaDB raises Error if collection doesn't exist
-        collection = client.create_collection(name="collection_credit_document")
+    collection = get_collection("collection_credit_document")
 
-    # Load the PDF file
+    # Load the PDF file and split it in chunks, page by page
     file_path = "./fintech/credit_document.pdf"
-    pdf_reader = PyPDF2.PdfReader(open(file_path, "rb"))
+    text_chunks = list(iter_pdf_chunks(file_path, chunk_size=1024, overlap=128))
 
-    # Extract the text from the PDF
-    pdf_text = ""
-    for page in range(len(pdf_reader.pages)):
-        pdf_text += pdf_reader.pages[page].extract_text()
-        
-    # Function to preprocess the text to normalize encoding
-    def preprocess_text(text):
-        # Convert to UTF-8 and remove non-printable characters
-        text = text.encode('utf-8', errors='ignore').decode('utf-8')
-        text = ''.join(char for char in text if char.isprintable() or char.isspace())
-        # Remove extra whitespace
-        text = ' '.join(text.split())
-        return text
-
-    # Preprocess the text to normalize encoding
-    pdf_text = preprocess_text(pdf_text)
-    # Define the size of the chunks and the number of chunks
-    size_chunk = 1024
-    number_chunks = len(pdf_text)//size_chunk
-
-    # Add the chunks to the collection
-    for index in range(number_chunks):
-        if (index+1)*size_chunk > len(pdf_text):
-            text_chunk = pdf_text[index*size_chunk:len(pdf_text)-1]
-        else:
-            text_chunk = pdf_text[index*size_chunk:(index+1)*size_chunk]
-        collection.add(
-            documents=[text_chunk],
-            ids=[str(uuid.uuid4())]
-        )
-        print("--------------------------------","batch",index,"of",number_chunks-1)
+    # Add the chunks to the collection, reloading the document only embeds the chunks that changed
+    stats = sync_documents(collection, documents=text_chunks, source="credit_document.pdf")
+    st.write(f"Loaded {stats['documents']} chunks: {stats['added']} added, {stats['deleted']} deleted, {stats['unchanged']} unchanged")
 
 def vector_search(query):
-    collection = client.get_collection(name="collection_credit_document")
-    results = collection.query(
+    results = query_collection("collection_credit_document",
         query_texts=query,
         n_results=3,
         include=['documents','distances']
@@ -78,7 +47,9 @@ def query_expansion(query):
     Rewrite the query to be more specific and very relevant to search in the credit document. 
     Use synonyms to expand the query.
     """
-    return call_llm(PROMPT_QUERY_EXPANSION)
+    # The expansions of CREDIT_QUERIES are the same on every run, reuse them from the cache.
+    # Deterministic generation, a cached answer is the one the model gives anyway, not a frozen random sample
+    return call_llm(PROMPT_QUERY_EXPANSION, temperature=0, use_cache=True)
 
 def retrieval_augmentation(query,retrieved_documents):
     PROMPT_RETRIEVAL_AUGMENTATION = f"""
@@ -95,7 +66,7 @@ def retrieval_augmentation(query,retrieved_documents):
     If you don't know the answer, say these is not in the documents. Dont comment about the documents.
     Answer in spanish.
     """
-    return call_llm(PROMPT_RETRIEVAL_AUGMENTATION)
+    return call_llm(PROMPT_RETRIEVAL_AUGMENTATION, temperature=0, use_cache=True)
 
 # st input to ask for a comment
 input_question = st.text_input("Ask a question about the credit document")
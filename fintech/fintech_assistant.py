@@ -1,53 +1,19 @@
 from llm_utils import call_llm
-import uuid
-import chromadb
-import PyPDF2
+from pdf_utils import iter_pdf_chunks
+from vector_ingest import sync_documents
+from vector_store import get_collection, query_collection
 
-client = chromadb.PersistentClient(path="/chromadb")
-#client.delete_collection(name="collection_fintech")
+#delete_collection("collection_fintech")
 
-try:
-    collection = client.get_collection(name="collection_fintech")
-except Exception as e:  # ChromaDB raises Error if collection doesn't exist
-    collection = client.create_collection(name="collection_fintech")
+collection = get_collection("collection_fintech")
 
 
-# Load the PDF file
+# Load the PDF file and split it in chunks, page by page
 file_path = "./fintech/fintech_assistant.pdf"
-pdf_reader = PyPDF2.PdfReader(open(file_path, "rb"))
+text_chunks = list(iter_pdf_chunks(file_path, chunk_size=256, overlap=32))
 
-# Extract the text from the PDF
-pdf_text = ""
-for page in range(len(pdf_reader.pages)):
-    pdf_text += pdf_reader.pages[page].extract_text()
-    
-# Function to preprocess the text to normalize encoding
-def preprocess_text(text):
-    # Convert to UTF-8 and remove non-printable characters
-    text = text.encode('utf-8', errors='ignore').decode('utf-8')
-    text = ''.join(char for char in text if char.isprintable() or char.isspace())
-    # Remove extra whitespace
-    text = ' '.join(text.split())
-    return text
-
-# Preprocess the text to normalize encoding
-pdf_text = preprocess_text(pdf_text)
-
-# Define the size of the chunks and the number of chunks
-size_chunk = 256
-number_chunks = len(pdf_text)//size_chunk
-
-# Add the chunks to the collection
-for index in range(number_chunks):
-    if (index+1)*size_chunk > len(pdf_text):
-        text_chunk = pdf_text[index*size_chunk:len(pdf_text)-1]
-    else:
-        text_chunk = pdf_text[index*size_chunk:(index+1)*size_chunk]
-    collection.add(
-        documents=[text_chunk],
-        ids=[str(uuid.uuid4())]
-    )
-    print("--------------------------------","batch",index,"of",number_chunks-1)
+# Add the chunks to the collection, running the script again only embeds the chunks that changed
+sync_documents(collection, documents=text_chunks, source="fintech_assistant.pdf")
 
 # Define the input prompt of the user   
 input_prompt = "Como puedo cambiar mi contraseña?"
@@ -58,7 +24,7 @@ new_question = call_llm(query_expansion)
 print(new_question)
 # Retrieve the documents from the collection based on the questions
 
-results = collection.query(
+results = query_collection("collection_fintech",
     query_texts=new_question,
     n_results=2,
     include=['documents']
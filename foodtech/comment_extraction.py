@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Tuple
+
+from llm_utils import call_llm
+
+ANALYSIS_FIELDS = ["general_satisfied", "like_food", "like_service", "like_ambiance", "like_price", "like_location"]
+
+PROMPT_ANALYSIS = """
+    Analyze the following user comment for a restaurant:
+    {comment}
+
+    Your task is to extract the following information:
+    - general_satisfied (true/false)\
+    - like_food (true/false)\
+    - like_service (true/false)\
+    - like_ambiance (true/false)\
+    - like_price (true/false)\
+    - like_location (true/false)\
+
+    Return the information in the following formatJSON example:
+    {{
+        "general_satisfied": true,
+        "like_food": true,
+        "like_service": true,
+        "like_ambiance": false,
+        "like_price": true,
+        "like_location": false
+    }}
+    Do not include any other text than the JSON.
+    """
+
+PROMPT_BATCH_ANALYSIS = """
+    Analyze each of the following user comments for a restaurant. Each comment has an id:
+    {comments}
+
+    For every comment extract the following information:
+    - general_satisfied (true/false)\
+    - like_food (true/false)\
+    - like_service (true/false)\
+    - like_ambiance (true/false)\
+    - like_price (true/false)\
+    - like_location (true/false)\
+
+    Return one entry per comment id in the following format JSON example:
+    {{
+        "0": {{
+            "general_satisfied": true,
+            "like_food": true,
+            "like_service": true,
+            "like_ambiance": false,
+            "like_price": true,
+            "like_location": false
+        }}
+    }}
+    Analyze every comment on its own. Do not include any other text than the JSON.
+    """
+
+
+def validate_analysis(analysis) -> bool:
+    """Check that an analysis has exactly the expected fields, all booleans."""
+    return (
+        isinstance(analysis, dict)
+        and set(analysis) == set(ANALYSIS_FIELDS)
+        and all(isinstance(analysis[field], bool) for field in ANALYSIS_FIELDS)
+    )
+
+
+def _parse_json(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+def _valid_analysis_text(text: str) -> bool:
+    return validate_analysis(_parse_json(text))
+
+
+def _valid_batch_text(text: str) -> bool:
+    response = _parse_json(text)
+    return isinstance(response, dict) and bool(response) and all(validate_analysis(analysis) for analysis in response.values())
+
+
+def analysis_comment(comment: str) -> dict:
+    # Identical comments get the same analysis, reuse it from the cache. Only valid analyses are
+    # cached, a retry asks the model again instead of getting the same invalid answer
+    return json.loads(call_llm(PROMPT_ANALYSIS.format(comment=comment), temperature=0, use_cache=True, cache_if=_valid_analysis_text))
+
+
+def analysis_comments_batch(comments: List[Tuple[str, str]]) -> Dict[str, dict]:
+    """
+    Analyze several comments with a single LLM call.
+
+    :param comments: List of (row_id, comment).
+    :return: The analysis of each row_id found in the response.
+    """
+    if len(comments) == 1:
+        row_id, comment = comments[0]
+        return {row_id: analysis_comment(comment)}
+    comments_text = "\n".join(f'<comment id="{row_id}">{comment}</comment>' for row_id, comment in comments)
+    response = json.loads(call_llm(PROMPT_BATCH_ANALYSIS.format(comments=comments_text), temperature=0, use_cache=True, cache_if=_valid_batch_text))
+    return {str(row_id): analysis for row_id, analysis in response.items()}
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces out calls to at most `rate` per second."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self._next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+def _comment_hash(comment: str) -> str:
+    return hashlib.sha256(comment.encode("utf-8")).hexdigest()
+
+
+def load_checkpoint(checkpoint_path: str) -> Dict[str, dict]:
+    """
+    Read the analyses already written to the JSONL checkpoint.
+
+    :return: Mapping of row_id to {"comment_hash": ..., "analysis": ...}.
+    """
+    done = {}
+    if not os.path.exists(checkpoint_path):
+        return done
+    with open(checkpoint_path, "r") as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run interrupted in the middle of a write leaves a partial last line
+                continue
+            done[record["row_id"]] = record
+    return done
+
+
+def pack_batches(rows: List[Tuple[str, str]], batch_size: int, max_batch_chars: int) -> List[List[Tuple[str, str]]]:
+    """
+    Group rows in batches of at most batch_size comments and max_batch_chars characters.
+    A comment longer than max_batch_chars goes alone in its batch.
+    """
+    batches, batch, batch_chars = [], [], 0
+    for row in rows:
+        comment_chars = len(row[1])
+        if batch and (len(batch) >= batch_size or batch_chars + comment_chars > max_batch_chars):
+            batches.append(batch)
+            batch, batch_chars = [], 0
+        batch.append(row)
+        batch_chars += comment_chars
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def extract_comments(
+    comments: List[str],
+    checkpoint_path: str = "./foodtech/data_response.jsonl",
+    batch_size: int = 10,
+    max_batch_chars: int = 4000,
+    max_workers: int = 4,
+    requests_per_second: float = 5,
+    max_retries: int = 3,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+) -> Tuple[List[dict], List[int]]:
+    """
+    Analyze every comment, resuming from the checkpoint of a previous run.
+
+    The first pass packs several comments per prompt. Rows that fail (LLM error, invalid JSON or
+    an analysis that does not match the schema) are retried one comment per prompt.
+
+    :param comments: The comments to analyze, one per CSV row.
+    :param checkpoint_path: JSONL file where each valid analysis is appended as soon as it is ready.
+    :param batch_size: Maximum number of comments per prompt.
+    :param max_batch_chars: Maximum characters of comments per prompt.
+    :param max_workers: Number of LLM calls in parallel.
+    :param requests_per_second: Maximum LLM calls per second.
+    :param max_retries: Number of retries of the failed rows.
+    :param progress_callback: Called with (rows_done, total_rows) from the calling thread.
+    :return: The analyses in row order and the indexes of the rows that still failed.
+    """
+    rows = [(str(index), comment) for index, comment in enumerate(comments)]
+    hashes = {row_id: _comment_hash(comment) for row_id, comment in rows}
+
+    # Reuse the analyses of the checkpoint whose comment did not change
+    results = {
+        row_id: record["analysis"]
+        for row_id, record in load_checkpoint(checkpoint_path).items()
+        if hashes.get(row_id) == record.get("comment_hash") and validate_analysis(record.get("analysis"))
+    }
+    pending = [row for row in rows if row[0] not in results]
+    if progress_callback:
+        progress_callback(len(results), len(rows))
+
+    limiter = RateLimiter(requests_per_second)
+
+    def run_batch(batch):
+        limiter.acquire()
+        return analysis_comments_batch(batch)
+
+    with open(checkpoint_path, "a") as checkpoint, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for attempt in range(max_retries + 1):
+            if not pending:
+                break
+            # Retries go one comment per prompt so a bad row can't fail its neighbours again
+            batches = pack_batches(pending, batch_size if attempt == 0 else 1, max_batch_chars)
+            futures = {executor.submit(run_batch, batch): batch for batch in batches}
+            failed = []
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    response = future.result()
+                except Exception as e:
+                    print(f"Error analyzing rows {[row_id for row_id, _ in batch]}: {e}")
+                    response = {}
+                for row_id, _ in batch:
+                    analysis = response.get(row_id)
+                    if not validate_analysis(analysis):
+                        failed.append((row_id, comments[int(row_id)]))
+                        continue
+                    results[row_id] = analysis
+                    checkpoint.write(json.dumps({"row_id": row_id, "comment_hash": hashes[row_id], "analysis": analysis}) + "\n")
+                checkpoint.flush()
+                if progress_callback:
+                    progress_callback(len(results), len(rows))
+            pending = sorted(failed, key=lambda row: int(row[0]))
+
+    analyses = [results[row_id] for row_id, _ in rows if row_id in results]
+    failed_rows = [int(row_id) for row_id, _ in pending]
+    return analyses, failed_rows
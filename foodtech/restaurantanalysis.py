@@ -1,80 +1,60 @@
 import os
-import uuid
 import pandas as pd
-import chromadb
 import streamlit as st
 import json
-from llm_utils import call_llm
+from foodtech.comment_extraction import extract_comments
+from vector_ingest import sync_documents
+from vector_store import get_collection, delete_collection, query_collection, warm_collections
 
-client = chromadb.PersistentClient(path="/chromadb")
-
-def analysis_comment(comment):
-    PROMPT_ANALYSIS = """
-    Analyze the following user comment for a restaurant:
-    {comment}   
-
-    Your task is to extract the following information:
-    - general_satisfied (true/false)\
-    - like_food (true/false)\
-    - like_service (true/false)\
-    - like_ambiance (true/false)\
-    - like_price (true/false)\
-    - like_location (true/false)\
-
-    Return the information in the following formatJSON example:
-    {{
-        "general_satisfied": true,
-        "like_food": true,
-        "like_service": true,
-        "like_ambiance": false,
-        "like_price": true,
-        "like_location": false
-    }}
-    Do not include any other text than the JSON.
-    """
-    return json.loads(call_llm(PROMPT_ANALYSIS.format(comment=comment)))
+# Open the collection once per process
+warm_collections(["collection_restaurant"])
 
 st.header("Restaurant Analysis")
 
 
 # Button to delete collection
 if st.button('Delete Restaurant Data'):
-    client.delete_collection(name="collection_restaurant")
+    delete_collection("collection_restaurant")
     
 
 # Button to load data
 if st.button('Load Restaurant Data'):
-    try:
-        collection = client.get_collection(name="collection_restaurant")
-    except Exception as e:  # ChromaDB raises Error if collection doesn't exist
-        collection = client.create_collection(name="collection_restaurant")
+    collection = get_collection("collection_restaurant")
 
     df = pd.read_csv('./foodtech/restaurantdata.csv')
     # where column head is comment
     data = df[df.columns[9]].to_list()
     st.write(data)
-    for item in data:
-        # save in collection each comment
-        collection.add(
-            documents=[item],
-            ids=[str(uuid.uuid4())]
-        )
+    # save in collection each comment with its order id, only new or changed comments are embedded
+    order_ids = df[df.columns[0]].to_list()
+    stats = sync_documents(
+        collection,
+        documents=data,
+        metadatas=[{"order_id": str(order_id)} for order_id in order_ids],
+        source="restaurantdata.csv"
+    )
+    st.write(f"Saved {stats['documents']} comments: {stats['added']} added, {stats['deleted']} deleted, {stats['unchanged']} unchanged")
     if not os.path.exists('./foodtech/data_response.json'):
-        data_response = []
-        for item in data:
-            analysis = analysis_comment(item)
-            data_response.append(analysis)
-        # save data_response in a file
-        with open('./foodtech/data_response.json', 'w') as f:
-            json.dump(data_response, f)
+        # Analyses are checkpointed in data_response.jsonl, an interrupted load resumes where it stopped
+        progress = st.progress(0.0, text="Analyzing comments")
+        data_response, failed_rows = extract_comments(
+            data,
+            checkpoint_path='./foodtech/data_response.jsonl',
+            progress_callback=lambda done, total: progress.progress(done / total if total else 1.0, text=f"Analyzed {done} of {total} comments")
+        )
+        if failed_rows:
+            st.warning(f"Could not analyze rows {failed_rows}, load the data again to retry them")
+        else:
+            # save data_response in a file
+            with open('./foodtech/data_response.json', 'w') as f:
+                json.dump(data_response, f)
 
 # st input to ask for a comment
 ask_comment = st.text_input("Find data in comments")
 
 # if comment is not empty, find in collection
 if ask_comment:
-    collection = client.get_collection(name="collection_restaurant")
-    results = collection.query(
+    results = query_collection("collection_restaurant",
         query_texts=ask_comment,
         n_results=5,
         include=['documents']
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence
+
+import redis
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+# Opt-in cache of LLM responses. Set LLM_CACHE_ENABLED=true to cache every call_llm*
+# call, or pass use_cache=True on the calls that are safe to cache.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+LLM_CACHE_MAX_SIZE = int(os.getenv("LLM_CACHE_MAX_SIZE", "1024"))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_REDIS_URL = os.getenv("LLM_CACHE_REDIS_URL", os.getenv("REDIS_URL"))
+LLM_CACHE_PREFIX = "llm_cache:"
+
+
+def make_cache_key(model_id: str, request: Any) -> str:
+    """
+    Content-addressed key of an LLM call.
+
+    :param model_id: The model that answers the request.
+    :param request: The request body (prompt/messages, temperature, max_tokens...).
+    :return: A sha256 hex digest.
+    """
+    payload = json.dumps({"model_id": model_id, "request": request}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Thread-safe in-memory LRU with a time to live per entry."""
+
+    def __init__(self, max_size: int = LLM_CACHE_MAX_SIZE, ttl: int = LLM_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ResponseCache:
+    """
+    Two tier cache: in-memory LRU in front of a Redis instance shared by every process
+    (API, Celery workers and Streamlit apps).
+    """
+
+    def __init__(self, max_size: int = LLM_CACHE_MAX_SIZE, ttl: int = LLM_CACHE_TTL, redis_url: Optional[str] = LLM_CACHE_REDIS_URL):
+        self.memory = LRUCache(max_size=max_size, ttl=ttl)
+        self.ttl = ttl
+        self.redis = redis.Redis.from_url(redis_url, socket_timeout=1) if redis_url else None
+        self._metrics = {"memory_hits": 0, "redis_hits": 0, "misses": 0, "writes": 0, "redis_errors": 0}
+        self._lock = threading.Lock()
+
+    def _count(self, metric: str):
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.redis is not None:
+            try:
+                value = self.redis.get(LLM_CACHE_PREFIX + key)
+            except redis.RedisError as e:
+                print(f"LLM cache redis error: {e}")
+                self._count("redis_errors")
+                value = None
+            if value is not None:
+                value = value.decode("utf-8")
+                self.memory.set(key, value)
+                self._count("redis_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: str):
+        self.memory.set(key, value)
+        self._count("writes")
+        if self.redis is not None:
+            try:
+                self.redis.set(LLM_CACHE_PREFIX + key, value, ex=self.ttl)
+            except redis.RedisError as e:
+                print(f"LLM cache redis error: {e}")
+                self._count("redis_errors")
+
+    def clear(self):
+        self.memory.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        lookups = metrics["memory_hits"] + metrics["redis_hits"] + metrics["misses"]
+        metrics["hit_rate"] = (metrics["memory_hits"] + metrics["redis_hits"]) / lookups if lookups else 0.0
+        metrics["memory_size"] = len(self.memory)
+        return metrics
+
+
+response_cache = ResponseCache()
+
+
+def get_cache_metrics() -> Dict[str, Any]:
+    return response_cache.metrics()
+
+
+class LangChainResponseCache(BaseCache):
+    """
+    Adapter so ChatBedrock models (retail and proptech agents) share the same cache,
+    e.g. ChatBedrock(..., cache=LangChainResponseCache()).
+    """
+
+    def __init__(self, cache: ResponseCache = response_cache):
+        self.cache = cache
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Any]]:
+        value = self.cache.get(make_cache_key(llm_string, prompt))
+        if value is None:
+            return None
+        return [loads(generation) for generation in json.loads(value)]
+
+    def update(self, prompt: str, llm_string: str, return_val: Sequence[Any]) -> None:
+        self.cache.set(make_cache_key(llm_string, prompt), json.dumps([dumps(generation) for generation in return_val]))
+
+    def clear(self, **kwargs: Any) -> None:
+        self.cache.clear()
@@ -1,28 +1,112 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable, Iterator
+import asyncio
+import functools
 import json
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 import boto3
 from botocore.config import Config
+from llm_cache import LLM_CACHE_ENABLED, make_cache_key, response_cache
+from chat_history import history_manager
+from prompt_cache import cacheable_blocks, track_usage
+
+# Maximum number of generations in flight per process for the async acall_llm* functions
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "100"))
 
 # Configure the Bedrock client with a custom timeout
 bedrock_config = Config(
     read_timeout=120,  # Increase the read timeout to 120 seconds
-    connect_timeout=10  # Increase the connect timeout if needed
+    connect_timeout=10,  # Increase the connect timeout if needed
+    max_pool_connections=LLM_MAX_CONCURRENCY  # Shared connection pool, one connection per generation in flight
 )
+# Provider for the runtime: "bedrock", "fake" (in-process stand-in) or "fake_http" (local fake server)
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "bedrock")
+FAKE_BEDROCK_URL = os.getenv("FAKE_BEDROCK_URL", "http://localhost:8090")
+# Claude model of call_llm* and of the retail and proptech agents. Prompt caching needs a model that
+# supports it on Bedrock, e.g. us.anthropic.claude-3-5-haiku-20241022-v1:0
+CLAUDE_MODEL_ID = os.getenv("CLAUDE_MODEL_ID", "anthropic.claude-3-haiku-20240307-v1:0")
+
+def get_bedrock_client(provider: Optional[str] = None):
+    """
+    Build the runtime client used to call the models.
+    
+    :param provider: "bedrock", "fake" or "fake_http". Defaults to the LLM_PROVIDER env variable.
+    :return: A client exposing invoke_model like boto3's bedrock-runtime client.
+    """
+    provider = provider or LLM_PROVIDER
+    # Every client records the cached and uncached input tokens of its calls
+    if provider == "bedrock":
+        return track_usage(boto3.client('bedrock-runtime', config=bedrock_config))
+    if provider == "fake":
+        from fake_bedrock import FakeBedrockClient
+        return track_usage(FakeBedrockClient())
+    if provider == "fake_http":
+        # Same boto3 client, pointed to the fake server. It still signs requests, so dummy credentials are enough
+        return track_usage(boto3.client(
+            'bedrock-runtime',
+            config=bedrock_config,
+            endpoint_url=FAKE_BEDROCK_URL,
+            region_name=os.getenv("AWS_DEFAULT_REGION", "us-east-1"),
+            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID", "fake"),
+            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY", "fake")
+        ))
+    raise ValueError(f"Unknown LLM provider: {provider}")
+
 # Runtime for call models
-bedrock = boto3.client('bedrock-runtime',config=bedrock_config)
+bedrock = get_bedrock_client()
 
-def call_llm(prompt: str, max_tokens: int = 40000, temperature: float = 0.9) -> List[Dict[str, Any]]:
+def set_bedrock_client(client):
+    """
+    Replace the runtime client used by every call_llm* function, e.g. with a FakeBedrockClient in benchmarks.
+    """
+    global bedrock
+    bedrock = track_usage(client)
+
+def _invoke_claude(request: Dict[str, Any], use_cache: Optional[bool] = None, cache_if: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    Call CLAUDE_MODEL_ID with a messages request body, going through the response cache when enabled.
+    
+    :param request: The request body without the anthropic_version.
+    :param use_cache: Cache the response. Defaults to the LLM_CACHE_ENABLED env variable.
+    :param cache_if: Only cache the responses it accepts, e.g. the ones that parse, so a retry doesn't get a bad response again.
+    :return: A text response.
+    """
+    model_id = CLAUDE_MODEL_ID
+    if use_cache is None:
+        use_cache = LLM_CACHE_ENABLED
+    cache_key = make_cache_key(model_id, request) if use_cache else None
+    if cache_key:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    # Call the Bedrock API with Claude 3 Haiku model
+    response = bedrock.invoke_model(
+        modelId=model_id,
+        body=json.dumps({"anthropic_version": "bedrock-2023-05-31", **request})
+    )
+
+    # Parse the response
+    response_body = json.loads(response['body'].read())
+    text = response_body['content'][0]['text']
+    if cache_key and (cache_if is None or cache_if(text)):
+        response_cache.set(cache_key, text)
+    return text
+
+def call_llm(prompt: str, max_tokens: int = 40000, temperature: float = 0.9, use_cache: Optional[bool] = None, cache_if: Optional[Callable[[str], bool]] = None) -> List[Dict[str, Any]]:
     """
     Generate text using the Claude 3 Haiku model via Amazon Bedrock.
     
     :param prompt: The input text to generate a continuation for.
     :param max_tokens: The maximum number of tokens to generate.
     :param temperature: Controls randomness in generation. Higher values make output more random.
+    :param use_cache: Reuse the response of an identical previous call. Defaults to the LLM_CACHE_ENABLED env variable.
+    :param cache_if: Only cache the responses it accepts.
     :return: A text response.
     """
     # Prepare the request body for Claude 3 Haiku
-    request_body = json.dumps({
-        "anthropic_version": "bedrock-2023-05-31",
+    request_body = {
         "max_tokens": max_tokens,
         "messages": [
             {
@@ -31,47 +115,63 @@ def call_llm(prompt: str, max_tokens: int = 40000, temperature: float = 0.9) ->
             }
         ],
         "temperature": temperature
-    })
-    # Call the Bedrock API with Claude 3 Haiku model
-    response = bedrock.invoke_model(
-        modelId='anthropic.claude-3-haiku-20240307-v1:0',  # Use the appropriate model ID for Claude
-        body=request_body
-    )
+    }
+    return _invoke_claude(request_body, use_cache=use_cache, cache_if=cache_if)
 
-    # Parse the response
-    response_body = json.loads(response['body'].read())
-    return response_body['content'][0]['text']
+def _with_history(prompt: str, messages: List[dict]) -> List[dict]:
+    # The prompt goes first, then the recent history. Older turns are summarized after the prompt,
+    # out of its cache point, so the prompt prefix stays cached while the summary changes
+    recent, summary, _ = history_manager.trim(messages)
+    summary_text = f"Summary of the earlier conversation:\n{summary}" if summary else ""
+    return [{"role": "user", "content": cacheable_blocks(prompt, summary_text)}] + recent
 
-def call_llm_with_history_messages(prompt: str, messages: List[dict], max_tokens: int = 40000, temperature: float = 0.9) -> List[Dict[str, Any]]:
+def call_llm_with_history_messages(prompt: str, messages: List[dict], max_tokens: int = 40000, temperature: float = 0.9, use_cache: Optional[bool] = None) -> List[Dict[str, Any]]:
     """
     Generate text using the Claude 3 Haiku model via Amazon Bedrock.
     
     :param prompt: The input text to generate a continuation for.
     :param max_tokens: The maximum number of tokens to generate.
     :param temperature: Controls randomness in generation. Higher values make output more random.
+    :param use_cache: Reuse the response of an identical previous call. Defaults to the LLM_CACHE_ENABLED env variable.
     :return: A text response.
     """
-    # Prepare the request body for Claude 3 Haiku
+    # Prepare the request body for Claude 3 Haiku, with the history reduced to the token budget
+    request_body = {
+        "max_tokens": max_tokens,
+        "messages": _with_history(prompt, messages),
+        "temperature": temperature
+    }
+    return _invoke_claude(request_body, use_cache=use_cache)
+
+def call_llm_stream(prompt: str, messages: Optional[List[dict]] = None, max_tokens: int = 40000, temperature: float = 0.9) -> Iterator[str]:
+    """
+    Generate text using the Claude 3 Haiku model via Amazon Bedrock, yielding the text as it is generated.
+    
+    :param prompt: The input text to generate a continuation for.
+    :param messages: Optional history messages sent after the prompt, like call_llm_with_history_messages.
+    :param max_tokens: The maximum number of tokens to generate.
+    :param temperature: Controls randomness in generation. Higher values make output more random.
+    :return: An iterator of text deltas.
+    """
     request_body = json.dumps({
         "anthropic_version": "bedrock-2023-05-31",
         "max_tokens": max_tokens,
-        "messages": [
-            {
-                "role": "user",
-                "content": f"{prompt}"
-            }
-        ] + messages ,
+        "messages": _with_history(prompt, messages or []),
         "temperature": temperature
     })
-    # Call the Bedrock API with Claude 3 Haiku model
-    response = bedrock.invoke_model(
-        modelId='anthropic.claude-3-haiku-20240307-v1:0',  # Use the appropriate model ID for Claude
+    response = bedrock.invoke_model_with_response_stream(
+        modelId=CLAUDE_MODEL_ID,
         body=request_body
     )
-
-    # Parse the response
-    response_body = json.loads(response['body'].read())
-    return response_body['content'][0]['text']
+    # Each chunk is an Anthropic streaming event, only the text deltas are returned
+    for event in response['body']:
+        chunk = event.get('chunk')
+        if not chunk:
+            continue
+        data = json.loads(chunk['bytes'])
+        # The token usage of the stream is recorded by prompt_cache.track_usage
+        if data['type'] == 'content_block_delta' and data['delta']['type'] == 'text_delta':
+            yield data['delta']['text']
 
 def call_llm_analyze_images(prompt: str, images: Optional[List[str]], max_tokens: int = 8192, temperature: float = 0) -> List[Dict[str, Any]]:
     """
@@ -167,6 +267,76 @@ def call_llm_using_trained_model(prompt: str, max_tokens: int = 4096, temperatur
     return response_body["generations"][0]["text"]
 
 
+# Async variants. boto3 is blocking, so the calls run in a shared thread pool that reuses
+# the client connection pool, and an asyncio.Semaphore bounds the generations in flight.
+_llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm")
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    # One semaphore per event loop (FastAPI loop, asyncio.run inside Celery tasks...)
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        _llm_semaphores[loop] = semaphore
+    return semaphore
+
+async def _run_llm_async(func: Callable, *args, timeout: Optional[float] = None, **kwargs):
+    """
+    Run a blocking call_llm* function without blocking the event loop.
+    
+    :param func: The blocking function to run.
+    :param timeout: Seconds to wait before cancelling with asyncio.TimeoutError.
+    :return: The result of the function.
+    """
+    async with _get_llm_semaphore():
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(_llm_executor, functools.partial(func, *args, **kwargs))
+        # When the awaiting task is cancelled the slot is released right away, the result of the
+        # Bedrock request still running in the pool is discarded.
+        return await asyncio.wait_for(future, timeout)
+
+async def acall_llm(prompt: str, max_tokens: int = 40000, temperature: float = 0.9, use_cache: Optional[bool] = None, timeout: Optional[float] = None) -> str:
+    """
+    Async version of call_llm.
+    
+    :param timeout: Seconds to wait for the generation before cancelling it.
+    """
+    return await _run_llm_async(call_llm, prompt, max_tokens=max_tokens, temperature=temperature, use_cache=use_cache, timeout=timeout)
+
+async def acall_llm_with_history_messages(prompt: str, messages: List[dict], max_tokens: int = 40000, temperature: float = 0.9, use_cache: Optional[bool] = None, timeout: Optional[float] = None) -> str:
+    """
+    Async version of call_llm_with_history_messages.
+    
+    :param timeout: Seconds to wait for the generation before cancelling it.
+    """
+    return await _run_llm_async(call_llm_with_history_messages, prompt, messages, max_tokens=max_tokens, temperature=temperature, use_cache=use_cache, timeout=timeout)
+
+async def acall_llm_analyze_images(prompt: str, images: Optional[List[str]], max_tokens: int = 8192, temperature: float = 0, timeout: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Async version of call_llm_analyze_images.
+    
+    :param timeout: Seconds to wait for the generation before cancelling it.
+    """
+    return await _run_llm_async(call_llm_analyze_images, prompt, images, max_tokens=max_tokens, temperature=temperature, timeout=timeout)
+
+async def acall_llm_to_generate_image(prompt: str, timeout: Optional[float] = None, **kwargs) -> str:
+    """
+    Async version of call_llm_to_generate_image. Extra keyword arguments are passed to it.
+    
+    :param timeout: Seconds to wait for the generation before cancelling it.
+    """
+    return await _run_llm_async(call_llm_to_generate_image, prompt, timeout=timeout, **kwargs)
+
+async def acall_llm_using_trained_model(prompt: str, max_tokens: int = 4096, temperature: float = 0.9, model_id: str = "cohere.command-light-text-v14", timeout: Optional[float] = None) -> str:
+    """
+    Async version of call_llm_using_trained_model.
+    
+    :param timeout: Seconds to wait for the generation before cancelling it.
+    """
+    return await _run_llm_async(call_llm_using_trained_model, prompt, max_tokens=max_tokens, temperature=temperature, model_id=model_id, timeout=timeout)
+
+
 def list_tuned_models():
     bedrock_client = boto3.client(service_name="bedrock",config=bedrock_config)
     models = []
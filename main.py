@@ -1,9 +1,27 @@
+import asyncio
+import json
+import uuid
 from fastapi import Depends, FastAPI,HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from sqlmodel import Session
 from database import create_db_and_tables, get_session
-from models import PersonDataRequest, Person
+from typing import Optional
+from models import PersonDataRequest, Person, GenerateRequest, ChatRequest, VideoRequest, BulkGenerateRequest
 import crud
+from llm_cache import get_cache_metrics
+from embedding_cache import get_embedding_cache_metrics
+from vector_store import get_vector_store_metrics, warm_collections
+from retail.intent_router import get_intent_router_metrics
+from retail.product_index import get_product_index_metrics
+from retail.order_store import get_order_store_metrics
+from proptech.property_repository import get_property_repository_metrics
+from chat_history import get_history_metrics
+from prompt_cache import get_prompt_cache_metrics
+from chat_service import CHAT_GRAPHS, ChatBusyError, configure_executor, get_chat_metrics, run_turn, stream_turn
+from llm_utils import acall_llm, call_llm_stream
+from video_jobs import get_video_job, submit_video_job
+from celery.result import AsyncResult
+from tasks import app as celery_app, bulk_generate, LLM_BULK_CHUNK_SIZE
 from fastapi.middleware.cors import CORSMiddleware
 
 
@@ -22,11 +40,166 @@ app.add_middleware(
 @app.on_event("startup")
 def on_startup():
     create_db_and_tables()
+    # Open the Chroma collections and load the embedding model before the first request
+    warm_collections()
+
+@app.on_event("startup")
+async def on_startup_chat():
+    # The chat turns run their blocking nodes in the loop executor, sized for CHAT_MAX_CONCURRENCY
+    configure_executor()
 
 @app.get("/")
 async def root():
     return {"message": "Hola, mundo!"}
 
+@app.get("/metrics/llm-cache")
+async def llm_cache_metrics():
+    return get_cache_metrics()
+
+@app.get("/metrics/embedding-cache")
+async def embedding_cache_metrics():
+    return get_embedding_cache_metrics()
+
+@app.get("/metrics/vector-store")
+async def vector_store_metrics():
+    return get_vector_store_metrics()
+
+@app.get("/metrics/intent-router")
+async def intent_router_metrics():
+    return get_intent_router_metrics()
+
+@app.get("/metrics/product-index")
+async def product_index_metrics():
+    return get_product_index_metrics()
+
+@app.get("/metrics/order-store")
+async def order_store_metrics():
+    return get_order_store_metrics()
+
+@app.get("/metrics/property-repository")
+async def property_repository_metrics():
+    return get_property_repository_metrics()
+
+@app.get("/metrics/history")
+async def history_metrics():
+    return get_history_metrics()
+
+@app.get("/metrics/prompt-cache")
+async def prompt_cache_metrics():
+    return get_prompt_cache_metrics()
+
+@app.get("/metrics/chat")
+async def chat_metrics():
+    return get_chat_metrics()
+
+@app.get("/orders")
+def list_orders(email: Optional[str] = None, limit: int = 100, offset: int = 0, session: Session = Depends(get_session)):
+    return crud.list_orders(session, email=email, limit=limit, offset=offset)
+
+@app.get("/orders/{order_id}")
+def read_order(order_id: str, session: Session = Depends(get_session)):
+    return crud.read_order(session, order_id)
+
+@app.post("/generate")
+async def generate(request: GenerateRequest):
+    # Runs in the shared LLM pool, the event loop keeps serving other requests meanwhile
+    try:
+        text = await acall_llm(
+            request.prompt,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature,
+            timeout=request.timeout
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="LLM generation timed out")
+    return {"text": text}
+
+@app.post("/generate/stream")
+async def generate_stream(request: GenerateRequest):
+    def events():
+        # Server-sent events, one per text delta. Starlette iterates this sync generator in a thread pool
+        try:
+            for text in call_llm_stream(request.prompt, max_tokens=request.max_tokens, temperature=request.temperature):
+                yield f"data: {json.dumps({'text': text})}\n\n"
+        except Exception as e:
+            print(e, "error in stream")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+@app.post("/generate/bulk", status_code=202)
+def generate_bulk(request: BulkGenerateRequest):
+    # Chunks of prompts fanned out to the text workers, poll GET /generate/bulk/{id} for the answers
+    if not request.prompts:
+        raise HTTPException(status_code=422, detail="No prompts")
+    result = bulk_generate(request.prompts, chunk_size=request.chunk_size or LLM_BULK_CHUNK_SIZE)
+    return {"id": result.id, "status": "PENDING", "prompts": len(request.prompts)}
+
+@app.get("/generate/bulk/{job_id}")
+def read_generate_bulk(job_id: str):
+    result = AsyncResult(job_id, app=celery_app)
+    job = {"id": job_id, "status": result.state}
+    if result.state == "SUCCESS":
+        job["results"] = result.result
+    elif result.state == "FAILURE":
+        job["error"] = str(result.result)
+    return job
+
+@app.post("/chat/{agent}")
+async def chat(agent: str, request: ChatRequest):
+    if agent not in CHAT_GRAPHS:
+        raise HTTPException(status_code=404, detail=f"Unknown chat {agent}")
+    try:
+        return await run_turn(agent, request.message, session_id=request.session_id)
+    except ChatBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Chat turn timed out")
+
+@app.post("/chat/{agent}/stream")
+async def chat_stream(agent: str, request: ChatRequest):
+    if agent not in CHAT_GRAPHS:
+        raise HTTPException(status_code=404, detail=f"Unknown chat {agent}")
+    session_id = request.session_id or str(uuid.uuid4())
+
+    async def events():
+        # Server-sent events like /generate/stream, the done event carries the session_id to continue the conversation.
+        # A reset event replaces the text shown so far: the model wrote text and then called a tool
+        try:
+            async for event, text in stream_turn(agent, request.message, session_id):
+                if event == "reset":
+                    yield f"event: reset\ndata: {json.dumps({'text': text})}\n\n"
+                else:
+                    yield f"data: {json.dumps({'text': text})}\n\n"
+        except ChatBusyError as e:
+            yield f"event: error\ndata: {json.dumps({'detail': str(e), 'status': 503})}\n\n"
+        except asyncio.TimeoutError:
+            yield f"event: error\ndata: {json.dumps({'detail': 'Chat turn timed out', 'status': 504})}\n\n"
+        except Exception as e:
+            print(e, "error in chat stream")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        yield f"event: done\ndata: {json.dumps({'session_id': session_id})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"X-Session-Id": session_id})
+
+@app.post("/videos", status_code=202)
+def create_video(request: VideoRequest):
+    # Generated by a Celery worker, poll GET /videos/{id} for the progress
+    return {"id": submit_video_job(request.prompt, request.age_group), "status": "PENDING"}
+
+@app.get("/videos/{job_id}")
+def read_video(job_id: str):
+    return get_video_job(job_id)
+
+@app.get("/videos/{job_id}/file")
+def download_video(job_id: str):
+    job = get_video_job(job_id)
+    path = job.get("result", {}).get("path")
+    if job["status"] != "SUCCESS" or not path:
+        raise HTTPException(status_code=404, detail=f"Video {job_id} is not ready or was uploaded to S3")
+    return FileResponse(path, media_type="video/mp4", filename=f"{job_id}.mp4")
+
 @app.post("/create-person")
 async def create_person(
     request: PersonDataRequest,
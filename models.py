@@ -1,7 +1,9 @@
-from sqlmodel import SQLModel, Field
+from sqlmodel import SQLModel, Field, Column, JSON
+from sqlalchemy import Index, UniqueConstraint
+from sqlalchemy.orm import registry
 from datetime import datetime
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class Person(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -15,9 +17,73 @@ class Person(SQLModel, table=True):
     class Config:
         arbitrary_types_allowed = True
         
+class Order(SQLModel, table=True):
+    __tablename__ = "orders"
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    order_id: str = Field(index=True, unique=True)
+    email: str = Field(index=True)
+    product: str
+    quantity: int
+    total: float
+    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+class PropertyModel(SQLModel, registry=registry()):
+    # Own metadata: the property tables live in the PROPERTY_DB_URL database of the proptech
+    # repository, create_db_and_tables and alembic only manage the tables of DATABASE_URL
+    pass
+
+class Property(PropertyModel, table=True):
+    __tablename__ = "properties"
+    # Availability search: city, then status, then price range
+    __table_args__ = (Index("ix_properties_city_key_status_price", "city_key", "status", "price"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    property_id: str = Field(index=True, unique=True)
+    status: str = Field(default="available")
+    address: str
+    city: str
+    # City lowercase and without accents, what the search compares
+    city_key: str
+    state: str
+    zip: str
+    owner: str
+    price: float
+    description: str
+    amenities: List[str] = Field(default_factory=list, sa_column=Column(JSON))
+
+class PropertySlot(PropertyModel, table=True):
+    __tablename__ = "property_slots"
+    # One row per visit slot, the unique index also serves the calendar of a property
+    __table_args__ = (UniqueConstraint("property_id", "slot_time", name="uq_property_slots_property_id_slot_time"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    property_id: str = Field(foreign_key="properties.property_id")
+    slot_time: datetime = Field(index=True)
+    reserved: bool = Field(default=False)
+    reserved_at: Optional[datetime] = None
+
 class PersonDataRequest(BaseModel):
     email: str
     first_name: str
     last_name: str
 
+class GenerateRequest(BaseModel):
+    prompt: str
+    max_tokens: int = 1024
+    temperature: float = 0.9
+    timeout: Optional[float] = None
+
+class ChatRequest(BaseModel):
+    message: str
+    # Conversation to continue, a new one is started when empty
+    session_id: Optional[str] = None
+
+class VideoRequest(BaseModel):
+    prompt: str
+    age_group: str = "6-12"
 
+class BulkGenerateRequest(BaseModel):
+    prompts: List[str]
+    # Prompts per Celery task, LLM_BULK_CHUNK_SIZE when empty
+    chunk_size: Optional[int] = None
@@ -0,0 +1,121 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import PyPDF2
+
+# Page -> clean -> chunk pipeline for the PDF loaders. Every step is a generator, so at most
+# one page plus one chunk are held in memory, and large documents are extracted in parallel.
+
+# Below this number of pages the process pool costs more than it saves
+PARALLEL_MIN_PAGES = 16
+
+_SENTENCE_END = re.compile(r"[.!?;:]\s")
+
+
+def preprocess_text(text: str) -> str:
+    """
+    Normalize encoding, remove non-printable characters and extra whitespace.
+    """
+    # Convert to UTF-8 and remove extra whitespace
+    text = text.encode('utf-8', errors='ignore').decode('utf-8')
+    text = ' '.join(text.split())
+    # isprintable runs in C, only fall back to the per-character filter when there is something to remove
+    if not text.isprintable():
+        text = ' '.join(''.join(char for char in text if char.isprintable()).split())
+    return text
+
+
+def iter_pdf_pages(file_path: str, start: int = 0, end: Optional[int] = None) -> Iterator[str]:
+    """Yield the raw text of each page of a PDF."""
+    with open(file_path, "rb") as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        end = len(pdf_reader.pages) if end is None else end
+        for page in range(start, end):
+            yield pdf_reader.pages[page].extract_text() or ""
+
+
+def _extract_clean_pages(args: Tuple[str, int, int]) -> List[str]:
+    # Runs in a worker process, each one opens its own reader
+    file_path, start, end = args
+    return [preprocess_text(text) for text in iter_pdf_pages(file_path, start, end)]
+
+
+def iter_clean_pages(file_path: str, processes: Optional[int] = None) -> Iterator[str]:
+    """
+    Yield the clean text of each page, in order.
+
+    :param file_path: The PDF file.
+    :param processes: Worker processes. Defaults to the CPU count for documents of PARALLEL_MIN_PAGES pages or more.
+    """
+    with open(file_path, "rb") as file:
+        number_pages = len(PyPDF2.PdfReader(file).pages)
+    if processes is None:
+        processes = (os.cpu_count() or 1) if number_pages >= PARALLEL_MIN_PAGES else 1
+    if processes <= 1:
+        for text in iter_pdf_pages(file_path):
+            yield preprocess_text(text)
+        return
+
+    # Several small page ranges per worker keep the load balanced and the memory per result small
+    pages_per_task = max(1, number_pages // (processes * 4))
+    ranges = [(file_path, start, min(start + pages_per_task, number_pages)) for start in range(0, number_pages, pages_per_task)]
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        for pages in executor.map(_extract_clean_pages, ranges):
+            yield from pages
+
+
+def _find_cut(buffer: str, chunk_size: int, sentence_aware: bool) -> int:
+    # Prefer the last sentence end in the second half of the chunk, then the last space
+    if sentence_aware:
+        last = None
+        for match in _SENTENCE_END.finditer(buffer, chunk_size // 2, chunk_size + 1):
+            last = match
+        if last:
+            return last.start() + 1
+    space = buffer.rfind(" ", chunk_size // 2, chunk_size + 1)
+    return space if space != -1 else chunk_size
+
+
+def chunk_text(texts: Iterable[str], chunk_size: int = 1024, overlap: int = 128, sentence_aware: bool = True) -> Iterator[str]:
+    """
+    Split a stream of texts (e.g. pages) in chunks of at most chunk_size characters.
+
+    :param texts: The texts, joined with a space.
+    :param chunk_size: Maximum characters per chunk.
+    :param overlap: Characters of the end of a chunk repeated at the start of the next one.
+    :param sentence_aware: Cut at sentence ends when possible, otherwise at a space.
+    :return: An iterator of chunks. The last partial chunk is included.
+    """
+    if overlap < 0 or overlap >= chunk_size // 2:
+        raise ValueError("overlap must be between 0 and half of chunk_size")
+    buffer = ""
+    for text in texts:
+        if not text:
+            continue
+        buffer = f"{buffer} {text}" if buffer else text
+        while len(buffer) > chunk_size:
+            cut = _find_cut(buffer, chunk_size, sentence_aware)
+            yield buffer[:cut].strip()
+            start = cut - overlap
+            if overlap:
+                # Start the overlap at a word boundary
+                space = buffer.find(" ", start, cut)
+                start = space + 1 if space != -1 else start
+            buffer = buffer[start:].lstrip()
+    if buffer.strip():
+        yield buffer.strip()
+
+
+def iter_pdf_chunks(file_path: str, chunk_size: int = 1024, overlap: int = 128, sentence_aware: bool = True, processes: Optional[int] = None) -> Iterator[str]:
+    """
+    Yield the clean chunks of a PDF.
+
+    :param file_path: The PDF file.
+    :param chunk_size: Maximum characters per chunk.
+    :param overlap: Characters repeated between consecutive chunks.
+    :param sentence_aware: Cut at sentence ends when possible.
+    :param processes: Worker processes for the page extraction, see iter_clean_pages.
+    """
+    return chunk_text(iter_clean_pages(file_path, processes), chunk_size, overlap, sentence_aware)
@@ -0,0 +1,149 @@
+import json
+import os
+import threading
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from langchain_core.messages import SystemMessage
+
+# Bedrock prompt caching of the static prefixes (tool schemas + system prompt) of the agents.
+# The static part is marked with a cache point, so the provider reuses it across calls and only
+# the conversation is processed again. Cached and uncached input tokens of every call are tracked.
+
+# Opt-in: the model must support prompt caching on Bedrock (e.g. Claude 3.5 Haiku, Claude 3.7 Sonnet)
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "false").lower() == "true"
+# Calls kept in the per-call usage of the metrics
+PROMPT_CACHE_RECENT_CALLS = int(os.getenv("PROMPT_CACHE_RECENT_CALLS", "100"))
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def cacheable_blocks(static_text: str, dynamic_text: str = "") -> Union[str, List[Dict[str, Any]]]:
+    """
+    Anthropic content with a cache point after `static_text`. The dynamic text goes in its own
+    block after the cache point, so changing it doesn't invalidate the cached prefix.
+
+    :return: A list of text blocks, or the plain joined text when prompt caching is disabled.
+    """
+    if not PROMPT_CACHE_ENABLED:
+        return f"{static_text}\n\n{dynamic_text}" if dynamic_text else static_text
+    blocks = [{"type": "text", "text": static_text, "cache_control": dict(CACHE_CONTROL)}]
+    if dynamic_text:
+        blocks.append({"type": "text", "text": dynamic_text})
+    return blocks
+
+
+def cacheable_system_message(system_prompt: str, dynamic_text: str = "") -> SystemMessage:
+    """SystemMessage for ChatBedrock, the tools bound to the model are cached with the prompt."""
+    return SystemMessage(content=cacheable_blocks(system_prompt, dynamic_text))
+
+
+class PromptCacheMetrics:
+    """Input tokens of the Claude calls, split in uncached, read from the cache and written to it."""
+
+    def __init__(self, recent_calls: int = PROMPT_CACHE_RECENT_CALLS):
+        self._totals = {"calls": 0, "input_tokens": 0, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0, "output_tokens": 0}
+        self._recent = deque(maxlen=recent_calls)
+        self._lock = threading.Lock()
+
+    def record(self, model_id: str, usage: Dict[str, Any]):
+        """
+        Record the usage of a call.
+
+        :param usage: input_tokens (uncached), cache_read_input_tokens, cache_creation_input_tokens and output_tokens.
+        """
+        call = {"model_id": model_id}
+        for key in ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens", "output_tokens"):
+            call[key] = int(usage.get(key) or 0)
+        with self._lock:
+            self._totals["calls"] += 1
+            for key, value in call.items():
+                if key != "model_id":
+                    self._totals[key] += value
+            self._recent.append(call)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics: Dict[str, Any] = dict(self._totals)
+            metrics["recent_calls"] = list(self._recent)
+        total_input = metrics["input_tokens"] + metrics["cache_read_input_tokens"] + metrics["cache_creation_input_tokens"]
+        metrics["cached_input_ratio"] = metrics["cache_read_input_tokens"] / total_input if total_input else 0.0
+        metrics["enabled"] = PROMPT_CACHE_ENABLED
+        return metrics
+
+
+prompt_cache_metrics = PromptCacheMetrics()
+
+
+def _remember_model_id(params=None, context=None, **kwargs):
+    # before-parameter-build handler, the model id is only in the request parameters
+    if params is not None and context is not None:
+        context["bedrock_model_id"] = params.get("modelId", "")
+
+
+def record_invoke_headers(http_response=None, context=None, **kwargs):
+    """
+    botocore after-call handler of bedrock-runtime InvokeModel. Bedrock returns the token
+    counts of the call in the x-amzn-bedrock-* headers, for llm_utils and ChatBedrock alike.
+    """
+    if http_response is None or "x-amzn-bedrock-input-token-count" not in http_response.headers:
+        return
+    headers = http_response.headers
+    record_usage((context or {}).get("bedrock_model_id", ""), {
+        "input_tokens": headers.get("x-amzn-bedrock-input-token-count"),
+        "cache_read_input_tokens": headers.get("x-amzn-bedrock-cache-read-input-token-count"),
+        "cache_creation_input_tokens": headers.get("x-amzn-bedrock-cache-write-input-token-count"),
+        "output_tokens": headers.get("x-amzn-bedrock-output-token-count"),
+    })
+
+
+def record_usage(model_id: str, usage: Optional[Dict[str, Any]]):
+    if usage:
+        prompt_cache_metrics.record(model_id, usage)
+
+
+def invocation_metrics_usage(invocation_metrics: Dict[str, Any]) -> Dict[str, Any]:
+    """Usage of the amazon-bedrock-invocationMetrics of the message_stop event of a stream."""
+    return {
+        "input_tokens": invocation_metrics.get("inputTokenCount"),
+        "cache_read_input_tokens": invocation_metrics.get("cacheReadInputTokenCount"),
+        "cache_creation_input_tokens": invocation_metrics.get("cacheWriteInputTokenCount"),
+        "output_tokens": invocation_metrics.get("outputTokenCount"),
+    }
+
+
+def _recording_stream(model_id: str, stream: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    # The events go through unchanged, the last one carries the token counts
+    for event in stream:
+        data = (event.get("chunk") or {}).get("bytes")
+        if data and b"amazon-bedrock-invocationMetrics" in data:
+            record_usage(model_id, invocation_metrics_usage(json.loads(data)["amazon-bedrock-invocationMetrics"]))
+        yield event
+
+
+def record_stream_usage(parsed=None, context=None, **kwargs):
+    """
+    botocore after-call handler of bedrock-runtime InvokeModelWithResponseStream. Streams don't
+    return the token counts in headers, the body is wrapped to read them from its message_stop event
+    while the caller (llm_utils or ChatBedrock) consumes it.
+    """
+    if parsed is not None and parsed.get("body") is not None:
+        parsed["body"] = _recording_stream((context or {}).get("bedrock_model_id", ""), parsed["body"])
+
+
+def track_usage(client):
+    """Record the token usage of every InvokeModel and InvokeModelWithResponseStream call made with `client`."""
+    if hasattr(client, "meta"):
+        # unique_id: registering the same client twice doesn't count its calls twice
+        for operation in ("InvokeModel", "InvokeModelWithResponseStream"):
+            client.meta.events.register(f"before-parameter-build.bedrock-runtime.{operation}", _remember_model_id, unique_id=f"prompt-cache-model-id-{operation}")
+        client.meta.events.register("after-call.bedrock-runtime.InvokeModel", record_invoke_headers, unique_id="prompt-cache-usage")
+        client.meta.events.register("after-call.bedrock-runtime.InvokeModelWithResponseStream", record_stream_usage, unique_id="prompt-cache-stream-usage")
+    elif hasattr(client, "usage_callback"):
+        # FakeBedrockClient
+        client.usage_callback = record_usage
+    return client
+
+
+def get_prompt_cache_metrics() -> Dict[str, Any]:
+    return prompt_cache_metrics.metrics()
@@ -0,0 +1,151 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, create_engine, select
+
+import crud
+from models import Property, PropertyModel, PropertySlot
+
+# Property data of the proptech agent: listings, visit calendars and reservations in SQLite or
+# Postgres. Searches go through the (city, status, price) index and a visit slot is reserved with
+# one conditional update, so two leads can never book the same slot.
+
+_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# sqlite:///path/to/file.sqlite3 or the postgresql:// DATABASE_URL of the API
+PROPERTY_DB_URL = os.getenv("PROPERTY_DB_URL", f"sqlite:///{os.path.join(_DIRECTORY, 'properties.sqlite3')}")
+# Listings loaded when the properties table is empty
+PROPERTY_SEED_PATH = os.getenv("PROPERTY_SEED_PATH", os.path.join(_DIRECTORY, "properties.json"))
+
+SLOT_FORMAT = "%Y-%m-%d %H:%M"
+
+
+def city_key(city: str) -> str:
+    """Lowercase city without accents or punctuation, e.g. "Bogotá" -> "bogota"."""
+    text = unicodedata.normalize("NFKD", city or "").encode("ascii", "ignore").decode("ascii").lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def parse_slot(date_time: str) -> Optional[datetime]:
+    """Slot time of "2024-10-30 10:00" (or any ISO date time), None when it can't be parsed."""
+    try:
+        return datetime.fromisoformat(date_time.strip().replace("T", " ")).replace(second=0, microsecond=0)
+    except (AttributeError, ValueError):
+        return None
+
+
+def format_slot(slot_time: datetime) -> str:
+    return slot_time.strftime(SLOT_FORMAT)
+
+
+def _create_engine(url: str):
+    if url.startswith("sqlite"):
+        # Shared by the threads of the agent, concurrent reservations wait for the write lock
+        return create_engine(url, connect_args={"check_same_thread": False, "timeout": 30})
+    return create_engine(url, pool_pre_ping=True)
+
+
+class PropertyRepository:
+    """Thread-safe access to the property listings, calendars and visits."""
+
+    def __init__(self, url: str = PROPERTY_DB_URL, seed_path: Optional[str] = PROPERTY_SEED_PATH):
+        self.url = url
+        self.seed_path = seed_path
+        self.engine = _create_engine(url)
+        self._ready = False
+        self._ready_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._metrics = {"lookups": 0, "searches": 0, "reservations": 0, "conflicts": 0}
+
+    def _ensure_ready(self):
+        with self._ready_lock:
+            if self._ready:
+                return
+            PropertyModel.metadata.create_all(self.engine)
+            with Session(self.engine) as session:
+                empty = session.exec(select(Property.id).limit(1)).first() is None
+            if empty and self.seed_path and os.path.exists(self.seed_path):
+                self.load(self.seed_path)
+            self._ready = True
+
+    def load(self, path: str) -> int:
+        """Insert the listings of a JSON file {"properties": [{..., "calendar": ["2024-10-30 10:00"]}]}."""
+        with open(path, "r") as file:
+            listings = json.load(file)["properties"]
+        properties, slots = [], []
+        for listing in listings:
+            fields = {key: value for key, value in listing.items() if key != "calendar"}
+            fields["price"] = float(str(fields["price"]).replace("$", "").replace(",", ""))
+            properties.append(Property(city_key=city_key(fields["city"]), **fields))
+            slots.extend(
+                PropertySlot(property_id=listing["property_id"], slot_time=parse_slot(slot))
+                for slot in listing.get("calendar", [])
+            )
+        try:
+            with Session(self.engine) as session:
+                crud.create_properties(session, properties, slots)
+        except IntegrityError:
+            # Another process loaded them first
+            return 0
+        print(f"Loaded {len(properties)} properties and {len(slots)} visit slots from {path}")
+        return len(properties)
+
+    def _record(self, key: str):
+        with self._lock:
+            self._metrics[key] += 1
+
+    def get_property(self, property_id: str) -> Optional[Dict[str, Any]]:
+        """Details and status of a property, None if it doesn't exist."""
+        self._ensure_ready()
+        self._record("lookups")
+        with Session(self.engine) as session:
+            prop = crud.read_property(session, property_id)
+            return prop.model_dump(exclude={"id", "city_key"}) if prop else None
+
+    def free_slots(self, property_id: str) -> List[str]:
+        """Visit slots of a property that are not reserved yet, oldest first."""
+        self._ensure_ready()
+        self._record("lookups")
+        with Session(self.engine) as session:
+            return [format_slot(slot_time) for slot_time in crud.list_free_slots(session, property_id)]
+
+    def reserve(self, property_id: str, date_time: str) -> bool:
+        """
+        Reserve a visit slot.
+
+        :return: True if the slot existed and was free. False if it doesn't exist or someone else got it first.
+        """
+        self._ensure_ready()
+        slot_time = parse_slot(date_time)
+        reserved = False
+        if slot_time is not None:
+            with Session(self.engine) as session:
+                reserved = crud.reserve_slot(session, property_id, slot_time)
+        self._record("reservations" if reserved else "conflicts")
+        return reserved
+
+    def search(self, city: Optional[str] = None, min_price: Optional[float] = None, max_price: Optional[float] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Available properties of a city and price range, cheapest first."""
+        self._ensure_ready()
+        self._record("searches")
+        with Session(self.engine) as session:
+            properties = crud.search_properties(session, city_key=city_key(city) if city else None, min_price=min_price, max_price=max_price, limit=limit)
+            return [prop.model_dump(exclude={"id", "city_key"}) for prop in properties]
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics: Dict[str, Any] = dict(self._metrics)
+        metrics["url"] = self.url.split("@")[-1]
+        return metrics
+
+
+property_repository = PropertyRepository()
+
+
+def get_property_repository_metrics() -> Dict[str, Any]:
+    return property_repository.metrics()
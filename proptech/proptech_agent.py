@@ -1,32 +1,12 @@
 from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_aws import ChatBedrock
 from langchain_core.tools.structured import StructuredTool
 from pydantic import BaseModel, Field
-
-properties_data = {         
-    "123":"available",
-    "456": "unavailable",
-    "789": "available"
-}
-
-property_calendar_data = {
-    "123": ["2024-10-30 10:00", "2024-10-31 11:00"],
-    "456": ["2024-11-01 14:00", "2024-11-02 15:00", "2024-11-03 16:00"],
-    "789": ["2024-11-01 10:00", "2024-11-02 11:00"]
-}
-
-property_visit_data = {
-    "123": ["2024-10-30 10:00", "2024-10-31 11:00"],
-    "456": ["2024-11-01 14:00", "2024-11-02 15:00", "2024-11-03 16:00"],
-    "789": ["2024-11-01 10:00", "2024-11-02 11:00"]
-}
-
-property_details_data = {
-    "123": {"address": "Usaquen", "city": "Bogota", "state": "Colombia", "zip": "12345", "owner": "John Doe", "price": "$1000", "description": "A nice house with a garden", "amenities": ["wifi", "tv", "pool", "parking"]},
-    "456": {"address": "Mapocho", "city": "Santiago", "state": "Chile", "zip": "67890", "owner": "Juan Perez", "price": "$1500", "description": "A nice apartment with a view to the park", "amenities": ["wifi", "tv","gym"]},
-    "789": {"address": "Riomar", "city": "Barranquilla", "state": "Colombia", "zip": "84736", "owner": "Maria Gomez", "price": "$1200", "description": "A nice apartment with a pool", "amenities": ["wifi", "tv", "pool"]}
-}
+from llm_utils import CLAUDE_MODEL_ID, bedrock
+from checkpointing import get_checkpointer
+from chat_history import history_manager
+from proptech.property_repository import property_repository
+from typing import Optional
 
 def respond_to_user(message: str):
     return f"Respond to the user using the followind data: <data>{message}</data> Dont use a tool call to answer, just respond to the user using the data provided. Answer always in spanish."
@@ -40,8 +20,9 @@ def check_property_availability(id:str):
     
 
 def check_property_availability_aux(property_id: str):
-    if property_id in properties_data:
-        return respond_to_user(f"The property with id {property_id} is {properties_data[property_id]}")
+    property_data = property_repository.get_property(property_id)
+    if property_data:
+        return respond_to_user(f"The property with id {property_id} is {property_data['status']}")
     return respond_to_user(f"The property with id {property_id} was not found")
 
 
@@ -52,8 +33,8 @@ def check_property_calendar(id:str):
     return llm.invoke(input=result).content
     
 def check_property_calendar_aux(property_id: str):
-    if property_id in property_calendar_data:
-        return respond_to_user(f"The property with id {property_id} has the following calendar for a visit: {property_calendar_data[property_id]}") 
+    if property_repository.get_property(property_id):
+        return respond_to_user(f"The property with id {property_id} has the following calendar for a visit: {property_repository.free_slots(property_id)}") 
     return respond_to_user(f"The property with id {property_id} was not found")
 
 
@@ -64,9 +45,9 @@ def set_property_visit(id:str, date_time:str):
     return llm.invoke(input=result).content
 
 def set_property_visit_aux(property_id: str, date_time: str):
-    if property_id in property_visit_data:
-        if date_time in property_calendar_data[property_id]:
-            property_visit_data[property_id].append(date_time)
+    if property_repository.get_property(property_id):
+        # Atomic: the slot leaves the calendar, nobody else can book it
+        if property_repository.reserve(property_id, date_time):
             return respond_to_user(f"The visit to the property with id {property_id} has been set for {date_time}")
         else:
             return respond_to_user(f"The date and time {date_time} is not available for the property with id {property_id}. Do you want that i check the calendar for available dates and times?")
@@ -81,11 +62,25 @@ def get_property_details(id:str):
     return llm.invoke(input=result).content
 
 def get_property_details_aux(property_id: str):
-    if property_id in property_details_data:
-        return respond_to_user(f"The property with id {property_id} has the following details: {property_details_data[property_id]}")
+    property_data = property_repository.get_property(property_id)
+    if property_data:
+        return respond_to_user(f"The property with id {property_id} has the following details: {property_data}")
     else:
         return respond_to_user(f"The property with id {property_id} was not found")
 
+
+def search_properties(city: Optional[str] = None, min_price: Optional[float] = None, max_price: Optional[float] = None):
+    """Search the available properties of a city and price range.
+    """
+    result = search_properties_aux(city, min_price, max_price)
+    return llm.invoke(input=result).content
+
+def search_properties_aux(city: Optional[str], min_price: Optional[float], max_price: Optional[float]):
+    properties = property_repository.search(city=city, min_price=min_price, max_price=max_price)
+    if properties:
+        return respond_to_user(f"The following properties are available: {properties}")
+    return respond_to_user("No available properties were found for that city and price range")
+
 class PropertyIdSchema(BaseModel):
     """Inputs to the property availability, calendar and details tools."""
     id: str = Field(
@@ -101,6 +96,18 @@ class DateTimeSchema(BaseModel):
         description="The date and time to set a visit"
     )
 
+class SearchSchema(BaseModel):
+    """Inputs to the property search tool."""
+    city: Optional[str] = Field(
+        default=None, description="The city where the user wants the property"
+    )
+    min_price: Optional[float] = Field(
+        default=None, description="The minimum monthly price"
+    )
+    max_price: Optional[float] = Field(
+        default=None, description="The maximum monthly price"
+    )
+
 # Convert each function into a structured tool
 check_property_availability_tool = StructuredTool.from_function(
     func=check_property_availability,
@@ -130,10 +137,18 @@ get_property_details_tool = StructuredTool.from_function(
     args_schema=PropertyIdSchema,
     return_direct=True
 )
-TOOLS = [check_property_availability_tool, check_property_calendar_tool, set_property_visit_tool, get_property_details_tool]
+search_properties_tool = StructuredTool.from_function(
+    func=search_properties,
+    name="search_properties",
+    description="Search the available properties by city and price range when the user doesn't have a property id.",
+    args_schema=SearchSchema,
+    return_direct=True
+)
+TOOLS = [check_property_availability_tool, check_property_calendar_tool, set_property_visit_tool, get_property_details_tool, search_properties_tool]
 
 llm = ChatBedrock(
-    model_id="anthropic.claude-3-haiku-20240307-v1:0",
+    client=bedrock,
+    model_id=CLAUDE_MODEL_ID,
     model_kwargs=dict(temperature=0),
 ).bind_tools(TOOLS, tool_choice="auto")
 
@@ -150,10 +165,11 @@ Conditions to call the tools:
 - If the property is available, call check_property_calendar_tool to get the available dates and times for a visit.
 - Call set_property_visit_tool with the date and time provided by the user. If the date and time was not provided, dont call this tool instead call check_property_calendar_tool.
 - Dont call set_property_visit_tool if the property it not available.
+- When users look for a property in a city or price range without a property id, call search_properties_tool.
 """
 
 
-graph_builder = create_react_agent(llm, tools=TOOLS, state_modifier=PROMPT_SYSTEM,checkpointer=MemorySaver())
+graph_builder = create_react_agent(llm, tools=TOOLS, state_modifier=history_manager.state_modifier(PROMPT_SYSTEM),checkpointer=get_checkpointer())
 
 
 
@@ -1,9 +1,12 @@
 import streamlit as st
 from proptech_agent import graph_builder    
+from chat_utils import stream_graph_response, write_graph_stream
 from langchain_core.messages import HumanMessage
 import uuid
 
-thread_id = str(uuid.uuid4())
+# One conversation per browser session, stable across reruns
+if "thread_id" not in st.session_state:
+    st.session_state["thread_id"] = str(uuid.uuid4())
 st.title("💬 ChatBot")
 
 if "messages" not in st.session_state:
@@ -16,10 +19,10 @@ for msg in st.session_state.messages:
 if prompt := st.chat_input():
     st.session_state.messages.append({"role": "user", "content": prompt})
     st.chat_message("user").write(prompt)
-    response = graph_builder.invoke(
-        {"messages": [HumanMessage(content=prompt)]+st.session_state.messages},
-        config={"configurable": {"thread_id": thread_id}}
-    )
-    msg = response["messages"][-1].content
-    st.session_state.messages.append({"role": "assistant", "content": msg})
-    st.chat_message("assistant").write(msg)
\ No newline at end of file
+    # Show the tokens as they are generated
+    msg = write_graph_stream(st.chat_message("assistant"), stream_graph_response(
+        graph_builder,
+        {"messages": [HumanMessage(content=prompt)]},
+        config={"configurable": {"thread_id": st.session_state["thread_id"]}}
+    ))
+    st.session_state.messages.append({"role": "assistant", "content": msg})
\ No newline at end of file
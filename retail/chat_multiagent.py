@@ -2,55 +2,52 @@ import streamlit as st
 import json
 import uuid
 
-import chromadb
-
 from langchain_core.messages import HumanMessage
 from retail.multiagent import graph_builder
-
-client = chromadb.PersistentClient(path="/chromadb")
+from chat_utils import stream_graph_response, write_graph_stream
+from vector_ingest import sync_documents
+from vector_store import get_collection
 
 if st.button("Save catalog"):
-    try:
-        collection = client.get_collection(name="collection_catalog")
-    except Exception as e:  # ChromaDB raises Error if collection doesn't exist
-        collection = client.create_collection(name="collection_catalog")
+    collection = get_collection("collection_catalog")
     # Load the PDF file
     file_path = "./retail/catalog.json"
     with open(file_path, "r") as file:
         catalog_data = json.load(file)
     
-    # Add each product as a separate document
-    for i, product in enumerate(catalog_data["products"]):
-        collection.add(
-            documents=[json.dumps(product)],
-            ids=[str(uuid.uuid4())],
-            metadatas=[{"product_id": product["product_id"]}]
-        )
-        print(f"Added product {i+1} of {len(catalog_data)}")
+    # Add each product as a separate document, only new or changed products are embedded again
+    products = catalog_data["products"]
+    stats = sync_documents(
+        collection,
+        documents=[json.dumps(product) for product in products],
+        metadatas=[{"product_id": product["product_id"]} for product in products],
+        source="catalog.json"
+    )
+    st.success(f"Saved {stats['documents']} products: {stats['added']} added, {stats['deleted']} deleted, {stats['unchanged']} unchanged")
         
 if st.button("Save reviews"):
-    try:
-        collection = client.get_collection(name="collection_reviews")
-    except Exception as e:  # ChromaDB raises Error if collection doesn't exist
-        collection = client.create_collection(name="collection_reviews")
+    collection = get_collection("collection_reviews")
 
     file_path = "./retail/reviews.json"
     with open(file_path, "r") as file:
         reviews_data = json.load(file)
         
     # Add each review as a separate document
-    for i, review in enumerate(reviews_data["reviews"]):
-        collection.add(
-            documents=[json.dumps(review)],
-            ids=[str(uuid.uuid4())],
-            metadatas=[{"product_id": review["product_id"]}]
-        )
-        print(f"Added review {i+1} of {len(reviews_data)}")
+    reviews = reviews_data["reviews"]
+    stats = sync_documents(
+        collection,
+        documents=[json.dumps(review) for review in reviews],
+        metadatas=[{"product_id": review["product_id"]} for review in reviews],
+        source="reviews.json"
+    )
+    st.success(f"Saved {stats['documents']} reviews: {stats['added']} added, {stats['deleted']} deleted, {stats['unchanged']} unchanged")
         
         
 st.title("💬 ChatBot")
 
-thread_id = str(uuid.uuid4())
+# One conversation per browser session, stable across reruns
+if "thread_id" not in st.session_state:
+    st.session_state["thread_id"] = str(uuid.uuid4())
 if "messages" not in st.session_state:
     st.session_state["messages"] = []
 
@@ -61,13 +58,13 @@ for msg in st.session_state.messages:
 if prompt := st.chat_input():
     st.session_state.messages.append({"role": "user", "content": prompt})
     st.chat_message("user").write(prompt)
-    response = graph_builder.invoke(
-        {"messages": [HumanMessage(content=prompt)]+st.session_state.messages},
-        config={"configurable": {"thread_id": thread_id}}
-    )
-    msg = response["messages"][-1].content
+    # Show the tokens as they are generated
+    msg = write_graph_stream(st.chat_message("assistant"), stream_graph_response(
+        graph_builder,
+        {"messages": [HumanMessage(content=prompt)]},
+        config={"configurable": {"thread_id": st.session_state["thread_id"]}}, skip_nodes=["supervisor"]
+    ))
     st.session_state.messages.append({"role": "assistant", "content": msg})
-    st.chat_message("assistant").write(msg)
 
         
 
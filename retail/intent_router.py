@@ -0,0 +1,182 @@
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from embedding_cache import get_embedding_function
+
+# Cheap pre-router of the retail supervisor. Obvious intents are resolved locally with keyword
+# rules, then with the similarity to example utterances, and only the ambiguous turns go to the LLM.
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+# Minimum cosine similarity between the message and the closest example utterance
+INTENT_ROUTER_MIN_SIMILARITY = float(os.getenv("INTENT_ROUTER_MIN_SIMILARITY", "0.75"))
+# Minimum difference between the best intent and the second one
+INTENT_ROUTER_MIN_MARGIN = float(os.getenv("INTENT_ROUTER_MIN_MARGIN", "0.05"))
+
+INTENT_RULES = {
+    "general_conversation_agent": [
+        r"^\s*(hi|hello|hey|hola|good (morning|afternoon|evening)|thanks|thank you|bye|goodbye)\b[\s\w,']{0,30}[.!?]*\s*$",
+    ],
+    "product_recommendation_agent": [
+        r"\b(recommend|recommendation|suggest|suggestion)s?\b",
+        r"\b(which|what) (car|vehicle|model) (should|would|is best)\b",
+        r"\bi('m| am) looking for a (car|vehicle)\b",
+    ],
+    "product_details_agent": [
+        r"\b(details?|specs|specifications|features)\b",
+        r"\b(how much (is|does|for)|price of|tell me about)\b",
+    ],
+    "product_reviews_agent": [
+        r"\b(reviews?|ratings?|opinions?)\b",
+        r"\bwhat do (customers|people|users|buyers) (say|think)\b",
+    ],
+    "create_order_agent": [
+        r"\b(buy|purchase|checkout)\b",
+        r"\b(place|create|make) an? order\b",
+        r"[\w.+-]+@[\w-]+\.[\w.]+",
+    ],
+}
+
+EXAMPLE_UTTERANCES = {
+    "general_conversation_agent": [
+        "Hi, how are you?",
+        "Hello, what is your name?",
+        "What cars do you sell?",
+        "Where is the store located?",
+        "What are your opening hours?",
+        "Thank you for your help",
+    ],
+    "product_recommendation_agent": [
+        "Which car is best for a big family?",
+        "I need a car for off-road trips",
+        "Recommend me an electric car",
+        "I want something sporty and fast",
+        "What car do you suggest for city driving?",
+        "I like luxury and comfort, what do you have?",
+    ],
+    "product_details_agent": [
+        "Tell me the details of the Luxury Sedan X500",
+        "What is the price of the Sport Coupe GT?",
+        "What features does the Electric Vision EV have?",
+        "Give me the specifications of the Adventure SUV Pro",
+        "How much does the sedan cost?",
+    ],
+    "product_reviews_agent": [
+        "What do customers say about the Adventure SUV Pro?",
+        "Show me the reviews of the Sport Coupe GT",
+        "Is the Electric Vision EV well rated?",
+        "What is the rating of the Luxury Sedan X500?",
+        "Do people like the sedan?",
+    ],
+    "create_order_agent": [
+        "I want to buy the Luxury Sedan X500",
+        "Create an order for two Sport Coupe GT",
+        "My email is john@example.com and I want 1 Adventure SUV Pro",
+        "I'll take the electric car",
+        "Place an order please",
+    ],
+}
+
+_compiled_rules = {intent: [re.compile(pattern, re.IGNORECASE) for pattern in patterns] for intent, patterns in INTENT_RULES.items()}
+_example_intents: List[str] = []
+_example_vectors: Optional[np.ndarray] = None
+_examples_lock = threading.Lock()
+_metrics = {"rule_hits": 0, "embedding_hits": 0, "llm_fallbacks": 0, "skipped": 0}
+_intent_counts: Dict[str, int] = {}
+_metrics_lock = threading.Lock()
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _examples() -> np.ndarray:
+    # Embedded once per process, and only once ever thanks to the embedding cache
+    global _example_vectors
+    with _examples_lock:
+        if _example_vectors is None:
+            texts = []
+            for intent, utterances in EXAMPLE_UTTERANCES.items():
+                _example_intents.extend([intent] * len(utterances))
+                texts.extend(utterances)
+            _example_vectors = _normalize(np.asarray(get_embedding_function()(texts), dtype=np.float32))
+        return _example_vectors
+
+
+def match_rules(text: str) -> Optional[str]:
+    """The intent whose rules match the text, None if no rule or rules of several intents match."""
+    matches = {intent for intent, patterns in _compiled_rules.items() if any(pattern.search(text) for pattern in patterns)}
+    return matches.pop() if len(matches) == 1 else None
+
+
+def classify_embedding(text: str) -> Dict[str, float]:
+    """Best similarity of the text to the example utterances of each intent."""
+    examples = _examples()
+    vector = _normalize(np.asarray(get_embedding_function()([text])[0], dtype=np.float32))
+    similarities = examples @ vector
+    scores: Dict[str, float] = {}
+    for intent, similarity in zip(_example_intents, similarities):
+        scores[intent] = max(scores.get(intent, -1.0), float(similarity))
+    return scores
+
+
+def _record(outcome: str, intent: Optional[str] = None):
+    with _metrics_lock:
+        _metrics[outcome] += 1
+        if intent:
+            _intent_counts[intent] = _intent_counts.get(intent, 0) + 1
+
+
+def _text(message: Any) -> str:
+    content = getattr(message, "content", message)
+    if isinstance(content, list):
+        return " ".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return str(content)
+
+
+def route_intent(messages: Sequence[Any]) -> Optional[str]:
+    """
+    Route the last message of the conversation without an LLM call.
+
+    :param messages: The messages of the graph state, the last one is the user's turn.
+    :return: The member to act next, or None when the intent is ambiguous and the LLM supervisor should decide.
+    """
+    if not messages:
+        return None
+    # An order being created spans several turns (email, product, quantity): keep it with the LLM
+    if len(messages) > 1 and getattr(messages[-2], "name", None) == "create_order_agent":
+        _record("skipped")
+        return None
+    text = _text(messages[-1])
+
+    intent = match_rules(text)
+    if intent:
+        _record("rule_hits", intent)
+        return intent
+
+    scores = classify_embedding(text)
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    best_intent, best_score = ranked[0]
+    margin = best_score - ranked[1][1] if len(ranked) > 1 else best_score
+    if best_score >= INTENT_ROUTER_MIN_SIMILARITY and margin >= INTENT_ROUTER_MIN_MARGIN:
+        _record("embedding_hits", best_intent)
+        return best_intent
+
+    _record("llm_fallbacks")
+    return None
+
+
+def get_intent_router_metrics() -> Dict[str, Any]:
+    with _metrics_lock:
+        metrics: Dict[str, Any] = dict(_metrics)
+        metrics["intents"] = dict(_intent_counts)
+    routed = metrics["rule_hits"] + metrics["embedding_hits"]
+    total = routed + metrics["llm_fallbacks"] + metrics["skipped"]
+    metrics["hit_rate"] = routed / total if total else 0.0
+    metrics["min_similarity"] = INTENT_ROUTER_MIN_SIMILARITY
+    metrics["min_margin"] = INTENT_ROUTER_MIN_MARGIN
+    return metrics
@@ -1,8 +1,8 @@
 import json
+import os
 import uuid
-from typing import Literal, TypedDict
+from typing import Any, Dict, List, Literal, Optional, TypedDict
 
-import chromadb
 from pydantic import BaseModel, Field
 
 from langchain_aws import ChatBedrock
@@ -14,22 +14,40 @@ from langgraph.graph import MessagesState
 from langgraph.types import Command
 from langgraph.prebuilt import create_react_agent
 
-client = chromadb.PersistentClient(path="/chromadb")
+from llm_utils import CLAUDE_MODEL_ID, bedrock
+from checkpointing import get_checkpointer
+from chat_history import history_manager
+from llm_cache import LLM_CACHE_ENABLED, LangChainResponseCache
+from vector_store import query_collection, reciprocal_rank_fusion
+from retail.order_store import order_store
+from retail.product_index import product_index
+from retail.intent_router import INTENT_ROUTER_ENABLED, route_intent
+from retail.responses import render_order, render_product_details, render_recommendations, render_reviews
+
+
+# Cache for the temperature 0 models, the tools ask them the same respond_to_user prompts over and over
+tools_llm_cache = LangChainResponseCache() if LLM_CACHE_ENABLED else None
+
+# How the tools answer: "template" renders their structured results (supervisor + agent = 2 LLM calls per turn),
+# "llm" asks the model to write the answer from the results (a third serial LLM call per turn)
+RETAIL_RESPONSE_MODE = os.getenv("RETAIL_RESPONSE_MODE", "template")
+# Catalog products retrieved per interest before fusing the rankings of all the interests
+RECOMMENDATION_TOP_K = 3
 
 def save_orders_data(orders_data):
-    # Save the orders data to the JSON file
-    with open("./retail/orders.json", "w") as file:
-        json.dump(orders_data, file)
+    # Append the order through the shared order store, safe with concurrent chat sessions
+    return order_store.save(orders_data)
 
 llm_general = ChatBedrock(
-    model_id="anthropic.claude-3-haiku-20240307-v1:0",
+    client=bedrock,
+    model_id=CLAUDE_MODEL_ID,
     model_kwargs=dict(temperature=0.7)  # Slightly higher temperature for more natural conversation
 )
 
 
 members = ["general_conversation_agent", "product_recommendation_agent", "product_details_agent", "product_reviews_agent", "create_order_agent"]
 
-PROMPT_SYSTEM = (
+PROMPT_SYSTEM_SUPERVISOR = (
     "You are a supervisor tasked with managing a conversation between the"
     f" following workers: {members}. Given the following user request,"
     " respond with the worker to act next. Each worker will perform a"
@@ -44,13 +62,15 @@ class Router(TypedDict):
 
 #Supervisor node
 def supervisor_node(state: MessagesState) -> Command[Literal["general_conversation_agent", "product_recommendation_agent", "product_details_agent", "product_reviews_agent", "create_order_agent", "__end__"]]:
-    messages = [
-        {"role": "system", "content": PROMPT_SYSTEM},
-    ] + state["messages"]
-    
-    #need to return messages to the user when comes from the general conversation agent
-    response = llm_general.with_structured_output(Router).invoke(messages)
-    goto = response["next"]
+    # Obvious intents are routed without calling the LLM
+    goto = route_intent(state["messages"]) if INTENT_ROUTER_ENABLED else None
+    if goto is None:
+        # Recent turns plus a summary of the older ones, within the history token budget
+        messages = history_manager.with_system(PROMPT_SYSTEM_SUPERVISOR, state["messages"])
+
+        #need to return messages to the user when comes from the general conversation agent
+        response = llm_general.with_structured_output(Router).invoke(messages)
+        goto = response["next"]
     if goto == "FINISH":
         goto = END
 
@@ -68,9 +88,7 @@ Key behaviors:
 """
 
 def general_conversation_node(state: MessagesState) -> Command[Literal["__end__"]]:
-    messages = [
-        {"role": "system", "content": PROMPT_SYSTEM_GENERAL},
-    ] + state["messages"]
+    messages = history_manager.with_system(PROMPT_SYSTEM_GENERAL, state["messages"])
     
     result = llm_general.invoke(messages)
     
@@ -86,7 +104,72 @@ def general_conversation_node(state: MessagesState) -> Command[Literal["__end__"
 def respond_to_user(message: str):
     return f"Respond to the user using the followind data: <data>{message}</data> Dont use a tool call to answer, just respond to the user using the data provided. Answer always in english."
 
+# Model without tools that writes the tool answers in "llm" mode
+llm_respond = ChatBedrock(
+    client=bedrock,
+    model_id=CLAUDE_MODEL_ID,
+    model_kwargs=dict(temperature=0),
+    cache=tools_llm_cache,
+)
 
+def respond(data: str, rendered: str) -> str:
+    """Answer of a tool: the rendered template, or in "llm" mode the model's answer from the data."""
+    if RETAIL_RESPONSE_MODE == "llm":
+        return llm_respond.invoke(input=respond_to_user(data)).content
+    return rendered
+
+
+def find_product(product_name: str, vector_fallback: bool = True) -> Optional[Dict[str, Any]]:
+    """
+    The catalog product named product_name, from the in-memory product index.
+    Only when the index has no match, and vector_fallback is set, the closest product of the vector store.
+    """
+    if not product_name:
+        return None
+    product = product_index.lookup(product_name)
+    if product or not vector_fallback:
+        return product
+    chroma_docs = query_collection("collection_catalog",
+        query_texts=[product_name],
+        n_results=1,
+        include=["documents"]
+    )
+    documents = chroma_docs["documents"][0]
+    return json.loads(documents[0]) if documents else None
+
+def find_product_recommendations(interests: List[str], top_k: int = RECOMMENDATION_TOP_K) -> List[Dict[str, Any]]:
+    """
+    Products matching the interests, with one query for all of them.
+    The top_k products of each interest are merged with reciprocal rank fusion, so products that
+    rank well for several interests come first. Returns at most one product per interest.
+    """
+    interests = [interest for interest in interests or [] if interest]
+    if not interests:
+        return []
+    chroma_docs = query_collection("collection_catalog",
+        query_texts=interests,
+        n_results=top_k,
+        include=["documents"]
+    )
+    products, rankings = {}, []
+    for documents in chroma_docs["documents"]:
+        ranking = []
+        for document in documents:
+            product = json.loads(document)
+            products.setdefault(product["product_id"], product)
+            ranking.append(product["product_id"])
+        rankings.append(ranking)
+    return [products[product_id] for product_id in reciprocal_rank_fusion(rankings)[:len(interests)]]
+
+def find_product_reviews(product_name: str) -> List[Dict[str, Any]]:
+    if not product_name:
+        return []
+    chroma_docs = query_collection("collection_reviews",
+        query_texts=[product_name],
+        n_results=1,
+        include=["documents"]
+    )
+    return [json.loads(document) for document in chroma_docs["documents"][0]]
 
 
 class InterestSchema(BaseModel):
@@ -96,25 +179,9 @@ class InterestSchema(BaseModel):
     )
 
 def check_product_recommendation(interests: list[str]):
-    try:
-        collection = client.get_collection(name="collection_catalog")
-    except Exception as e:  # ChromaDB raises Error if collection doesn't exist
-        collection = client.create_collection(name="collection_catalog")
-    recommendations = []
-    data_response = ""
-    if interests:
-        for interest in interests:
-            chroma_docs = collection.query(
-                query_texts=[interest],
-                n_results=1,
-                include=["documents", "metadatas"]
-            )
-            doc = chroma_docs["documents"][0]
-            product = json.loads(doc[0])
-            if product["name"] not in recommendations:
-                recommendations.append(product)
-                data_response += f"Product: {product}\n"
-    return llm.invoke(input=respond_to_user(f"The products recommendations are {data_response}")).content
+    recommendations = find_product_recommendations(interests)
+    data_response = "".join(f"Product: {product}\n" for product in recommendations)
+    return respond(f"The products recommendations are {data_response}", render_recommendations(recommendations))
 
 check_product_recommendation_tool = StructuredTool.from_function(
     func=check_product_recommendation,
@@ -133,12 +200,14 @@ Answer always in english. Never answer using tags like <user> or <assistant> or
 Dont answer about the products with your own knowledge, only answer with the data provided by the tools.
 """
 llm = ChatBedrock(
-    model_id="anthropic.claude-3-haiku-20240307-v1:0",
+    client=bedrock,
+    model_id=CLAUDE_MODEL_ID,
     model_kwargs=dict(temperature=0),
+    cache=tools_llm_cache,
 ).bind_tools([check_product_recommendation_tool], tool_choice="auto")
 
-#Check product details agent
-product_recommendation_react_agent = create_react_agent(llm, tools=[check_product_recommendation_tool], state_modifier=PROMPT_SYSTEM)
+#Check product details agent. The agents don't checkpoint: each turn they get the conversation from the parent graph
+product_recommendation_react_agent = create_react_agent(llm, tools=[check_product_recommendation_tool], state_modifier=history_manager.state_modifier(PROMPT_SYSTEM), checkpointer=False)
 
 #Check product details node
 def product_recommendation_agent_node(state: MessagesState) -> Command[Literal["__end__"]]:
@@ -161,23 +230,10 @@ class ProductNameSchema(BaseModel):
     )
 
 def check_product_details(product_name: str):
-    try:
-        collection = client.get_collection(name="collection_catalog")
-    except Exception as e:  # ChromaDB raises Error if collection doesn't exist
-        collection = client.create_collection(name="collection_catalog")
-    if product_name:
-        chroma_docs = collection.query(
-            query_texts=[product_name],
-            n_results=1,
-            include=["documents", "metadatas"]
-        )
-        doc = chroma_docs["documents"][0]
-        data_response = ""
-        for document in doc:
-            data_response += " ".join(document)
-            data_response += "\n"   
-        return llm.invoke(input=respond_to_user(f"The product details are {data_response}")).content
-    return llm.invoke(input=respond_to_user(f"The product with name {product_name} was not found")).content
+    product = find_product(product_name)
+    if product:
+        return respond(f"The product details are {json.dumps(product)}", render_product_details(product_name, product))
+    return respond(f"The product with name {product_name} was not found", render_product_details(product_name, None))
 
 check_product_details_tool = StructuredTool.from_function(
     func=check_product_details,
@@ -196,12 +252,14 @@ Answer always in english. Never answer using tags like <user> or <assistant> or
 Dont answer about the products with your own knowledge, only answer with the data provided by the tools.
 """
 llm = ChatBedrock(
-    model_id="anthropic.claude-3-haiku-20240307-v1:0",
+    client=bedrock,
+    model_id=CLAUDE_MODEL_ID,
     model_kwargs=dict(temperature=0),
+    cache=tools_llm_cache,
 ).bind_tools([check_product_details_tool], tool_choice="auto")
 
 #Check product details agent
-product_details_react_agent = create_react_agent(llm, tools=[check_product_details_tool], state_modifier=PROMPT_SYSTEM)
+product_details_react_agent = create_react_agent(llm, tools=[check_product_details_tool], state_modifier=history_manager.state_modifier(PROMPT_SYSTEM), checkpointer=False)
 
 #Check product details node
 def product_details_agent_node(state: MessagesState) -> Command[Literal["__end__"]]:
@@ -217,19 +275,10 @@ def product_details_agent_node(state: MessagesState) -> Command[Literal["__end__
     
 
 def check_product_reviews(product_name: str):
-    try:
-        collection = client.get_collection(name="collection_reviews")
-    except Exception as e:  # ChromaDB raises Error if collection doesn't exist
-        collection = client.create_collection(name="collection_reviews")
-    if product_name:
-        chroma_docs = collection.query(
-            query_texts=[product_name],
-            n_results=1,
-            include=["documents", "metadatas"]
-        )
-        doc = chroma_docs["documents"][0]
-        return llm.invoke(input=respond_to_user(f"The product reviews are {doc}")).content
-    return llm.invoke(input=respond_to_user(f"The product with name {product_name} was not found")).content
+    reviews = find_product_reviews(product_name)
+    if reviews:
+        return respond(f"The product reviews are {[json.dumps(review) for review in reviews]}", render_reviews(product_name, reviews))
+    return respond(f"The product with name {product_name} was not found", render_reviews(product_name, []))
 
 check_product_reviews_tool = StructuredTool.from_function(
     func=check_product_reviews,
@@ -247,12 +296,14 @@ Answer always in english. Never answer using tags like <user> or <assistant> or
 Dont answer about the products with your own knowledge, only answer with the data provided by the tools.
 """
 llm = ChatBedrock(
-    model_id="anthropic.claude-3-haiku-20240307-v1:0",
+    client=bedrock,
+    model_id=CLAUDE_MODEL_ID,
     model_kwargs=dict(temperature=0),
+    cache=tools_llm_cache,
 ).bind_tools([check_product_reviews_tool], tool_choice="auto")
 
 #Check product reviews agent
-product_reviews_react_agent = create_react_agent(llm, tools=[check_product_reviews_tool], state_modifier=PROMPT_SYSTEM)
+product_reviews_react_agent = create_react_agent(llm, tools=[check_product_reviews_tool], state_modifier=history_manager.state_modifier(PROMPT_SYSTEM), checkpointer=False)
 
 #Check product reviews node
 def product_reviews_agent_node(state: MessagesState) -> Command[Literal["__end__"]]:
@@ -279,32 +330,44 @@ class OrderSchema(BaseModel):
         description="The quantity of the product to create an order"
     )
     
-def get_product_price(product_name: str):
+def parse_quantity(quantity: Any) -> Optional[int]:
+    """Whole number of units above zero, None for "two", "1.5", "0" or "-1"."""
     try:
-        collection = client.get_collection(name="collection_catalog")
-    except Exception as e:  # ChromaDB raises Error if collection doesn't exist
-        collection = client.create_collection(name="collection_catalog")
-    if product_name:
-        chroma_docs = collection.query(
-            query_texts=[product_name],
-            n_results=1,
-            include=["documents", "metadatas"]
-        )
-        return chroma_docs["documents"][0]
-    return None
+        units = int(str(quantity).strip())
+    except ValueError:
+        return None
+    return units if units > 0 else None
+
+def place_order(email: str, product_name: str, quantity: str) -> Dict[str, Any]:
+    """Create the order and return it with its status: created, product_not_found, invalid_quantity or missing_data."""
+    order = {"email": email, "product": product_name, "quantity": quantity}
+    if not (email and product_name and quantity):
+        return {**order, "status": "missing_data"}
+    units = parse_quantity(quantity)
+    if units is None:
+        return {**order, "status": "invalid_quantity"}
+    order["quantity"] = units
+    # Exact name or catalog alias only, an order must never be priced with a product the user didn't name
+    product = product_index.lookup_exact(product_name)
+    if product is None:
+        return {**order, "status": "product_not_found"}
+    order["product"] = product["name"]
+    total = float(product["price"]) * units
+    orders_data = {"order_id": str(uuid.uuid4()), **order, "total": total}
+    save_orders_data(orders_data)
+    return {**orders_data, "status": "created"}
 
 def create_order(email: str, product_name: str, quantity: str):
-    if email and product_name and quantity:
-        order_id = str(uuid.uuid4())
-        product = get_product_price(product_name)
-        if product:
-            product_price = json.loads(product[0])["price"]
-            total = float(product_price) * int(quantity)
-            orders_data = {"order_id": order_id, "email": email, "product": product_name, "quantity": quantity, "total": total}
-            save_orders_data(orders_data)
-            return llm.invoke(input=respond_to_user(f"The order has been created for the user {email} with the product {product_name} and the total price is {total}")).content
-        return llm.invoke(input=respond_to_user(f"The order has not been created because the product {product_name} was not found")).content
-    return llm.invoke(input=respond_to_user(f"The order has not been created because the user {email} or the product {product_name} or the quantity {quantity} was not provided")).content
+    order = place_order(email, product_name, quantity)
+    if order["status"] == "created":
+        data = f"The order has been created for the user {email} with the product {product_name} and the total price is {order['total']}"
+    elif order["status"] == "product_not_found":
+        data = f"The order has not been created because the product {product_name} was not found"
+    elif order["status"] == "invalid_quantity":
+        data = f"The order has not been created because the quantity {quantity} is not a whole number greater than zero"
+    else:
+        data = f"The order has not been created because the user {email} or the product {product_name} or the quantity {quantity} was not provided"
+    return respond(data, render_order(order))
 
 create_order_tool = StructuredTool.from_function(
     func=create_order,
@@ -322,12 +385,14 @@ Answer always in english. Never answer using tags like <user> or <assistant> or
 Dont answer about the products with your own knowledge, only answer with the data provided by the tools.
 """
 llm = ChatBedrock(
-    model_id="anthropic.claude-3-haiku-20240307-v1:0",
+    client=bedrock,
+    model_id=CLAUDE_MODEL_ID,
     model_kwargs=dict(temperature=0),
+    cache=tools_llm_cache,
 ).bind_tools([create_order_tool], tool_choice="auto")
 
 #Check product reviews agent
-create_order_react_agent = create_react_agent(llm, tools=[create_order_tool], state_modifier=PROMPT_SYSTEM)
+create_order_react_agent = create_react_agent(llm, tools=[create_order_tool], state_modifier=history_manager.state_modifier(PROMPT_SYSTEM), checkpointer=False)
 
 #Create order node
 def create_order_agent_node(state: MessagesState) -> Command[Literal["__end__"]]:
@@ -353,4 +418,5 @@ builder.add_node("product_recommendation_agent", product_recommendation_agent_no
 builder.add_node("product_details_agent", product_details_agent_node)
 builder.add_node("product_reviews_agent", product_reviews_agent_node)
 builder.add_node("create_order_agent", create_order_agent_node)
-graph_builder = builder.compile()
\ No newline at end of file
+# The conversation lives in the checkpointer, each turn only sends the new message
+graph_builder = builder.compile(checkpointer=get_checkpointer())
\ No newline at end of file
@@ -0,0 +1,210 @@
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlmodel import Session
+
+import crud
+from database import engine
+from models import Order
+
+# Order persistence of the retail chat. Orders from every session go through one writer thread
+# that groups them in batches: one transaction per batch in the database, or one fsync per batch
+# in the JSONL log when the database is unavailable. The log is replayed into the database later.
+
+# "database" writes to the SQLModel engine and falls back to the log, "jsonl" only writes the log
+ORDER_STORE_BACKEND = os.getenv("ORDER_STORE_BACKEND", "database")
+ORDER_LOG_PATH = os.getenv("ORDER_LOG_PATH", "./retail/orders.jsonl")
+ORDER_STORE_BATCH_SIZE = int(os.getenv("ORDER_STORE_BATCH_SIZE", "100"))
+# How long the writer waits for more orders before writing a batch
+ORDER_STORE_FLUSH_MS = float(os.getenv("ORDER_STORE_FLUSH_MS", "5"))
+
+
+class _PendingOrder:
+    def __init__(self, order: Dict[str, Any]):
+        self.order = order
+        self.done = threading.Event()
+        self.stored_in: Optional[str] = None
+        self.error: Optional[Exception] = None
+
+
+class OrderStore:
+    """Group-commit order writer shared by every chat session of the process."""
+
+    def __init__(
+        self,
+        backend: str = ORDER_STORE_BACKEND,
+        log_path: str = ORDER_LOG_PATH,
+        batch_size: int = ORDER_STORE_BATCH_SIZE,
+        flush_ms: float = ORDER_STORE_FLUSH_MS,
+    ):
+        self.backend = backend
+        self.log_path = log_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self._queue: "queue.Queue[_PendingOrder]" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._writer_lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._metrics = {"orders": 0, "batches": 0, "database_batches": 0, "log_batches": 0, "replayed": 0, "errors": 0}
+
+    def save(self, order: Dict[str, Any], timeout: float = 30) -> str:
+        """
+        Persist an order. Blocks until its batch is durable.
+
+        :param order: order_id, email, product, quantity and total.
+        :return: Where the order was stored: "database" or "log".
+        """
+        self._ensure_writer()
+        pending = _PendingOrder(order)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError(f"Order {order.get('order_id')} was not stored after {timeout}s")
+        if pending.error:
+            raise pending.error
+        return pending.stored_in
+
+    def _ensure_writer(self):
+        with self._writer_lock:
+            # A writer that died is replaced, the orders still queued are written by the new one
+            if self._writer is None or not self._writer.is_alive():
+                if self.backend == "database":
+                    # Orders that went to the log while the database was down. A failed replay keeps
+                    # the log for the next start, it never stops the new orders
+                    try:
+                        self.replay_log()
+                    except Exception as e:
+                        print(f"Error replaying {self.log_path}: {e}")
+                self._writer = threading.Thread(target=self._run, name="order-store-writer", daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                # Never let one batch stop the writer: its orders fail, the next batches are written
+                print(f"Error storing {len(batch)} orders: {e}")
+                with self._lock:
+                    self._metrics["batches"] += 1
+                    self._metrics["errors"] += 1
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.error = e
+                        pending.done.set()
+
+    def _write_batch(self, batch: List[_PendingOrder]):
+        orders = [pending.order for pending in batch]
+        stored_in = None
+        if self.backend == "database":
+            try:
+                self._write_database(orders)
+                stored_in = "database"
+            except Exception as e:
+                # Not only SQLAlchemyError: a bad order or a driver error also goes to the log
+                print(f"Error writing {len(orders)} orders to the database, writing them to {self.log_path}: {e}")
+        error = None
+        if stored_in is None:
+            try:
+                self._write_log(orders)
+                stored_in = "log"
+            except Exception as e:
+                error = e
+        with self._lock:
+            self._metrics["batches"] += 1
+            if error:
+                self._metrics["errors"] += 1
+            else:
+                self._metrics["orders"] += len(orders)
+                self._metrics[f"{stored_in}_batches"] += 1
+        for pending in batch:
+            pending.stored_in = stored_in
+            pending.error = error
+            pending.done.set()
+
+    def _write_database(self, orders: List[Dict[str, Any]]):
+        with Session(engine) as session:
+            crud.create_orders(session, [Order(**self._order_fields(order)) for order in orders])
+
+    def _write_log(self, orders: List[Dict[str, Any]]):
+        with self._log_lock, open(self.log_path, "a") as file:
+            file.write("".join(json.dumps(order) + "\n" for order in orders))
+            file.flush()
+            os.fsync(file.fileno())
+
+    @staticmethod
+    def _order_fields(order: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "order_id": order["order_id"],
+            "email": order["email"],
+            "product": order["product"],
+            "quantity": int(order["quantity"]),
+            "total": float(order["total"]),
+        }
+
+    def replay_log(self) -> int:
+        """
+        Insert the orders of the JSONL log missing in the database and empty the log.
+        Lines that are not a valid order are moved to <log>.rejected instead of blocking the replay.
+        """
+        with self._log_lock:
+            if not os.path.exists(self.log_path):
+                return 0
+            orders, rejected = [], []
+            with open(self.log_path, "r") as file:
+                for line in file:
+                    if not line.strip():
+                        continue
+                    try:
+                        # A crash in the middle of a write leaves a partial last line
+                        order = json.loads(line)
+                        orders.append(Order(**self._order_fields(order)))
+                    except (json.JSONDecodeError, KeyError, ValueError, TypeError) as e:
+                        rejected.append(line if line.endswith("\n") else line + "\n")
+                        print(f"Skipping an invalid line of {self.log_path}: {e!r}")
+            try:
+                with Session(engine) as session:
+                    existing = crud.existing_order_ids(session, [order.order_id for order in orders])
+                    missing = [order for order in orders if order.order_id not in existing]
+                    if missing:
+                        crud.create_orders(session, missing)
+            except SQLAlchemyError as e:
+                print(f"Error replaying {self.log_path}, keeping it for the next start: {e}")
+                return 0
+            if rejected:
+                with open(self.log_path + ".rejected", "a") as file:
+                    file.write("".join(rejected))
+            os.remove(self.log_path)
+        with self._lock:
+            self._metrics["replayed"] += len(missing)
+        print(f"Replayed {len(missing)} orders from {self.log_path}")
+        return len(missing)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics: Dict[str, Any] = dict(self._metrics)
+        metrics["orders_per_batch"] = metrics["orders"] / metrics["batches"] if metrics["batches"] else 0.0
+        metrics["backend"] = self.backend
+        return metrics
+
+
+order_store = OrderStore()
+
+
+def get_order_store_metrics() -> Dict[str, Any]:
+    return order_store.metrics()
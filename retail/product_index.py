@@ -0,0 +1,179 @@
+import json
+import os
+import re
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional, Set
+
+# In-memory index of the catalog to find the products the user names without a vector search.
+# Lookups try an exact alias, then an alias contained in the text, then trigram similarity.
+# lookup_exact only accepts the product name or an alias listed in the catalog, for order pricing.
+
+RETAIL_CATALOG_PATH = os.getenv("RETAIL_CATALOG_PATH", "./retail/catalog.json")
+# Minimum Jaccard similarity between the trigrams of the text and of an alias
+PRODUCT_INDEX_MIN_SIMILARITY = float(os.getenv("PRODUCT_INDEX_MIN_SIMILARITY", "0.5"))
+
+_STOPWORDS = {"the", "a", "an", "car", "model", "please", "el", "la", "de"}
+
+
+def normalize(text: str) -> str:
+    """Lowercase, without accents, punctuation and repeated spaces."""
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii").lower()
+    words = re.sub(r"[^a-z0-9]+", " ", text).split()
+    return " ".join(word for word in words if word not in _STOPWORDS)
+
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[index:index + 3] for index in range(len(padded) - 2)}
+
+
+class ProductIndex:
+    """
+    Index of the catalog products by normalized name and aliases.
+
+    Aliases are the name, the name without the product type, the model codes (words with digits,
+    e.g. "x500") and the "aliases" listed in the catalog, plus the type when a single product has it.
+    Aliases shared by several products are dropped, they can't identify one.
+    """
+
+    def __init__(self, catalog_path: str = RETAIL_CATALOG_PATH, min_similarity: float = PRODUCT_INDEX_MIN_SIMILARITY):
+        self.catalog_path = catalog_path
+        self.min_similarity = min_similarity
+        self.products: Dict[str, Dict[str, Any]] = {}
+        self.aliases: Dict[str, str] = {}
+        # Normalized names and catalog aliases only
+        self.explicit_aliases: Dict[str, str] = {}
+        self._trigram_index: Dict[str, Set[str]] = {}
+        self._alias_trigrams: Dict[str, Set[str]] = {}
+        self._loaded_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._metrics = {"exact_hits": 0, "contained_hits": 0, "fuzzy_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _explicit_aliases(product: Dict[str, Any]) -> List[str]:
+        aliases = [normalize(product["name"]), *[normalize(alias) for alias in product.get("aliases", [])]]
+        return [alias for alias in aliases if alias]
+
+    def _product_aliases(self, product: Dict[str, Any]) -> List[str]:
+        name = normalize(product["name"])
+        product_type = normalize(product.get("type", ""))
+        aliases = self._explicit_aliases(product)
+        if product_type:
+            aliases.append(" ".join(word for word in name.split() if word not in product_type.split()))
+            aliases.append(product_type)
+        aliases.extend(word for word in name.split() if any(char.isdigit() for char in word))
+        return [alias for alias in aliases if alias]
+
+    def load(self, products: Optional[List[Dict[str, Any]]] = None):
+        """(Re)build the index from `products` or from the catalog file."""
+        if products is None:
+            with open(self.catalog_path, "r") as file:
+                products = json.load(file)["products"]
+            mtime = os.path.getmtime(self.catalog_path)
+        else:
+            mtime = None
+        owners: Dict[str, Set[str]] = {}
+        explicit_owners: Dict[str, Set[str]] = {}
+        for product in products:
+            for alias in self._product_aliases(product):
+                owners.setdefault(alias, set()).add(product["product_id"])
+            for alias in self._explicit_aliases(product):
+                explicit_owners.setdefault(alias, set()).add(product["product_id"])
+        aliases = {alias: ids.pop() for alias, ids in owners.items() if len(ids) == 1}
+        explicit_aliases = {alias: ids.pop() for alias, ids in explicit_owners.items() if len(ids) == 1}
+        trigram_index: Dict[str, Set[str]] = {}
+        alias_trigrams = {alias: trigrams(alias) for alias in aliases}
+        for alias, alias_grams in alias_trigrams.items():
+            for gram in alias_grams:
+                trigram_index.setdefault(gram, set()).add(alias)
+        with self._lock:
+            self.products = {product["product_id"]: product for product in products}
+            self.aliases = aliases
+            self.explicit_aliases = explicit_aliases
+            self._alias_trigrams = alias_trigrams
+            self._trigram_index = trigram_index
+            self._loaded_mtime = mtime
+
+    def _ensure_loaded(self):
+        # Reload when the catalog file changes, the check is a stat call
+        try:
+            mtime = os.path.getmtime(self.catalog_path)
+        except OSError:
+            mtime = None
+        if not self.products or (mtime is not None and self._loaded_mtime is not None and mtime != self._loaded_mtime):
+            self.load()
+
+    def _record(self, outcome: str):
+        with self._lock:
+            self._metrics[outcome] += 1
+
+    def lookup(self, text: str) -> Optional[Dict[str, Any]]:
+        """The product named in `text`, None when no product matches with confidence."""
+        self._ensure_loaded()
+        query = normalize(text)
+        if not query:
+            self._record("misses")
+            return None
+
+        product_id = self.aliases.get(query)
+        if product_id:
+            self._record("exact_hits")
+            return self.products[product_id]
+
+        # Longest alias contained in the text as whole words, e.g. "the luxury sedan x500 in black"
+        words = query.split()
+        for size in range(len(words) - 1, 0, -1):
+            found = {self.aliases.get(" ".join(words[start:start + size])) for start in range(len(words) - size + 1)} - {None}
+            if len(found) == 1:
+                self._record("contained_hits")
+                return self.products[found.pop()]
+            if found:
+                # Several products named with the same number of words, the text is ambiguous
+                break
+
+        # Trigram similarity, only aliases sharing at least one trigram are scored
+        query_grams = trigrams(query)
+        candidates = set()
+        for gram in query_grams:
+            candidates.update(self._trigram_index.get(gram, ()))
+        scores: Dict[str, float] = {}
+        for alias in candidates:
+            alias_grams = self._alias_trigrams[alias]
+            similarity = len(query_grams & alias_grams) / len(query_grams | alias_grams)
+            product_id = self.aliases[alias]
+            scores[product_id] = max(scores.get(product_id, 0.0), similarity)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if ranked and ranked[0][1] >= self.min_similarity and (len(ranked) == 1 or ranked[1][1] < ranked[0][1]):
+            self._record("fuzzy_hits")
+            return self.products[ranked[0][0]]
+
+        self._record("misses")
+        return None
+
+    def lookup_exact(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        The product whose name or catalog alias is `text` (case, accents and punctuation aside).
+        No product type, model code, containment or fuzzy match: an order is never priced with a
+        product the user didn't name exactly.
+        """
+        self._ensure_loaded()
+        product_id = self.explicit_aliases.get(normalize(text))
+        self._record("exact_hits" if product_id else "misses")
+        return self.products[product_id] if product_id else None
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics: Dict[str, Any] = dict(self._metrics)
+        lookups = sum(metrics.values())
+        metrics["hit_rate"] = (lookups - metrics["misses"]) / lookups if lookups else 0.0
+        metrics["products"] = len(self.products)
+        metrics["aliases"] = len(self.aliases)
+        return metrics
+
+
+product_index = ProductIndex()
+
+
+def get_product_index_metrics() -> Dict[str, Any]:
+    return product_index.metrics()
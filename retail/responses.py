@@ -0,0 +1,51 @@
+from typing import Any, Dict, List, Optional
+
+# Answers of the retail tools rendered from their structured results, without an LLM call.
+# The tools are return_direct, so these strings are what the user reads.
+
+
+def _price(value: Any) -> str:
+    return f"${float(value):,.2f}"
+
+
+def render_recommendations(products: List[Dict[str, Any]]) -> str:
+    if not products:
+        return "I couldn't find products that match your interests. Could you tell me more about what you are looking for?"
+    lines = ["These are the cars I recommend for you:"]
+    for product in products:
+        lines.append(f"- **{product['name']}** ({product['type']}, {_price(product['price'])}): {product['description']}")
+    return "\n".join(lines)
+
+
+def render_product_details(product_name: str, product: Optional[Dict[str, Any]]) -> str:
+    if not product:
+        return f"I couldn't find a product named {product_name}."
+    return "\n".join([
+        f"**{product['name']}**",
+        f"- Type: {product['type']}",
+        f"- Price: {_price(product['price'])}",
+        f"- Description: {product['description']}",
+    ])
+
+
+def render_reviews(product_name: str, reviews: List[Dict[str, Any]]) -> str:
+    if not reviews:
+        return f"I couldn't find reviews for {product_name}."
+    lines = [f"This is what our customers say about the {reviews[0].get('product_name', product_name)}:"]
+    for review in reviews:
+        lines.append(f"- {review['rating']}/5 from {review['customer_id']}: \"{review['comment']}\"")
+    return "\n".join(lines)
+
+
+def render_order(order: Dict[str, Any]) -> str:
+    status = order["status"]
+    if status == "created":
+        return (
+            f"Your order has been created. {order['quantity']} x {order['product']} for {order['email']}, "
+            f"total price {_price(order['total'])}. Order id: {order['order_id']}."
+        )
+    if status == "product_not_found":
+        return f"The order has not been created because the product {order['product']} was not found."
+    if status == "invalid_quantity":
+        return f"The order has not been created because the quantity {order['quantity']} is not valid. Please give a whole number of units, e.g. 2."
+    return "To create the order I need your email, the product name and the quantity."
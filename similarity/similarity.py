@@ -1,11 +1,10 @@
-import chromadb
 from typing import List
 import streamlit as st
 from llm_utils import call_llm
+from vector_ingest import ingest_documents
+from vector_store import get_collection, query_collection
 import json
 
-client = chromadb.PersistentClient(path="/chromadb")
-
 table_a = [
     {"id": "1", "text": "angie z"},
     {"id": "2", "text": "juliana Paola"},
@@ -19,20 +18,13 @@ table_b = [
 ]
 
 if st.button("Save data tables"):
-    try:
-        collection = client.get_collection(name="similarity_collection")
-    except Exception as e:
-        collection = client.create_collection(name="similarity_collection")
-
-    for table in table_a:
-        collection.add(documents=[table["text"]], ids=[table["id"]])
+    collection = get_collection("similarity_collection")
 
-    for table in table_b:
-        collection.add(documents=[table["text"]], ids=[table["id"]])
+    rows = table_a + table_b
+    ingest_documents(collection, documents=[row["text"] for row in rows], ids=[row["id"] for row in rows])
     
 def similarity_search(query: str, collection_name: str, k: int = 5, threshold: float = 0.85) -> List[str]:
-    collection = client.get_collection(name=collection_name)
-    results = collection.query(query_texts=[query], n_results=k, include=["documents", "distances"])
+    results = query_collection(collection_name, query_texts=[query], n_results=k, include=["documents", "distances"])
     final_results = []
     for index, result in enumerate(results["distances"][0]):
         if result <= threshold:
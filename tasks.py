@@ -1,13 +1,186 @@
+import asyncio
+import os
+import sys
+import uuid
+from contextlib import contextmanager
 from celery import Celery
-from celery import shared_task
-from llm_utils import call_llm
+from celery import chord, shared_task
+from celery.utils.time import get_exponential_backoff_interval
+from botocore.exceptions import ClientError
+from llm_utils import call_llm, acall_llm, call_llm_to_generate_image
+from utils import upload_file_to_s3
+
+_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# The edtech modules import each other by name, like when Streamlit runs the page
+sys.path.append(os.path.join(_DIRECTORY, "edtech"))
+
+# Broker and result backend, docker-compose points both to the redis service
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379")
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
+# Seconds the results of the jobs are kept in the backend
+CELERY_RESULT_EXPIRES = int(os.getenv("CELERY_RESULT_EXPIRES", str(7 * 24 * 3600)))
+# Retries of a call throttled by Bedrock, waiting up to LLM_TASK_RETRY_BACKOFF * 2^retry seconds (full jitter)
+LLM_TASK_MAX_RETRIES = int(os.getenv("LLM_TASK_MAX_RETRIES", "8"))
+LLM_TASK_RETRY_BACKOFF = int(os.getenv("LLM_TASK_RETRY_BACKOFF", "1"))
+LLM_TASK_RETRY_BACKOFF_MAX = int(os.getenv("LLM_TASK_RETRY_BACKOFF_MAX", "120"))
+# Prompts per task of bulk_generate, generated concurrently inside the task
+LLM_BULK_CHUNK_SIZE = int(os.getenv("LLM_BULK_CHUNK_SIZE", "20"))
+
+# Videos of the jobs, one file per job. In docker-compose the API and the worker share the folder
+VIDEO_OUTPUT_DIR = os.getenv("VIDEO_OUTPUT_DIR", os.path.join(_DIRECTORY, "edtech", "videos"))
+# When set the videos are uploaded to s3://VIDEO_BUCKET/videos/<job id>.mp4 and removed locally
+VIDEO_BUCKET = os.getenv("VIDEO_BUCKET", "")
+
+# Bedrock error codes worth retrying later
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailableException", "ModelNotReadyException"}
+
 app = Celery('shared_task')
-app.conf.broker_url = "redis://localhost:6379"
-app.conf.result_backend = "redis://localhost:6379"
+# Also the app of the other threads (e.g. the FastAPI thread pool), shared_task resolves the app per thread
+app.set_default()
+app.conf.update(
+    broker_url=CELERY_BROKER_URL,
+    result_backend=CELERY_RESULT_BACKEND,
+    result_expires=CELERY_RESULT_EXPIRES,
+    # The task name and arguments are stored with the result, an answer can be traced to its prompt
+    result_extended=True,
+    task_track_started=True,
+    # A task lost with its worker is delivered again. The image and video workers of
+    # docker-compose also run with --prefetch-multiplier=1, they only reserve the task they run
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # One queue per kind of job, a burst of videos or images never delays the text jobs
+    task_default_queue="text",
+    task_routes={
+        "tasks.generate_image": {"queue": "image"},
+        "tasks.generate_educational_video": {"queue": "video"},
+    },
+)
 
 
-@shared_task
+class BedrockThrottlingError(Exception):
+    """Bedrock refused the call for quota or capacity, it can be retried later."""
+
+
+def is_throttling_error(error: BaseException) -> bool:
+    return isinstance(error, BedrockThrottlingError) or (
+        isinstance(error, ClientError) and error.response.get("Error", {}).get("Code") in THROTTLING_ERROR_CODES
+    )
+
+
+@contextmanager
+def throttling_as_retryable():
+    """Raise the throttling errors of Bedrock as BedrockThrottlingError, the tasks autoretry on it."""
+    try:
+        yield
+    except ClientError as e:
+        if is_throttling_error(e):
+            raise BedrockThrottlingError(str(e)) from e
+        raise
+
+
+def retry_countdown(retries: int) -> int:
+    """Exponential backoff with full jitter, like autoretry_for with retry_backoff."""
+    return get_exponential_backoff_interval(LLM_TASK_RETRY_BACKOFF, retries, LLM_TASK_RETRY_BACKOFF_MAX, full_jitter=True)
+
+
+# Options of the tasks calling Bedrock once
+_RETRY_ON_THROTTLING = {
+    "autoretry_for": (BedrockThrottlingError,),
+    "retry_backoff": LLM_TASK_RETRY_BACKOFF,
+    "retry_backoff_max": LLM_TASK_RETRY_BACKOFF_MAX,
+    "retry_jitter": True,
+    "max_retries": LLM_TASK_MAX_RETRIES,
+}
+
+
+@shared_task(**_RETRY_ON_THROTTLING)
 def generate_personalized_data(prompt):
-    # Generate the data in background using LLM and Celery
-    data = call_llm(prompt)
-    print(data)
\ No newline at end of file
+    # Generate the data in background using LLM and Celery, the answer is kept in the result backend
+    with throttling_as_retryable():
+        return call_llm(prompt)
+
+
+async def _generate_all(prompts):
+    return await asyncio.gather(*(acall_llm(prompt) for prompt in prompts), return_exceptions=True)
+
+@shared_task(bind=True, max_retries=LLM_TASK_MAX_RETRIES)
+def generate_batch_data(self, prompts, results=None):
+    """
+    Generate all the prompts concurrently in the same worker, bounded by LLM_MAX_CONCURRENCY.
+    When Bedrock throttles some of them the task is retried with backoff, the answers already
+    generated go with the retry and are not generated again.
+
+    :param results: Answers of the previous attempt, None for the prompts still pending.
+    :return: The answers, in the order of the prompts.
+    """
+    results = list(results or [None] * len(prompts))
+    pending = [index for index, answer in enumerate(results) if answer is None]
+    throttled = None
+    for index, answer in zip(pending, asyncio.run(_generate_all([prompts[index] for index in pending]))):
+        if not isinstance(answer, BaseException):
+            results[index] = answer
+        elif is_throttling_error(answer):
+            throttled = answer
+        else:
+            raise answer
+    if throttled is not None:
+        raise self.retry(exc=throttled, args=(prompts,), kwargs={"results": results}, countdown=retry_countdown(self.request.retries))
+    return results
+
+
+@shared_task
+def collect_batch_results(chunk_results):
+    """Chord callback of bulk_generate: the answers of every chunk, in the order of the prompts."""
+    return [answer for chunk in chunk_results for answer in chunk]
+
+
+def bulk_generate(prompts, chunk_size=LLM_BULK_CHUNK_SIZE):
+    """
+    Fan out a list of prompts: the prompts are split in chunks, the chunks run in parallel on the
+    text workers (group) and a chord joins their answers.
+
+    :return: AsyncResult of the answers, in the order of the prompts.
+    """
+    chunk_size = max(1, chunk_size)
+    chunks = [prompts[start:start + chunk_size] for start in range(0, len(prompts), chunk_size)]
+    if not chunks:
+        return collect_batch_results.delay([])
+    return chord(generate_batch_data.s(chunk) for chunk in chunks)(collect_batch_results.s())
+
+
+@shared_task(**_RETRY_ON_THROTTLING)
+def generate_image(prompt, seed=42):
+    """Base64 PNG generated by Nova Canvas, on the image queue."""
+    with throttling_as_retryable():
+        return call_llm_to_generate_image(prompt, seed=seed)
+
+
+@shared_task(bind=True)
+def generate_educational_video(self, prompt, age_group):
+    """
+    Script, images, voice-overs and render of an educational video. The stage is published
+    as the PROGRESS state of the task: {"stage", "done", "total"}.
+
+    :return: {"path": local file} or {"url": S3 URL} when VIDEO_BUCKET is set.
+    """
+    # Imported here, the API and the text workers don't load moviepy
+    from video_pipeline import generate_video
+
+    job_id = self.request.id
+
+    def progress(stage, done, total):
+        if job_id:
+            self.update_state(state="PROGRESS", meta={"stage": stage, "done": done, "total": total})
+
+    os.makedirs(VIDEO_OUTPUT_DIR, exist_ok=True)
+    output_path = os.path.join(VIDEO_OUTPUT_DIR, f"{job_id or uuid.uuid4()}.mp4")
+    generate_video(prompt, age_group, output_path, progress=progress)
+    if not VIDEO_BUCKET:
+        return {"path": output_path}
+
+    progress("upload", 0, 1)
+    url = upload_file_to_s3(output_path, VIDEO_BUCKET, f"videos/{os.path.basename(output_path)}")
+    if url is None:
+        raise RuntimeError(f"The video could not be uploaded to {VIDEO_BUCKET}, it is kept at {output_path}")
+    os.remove(output_path)
+    return {"url": url}
@@ -25,4 +25,21 @@ def upload_file_to_s3(file_name, bucket, object_name=None):
         return None
     except ClientError as e:
         print(f"Failed to upload {file_name} to {bucket}/{object_name}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def download_file_from_s3(bucket, object_name, file_name):
+    # Create an S3 client
+    s3_client = boto3.client('s3')
+
+    try:
+        # Download the file, same bucket/object_name layout as upload_file_to_s3
+        s3_client.download_file(bucket, object_name, file_name)
+        return True
+    except NoCredentialsError:
+        print("Credentials not available.")
+        return False
+    except ClientError as e:
+        # 404 when the object doesn't exist
+        if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey"):
+            print(f"Failed to download {bucket}/{object_name}: {e}")
+        return False
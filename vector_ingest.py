@@ -0,0 +1,200 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from embedding_cache import get_embedding_function
+
+INGEST_BATCH_SIZE = 256
+INGEST_MAX_WORKERS = 4
+# Manifests of what was ingested in each collection, by source, next to the Chroma store by default
+INGEST_MANIFEST_DIR = os.getenv("INGEST_MANIFEST_DIR", os.path.join(os.getenv("CHROMA_PATH", "/chromadb"), "ingest_manifests"))
+
+
+def get_default_embedding_function():
+    # Chroma's default model behind the shared embedding cache
+    return get_embedding_function()
+
+
+def _batches(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def ingest_documents(
+    collection,
+    documents: List[str],
+    ids: List[str],
+    metadatas: Optional[List[Dict[str, Any]]] = None,
+    embedding_function=None,
+    batch_size: int = INGEST_BATCH_SIZE,
+    max_workers: int = INGEST_MAX_WORKERS,
+) -> Dict[str, float]:
+    """
+    Embed documents in large batches using a thread pool and upsert them into a Chroma collection.
+
+    The ids must be deterministic (e.g. the product id), so loading the same data again
+    updates the rows instead of duplicating them.
+
+    :param collection: The Chroma collection.
+    :param documents: The documents to store.
+    :param ids: One deterministic id per document.
+    :param metadatas: Optional metadata per document.
+    :param embedding_function: Defaults to the embedding function Chroma uses by default.
+    :param batch_size: Documents embedded and written per batch.
+    :param max_workers: Batches embedded in parallel.
+    :return: Number of documents, elapsed seconds and documents per second.
+    """
+    if len(documents) != len(ids):
+        raise ValueError("documents and ids must have the same length")
+    if len(set(ids)) != len(ids):
+        raise ValueError("ids must be unique")
+    embedding_function = embedding_function or get_default_embedding_function()
+    start = time.perf_counter()
+
+    document_batches = _batches(documents, batch_size)
+    id_batches = _batches(ids, batch_size)
+    metadata_batches = _batches(metadatas, batch_size) if metadatas else [None] * len(document_batches)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Embeddings are computed in parallel, writes happen in order as each batch is ready
+        embedding_batches = executor.map(embedding_function, document_batches)
+        for index, embeddings in enumerate(embedding_batches):
+            collection.upsert(
+                ids=id_batches[index],
+                embeddings=embeddings,
+                documents=document_batches[index],
+                metadatas=metadata_batches[index]
+            )
+            print(f"Upserted batch {index + 1} of {len(document_batches)} into {collection.name}")
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "documents": len(documents),
+        "seconds": elapsed,
+        "docs_per_sec": len(documents) / elapsed if elapsed else 0.0,
+    }
+    print(f"Ingested {stats['documents']} documents into {collection.name} in {elapsed:.2f}s ({stats['docs_per_sec']:.1f} docs/sec)")
+    return stats
+
+
+def content_id(document: str, metadata: Optional[Dict[str, Any]] = None) -> str:
+    """Deterministic id of a document: the sha256 of its text and metadata."""
+    payload = json.dumps({"document": document, "metadata": metadata or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _manifest_path(collection_name: str) -> str:
+    return os.path.join(INGEST_MANIFEST_DIR, f"{collection_name}.json")
+
+
+def load_manifest(collection_name: str, collection_id: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Ids ingested in a collection, by source.
+
+    :param collection_id: The id of the Chroma collection. A manifest written for another collection
+        of the same name (another store, or the collection dropped and created again) is ignored.
+    """
+    path = _manifest_path(collection_name)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as file:
+        manifest = json.load(file)
+    if "sources" not in manifest:
+        # Manifest without a collection id, written before they were recorded
+        return manifest if collection_id is None else {}
+    if collection_id is not None and manifest.get("collection_id") != collection_id:
+        return {}
+    return manifest["sources"]
+
+
+def save_manifest(collection_name: str, manifest: Dict[str, List[str]], collection_id: Optional[str] = None):
+    os.makedirs(INGEST_MANIFEST_DIR, exist_ok=True)
+    path = _manifest_path(collection_name)
+    # Write to a temporary file first so an interrupted write never leaves a broken manifest
+    with open(path + ".tmp", "w") as file:
+        json.dump({"collection_id": collection_id, "sources": manifest}, file)
+    os.replace(path + ".tmp", path)
+
+
+def delete_manifest(collection_name: str):
+    """Forget what was ingested, call it when the collection is deleted."""
+    path = _manifest_path(collection_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def sync_documents(
+    collection,
+    documents: List[str],
+    metadatas: Optional[List[Dict[str, Any]]] = None,
+    source: str = "default",
+    embedding_function=None,
+    batch_size: int = INGEST_BATCH_SIZE,
+    max_workers: int = INGEST_MAX_WORKERS,
+) -> Dict[str, float]:
+    """
+    Make the documents of `source` in the collection match `documents`, embedding only what changed.
+
+    Each document gets a content-hash id. Documents missing in the collection are embedded and
+    upserted, and documents of the previous load (the manifest) that are gone are deleted, so a
+    reload only embeds the changes. Identical documents are stored once.
+
+    :param collection: The Chroma collection.
+    :param documents: The full, current list of documents of the source.
+    :param metadatas: Optional metadata per document, part of the content hash.
+    :param source: Name of the data source (e.g. the file), a collection can hold several.
+    :return: Documents added, deleted and unchanged, elapsed seconds and documents per second.
+    """
+    start = time.perf_counter()
+    metadatas = metadatas or [None] * len(documents)
+    current = {}
+    for document, metadata in zip(documents, metadatas):
+        current.setdefault(content_id(document, metadata), (document, metadata))
+
+    collection_id = str(collection.id)
+    manifest = load_manifest(collection.name, collection_id)
+    if source in manifest:
+        previous = set(manifest[source])
+    elif not manifest:
+        # First sync of a collection loaded before manifests existed: replace whatever it holds
+        previous = set(collection.get(include=[])["ids"])
+    else:
+        previous = set()
+
+    # The manifest can be behind or ahead of the collection (an interrupted sync, rows deleted outside
+    # delete_collection), only the ids actually stored are skipped. Looking them up embeds nothing
+    stored = set()
+    for ids_batch in _batches(list(current), batch_size):
+        stored.update(collection.get(ids=ids_batch, include=[])["ids"])
+    new_ids = [document_id for document_id in current if document_id not in stored]
+    deleted_ids = sorted(previous - set(current))
+
+    if new_ids:
+        ingest_documents(
+            collection,
+            documents=[current[document_id][0] for document_id in new_ids],
+            ids=new_ids,
+            metadatas=[current[document_id][1] for document_id in new_ids] if any(metadatas) else None,
+            embedding_function=embedding_function,
+            batch_size=batch_size,
+            max_workers=max_workers
+        )
+    for ids_batch in _batches(deleted_ids, batch_size):
+        collection.delete(ids=ids_batch)
+
+    manifest[source] = sorted(current)
+    save_manifest(collection.name, manifest, collection_id)
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "documents": len(current),
+        "added": len(new_ids),
+        "deleted": len(deleted_ids),
+        "unchanged": len(current) - len(new_ids),
+        "seconds": elapsed,
+        "docs_per_sec": len(new_ids) / elapsed if elapsed else 0.0,
+    }
+    print(f"Synced {collection.name}/{source}: {stats['added']} added, {stats['deleted']} deleted, {stats['unchanged']} unchanged in {elapsed:.2f}s")
+    return stats
@@ -0,0 +1,112 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+import chromadb
+
+from embedding_cache import get_embedding_function
+from vector_ingest import delete_manifest
+
+# Process-wide Chroma registry: the client is opened once and collection handles are cached,
+# so tools don't pay a get_collection/create_collection round-trip on every call.
+CHROMA_PATH = os.getenv("CHROMA_PATH", "/chromadb")
+
+COLLECTIONS = [
+    "collection_catalog",
+    "collection_reviews",
+    "collection_credit_document",
+    "collection_fintech",
+    "collection_restaurant",
+    "similarity_collection",
+]
+
+_client = None
+_collections: Dict[str, Any] = {}
+_lock = threading.Lock()
+_timings: Dict[str, Dict[str, float]] = {}
+_timings_lock = threading.Lock()
+
+
+def get_client():
+    """The shared PersistentClient."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = chromadb.PersistentClient(path=CHROMA_PATH)
+        return _client
+
+
+def get_collection(name: str):
+    """Cached handle of a collection, created with the shared embedding function if it doesn't exist."""
+    collection = _collections.get(name)
+    if collection is not None:
+        return collection
+    client = get_client()
+    with timed("get_collection"):
+        collection = client.get_or_create_collection(name=name, embedding_function=get_embedding_function())
+    with _lock:
+        return _collections.setdefault(name, collection)
+
+
+def delete_collection(name: str):
+    """Delete a collection, its cached handle and its ingestion manifest."""
+    with _lock:
+        _collections.pop(name, None)
+    with timed("delete_collection"):
+        get_client().delete_collection(name=name)
+    delete_manifest(name)
+
+
+def warm_collections(names: Optional[Iterable[str]] = None):
+    """Open the collections and load the embedding model, so the first user request doesn't pay for it."""
+    for name in names or COLLECTIONS:
+        get_collection(name)
+    with timed("warm_embedding_model"):
+        get_embedding_function()(["warm up"])
+
+
+@contextmanager
+def timed(operation: str):
+    """Record the duration of a vector store operation."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _timings_lock:
+            timing = _timings.setdefault(operation, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            timing["count"] += 1
+            timing["total_seconds"] += elapsed
+            timing["max_seconds"] = max(timing["max_seconds"], elapsed)
+
+
+def query_collection(name: str, **kwargs) -> Dict[str, Any]:
+    """collection.query on a cached handle, timed under '<name>.query'."""
+    collection = get_collection(name)
+    with timed(f"{name}.query"):
+        return collection.query(**kwargs)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Merge several rankings of ids into one: each id scores the sum of 1 / (k + rank) over the rankings.
+
+    :param rankings: One list of ids per query, best first.
+    :param k: Smoothing constant, 60 is the usual value.
+    :return: The distinct ids, best first.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1 / (k + rank)
+    return sorted(scores, key=lambda item_id: scores[item_id], reverse=True)
+
+
+def get_vector_store_metrics() -> Dict[str, Dict[str, float]]:
+    with _timings_lock:
+        metrics = {operation: dict(timing) for operation, timing in _timings.items()}
+    for timing in metrics.values():
+        timing["avg_seconds"] = timing["total_seconds"] / timing["count"] if timing["count"] else 0.0
+    return metrics
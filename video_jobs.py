@@ -0,0 +1,42 @@
+from typing import Any, Dict
+
+from celery.result import AsyncResult
+
+from tasks import app, generate_educational_video
+
+# Educational video jobs: submitted to the Celery workers and polled by the API and the
+# Streamlit page. The state of a job is kept in the Celery result backend.
+
+# Share of the job done when each stage starts, and its share of the whole job
+_STAGE_PROGRESS = {
+    "script": (0.0, 0.1),
+    "scenes": (0.1, 0.4),
+    "segments": (0.5, 0.4),
+    "concat": (0.9, 0.05),
+    "upload": (0.95, 0.05),
+}
+
+
+def submit_video_job(prompt: str, age_group: str) -> str:
+    """Queue the generation of a video. :return: The job id."""
+    return generate_educational_video.delay(prompt, age_group).id
+
+
+def get_video_job(job_id: str) -> Dict[str, Any]:
+    """
+    Status of a job: PENDING (queued or unknown id), PROGRESS, SUCCESS, FAILURE or REVOKED.
+
+    :return: id, status, stage, progress (0 to 1), and the result (path or url) or the error.
+    """
+    result = AsyncResult(job_id, app=app)
+    job: Dict[str, Any] = {"id": job_id, "status": result.state, "stage": None, "progress": 0.0}
+    if result.state == "PROGRESS":
+        info = result.info or {}
+        start, share = _STAGE_PROGRESS.get(info.get("stage"), (0.0, 0.0))
+        done = info.get("done", 0) / info["total"] if info.get("total") else 0.0
+        job.update(stage=info.get("stage"), progress=round(start + share * done, 3))
+    elif result.state == "SUCCESS":
+        job.update(progress=1.0, result=result.result)
+    elif result.state == "FAILURE":
+        job["error"] = str(result.result)
+    return job